@@ -0,0 +1,209 @@
+# batch.py
+# Directory-scale ingestion: extract + decode many .ts recordings across a
+# bounded process pool (one decoder / JVM per worker). Each recording gets
+# an output directory named after its content hash, and a manifest of
+# completed files lets an interrupted run resume where it stopped.
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from cache import sha256_file
+from decode import JmisbDecoder
+from extract_decode import extract_klv
+from fast_decode import FastKlvDecoder
+from output import write_decoded
+
+MANIFEST_FILE = "manifest.ndjson"
+DIGEST_PREFIX = 12
+
+_worker_decoder = None
+
+
+# ---------------- Worker ----------------
+def _init_worker(jars, fast):
+    global _worker_decoder
+    _worker_decoder = JmisbDecoder(jars)
+    if fast:
+        _worker_decoder = FastKlvDecoder(fallback=_worker_decoder)
+    _worker_decoder.start_jvm()
+
+
+def _process_file(ts_path, output_root, demuxer, streaming):
+    t0 = time.perf_counter()
+    digest = sha256_file(ts_path)
+    output_dir = Path(output_root) / f"{Path(ts_path).stem}-{digest[:DIGEST_PREFIX]}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    t1 = time.perf_counter()
+    klv_path = output_dir / "metadata.klv"
+    extract_klv(ts_path, klv_path, demuxer)
+
+    t2 = time.perf_counter()
+    output = write_decoded(_worker_decoder, klv_path, output_dir, streaming=streaming)
+    t3 = time.perf_counter()
+
+    return {
+        "sha256": digest,
+        "output_dir": str(output_dir),
+        "output": output,
+        "klv_bytes": klv_path.stat().st_size,
+        "hash_s": t1 - t0,
+        "extract_s": t2 - t1,
+        "decode_s": t3 - t2,
+    }
+
+
+# ---------------- Inputs + manifest ----------------
+def discover_inputs(source):
+    """A directory (searched recursively), a glob pattern or a single file."""
+    path = Path(source)
+    if path.is_dir():
+        return sorted(str(p) for p in path.rglob("*.ts"))
+    if path.is_file():
+        return [str(path)]
+    return sorted(glob.glob(source, recursive=True))
+
+
+def _stamp(ts_path):
+    st = os.stat(ts_path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def load_manifest(output_root):
+    """{ts_path: entry} of the last recorded outcome per input."""
+    entries = {}
+    path = Path(output_root) / MANIFEST_FILE
+    if path.exists():
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["ts_path"]] = entry
+    return entries
+
+
+def _is_done(entry, ts_path):
+    return (
+        entry is not None
+        and entry["status"] == "done"
+        and entry["stamp"] == _stamp(ts_path)
+        and Path(entry["output"]).exists()
+    )
+
+
+class _ManifestWriter:
+    """Appends one line per finished file; each line is flushed to disk."""
+
+    def __init__(self, output_root):
+        self._file = open(Path(output_root) / MANIFEST_FILE, "a")
+
+    def write(self, entry):
+        self._file.write(json.dumps(entry))
+        self._file.write("\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+# ---------------- Batch run ----------------
+def run_batch(source, jars, output_root, workers=None, fast=False,
+              demuxer="ffmpeg", streaming=True):
+    """
+    Extract and decode every .ts under `source` into output_root.
+
+    Files already recorded as done in the manifest (same size and mtime,
+    output still present) are skipped. Returns a summary dict.
+    """
+    output_root = Path(output_root)
+    output_root.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count()
+
+    inputs = [str(Path(p).resolve()) for p in discover_inputs(source)]
+    manifest = load_manifest(output_root)
+    pending = [p for p in inputs if not _is_done(manifest.get(p), p)]
+    print(f"📂 {len(inputs)} recordings, {len(inputs) - len(pending)} already done, "
+          f"{len(pending)} to process on {workers} workers")
+
+    done = failed = 0
+    total_bytes = 0
+    started = time.perf_counter()
+    writer = _ManifestWriter(output_root)
+    ctx = multiprocessing.get_context("spawn")
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(jars, fast),
+        ) as pool:
+            futures = {
+                pool.submit(_process_file, p, str(output_root), demuxer, streaming): p
+                for p in pending
+            }
+            for future in as_completed(futures):
+                ts_path = futures[future]
+                entry = {"ts_path": ts_path, "stamp": _stamp(ts_path)}
+                try:
+                    entry.update(future.result(), status="done")
+                except Exception as exc:
+                    entry.update(status="failed", error=repr(exc))
+                    failed += 1
+                    print(f"❌ {Path(ts_path).name}: {exc!r}")
+                else:
+                    done += 1
+                    size = os.path.getsize(ts_path)
+                    total_bytes += size
+                    print(
+                        f"✔ {Path(ts_path).name}: {size / 1e6:.1f} MB, "
+                        f"extract {entry['extract_s']:.2f}s, decode {entry['decode_s']:.2f}s"
+                    )
+                writer.write(entry)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "files_total": len(inputs),
+        "files_skipped": len(inputs) - len(pending),
+        "files_done": done,
+        "files_failed": failed,
+        "wall_s": elapsed,
+        "files_per_s": done / elapsed if elapsed else 0.0,
+        "mb_per_s": total_bytes / 1e6 / elapsed if elapsed else 0.0,
+    }
+    print(
+        f"🎉 {done} done, {failed} failed, {summary['files_skipped']} skipped in "
+        f"{elapsed:.1f}s ({summary['files_per_s']:.2f} files/s, {summary['mb_per_s']:.1f} MB/s)"
+    )
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch KLV extraction + decoding")
+    parser.add_argument("--input", required=True, help="directory, glob or .ts file")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--jars", nargs="+", required=True)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--fast", action="store_true")
+    parser.add_argument("--demuxer", default="ffmpeg", choices=("ffmpeg", "builtin"))
+    parser.add_argument("--json", action="store_true",
+                        help="write decoded_metadata.json instead of NDJSON")
+    args = parser.parse_args()
+
+    run_batch(
+        args.input,
+        args.jars,
+        args.output,
+        workers=args.workers,
+        fast=args.fast,
+        demuxer=args.demuxer,
+        streaming=not args.json,
+    )
@@ -0,0 +1,228 @@
+# benchmark.py
+# Reproducible benchmark suite on synthetic inputs (synthetic.py).
+# Every benchmark runs in a fresh spawned process so peak RSS is its own
+# and each JVM starts clean. Results are compared with a stored baseline
+# and the run fails when a metric regresses past the tolerance.
+import argparse
+import json
+import multiprocessing
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from synthetic import UAS, UAS_VMTI, VMTI, write_klv, write_ts
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+DEFAULT_DATA_DIR = ".bench_data"
+DEFAULT_TOLERANCE = 0.2
+
+# Metrics where a larger value is a regression; everything else is a rate
+LOWER_IS_BETTER = ("peak_rss_mb", "latency_p50_ms", "latency_p95_ms")
+
+# Synthetic KLV inputs: name -> synthetic.generate_packets options
+KLV_CASES = {
+    "standalone_vmti": dict(kind=VMTI, targets=4),
+    "uas": dict(kind=UAS),
+    "uas_embedded_vmti": dict(kind=UAS_VMTI, targets=4),
+    "uas_many_targets": dict(kind=UAS_VMTI, targets=64),
+    # Tags the native decoder leaves to jMISB (security set, MIIS ID, VMTI series)
+    "uas_jmisb_tags": dict(kind=UAS_VMTI, targets=4, extra_tags=True),
+}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+# ---------------- Benchmarks (run in a child process) ----------------
+def bench_jmisb(klv_path, jars):
+    from decode import JmisbDecoder
+
+    decoder = JmisbDecoder(jars)
+    decoder.start_jvm()
+    t0 = time.perf_counter()
+    result = decoder.decode_file(klv_path)
+    elapsed = time.perf_counter() - t0
+    return _decode_metrics(klv_path, result["total_packets"], elapsed)
+
+
+def bench_fast(klv_path, jars=None):
+    from fast_decode import FastKlvDecoder
+
+    t0 = time.perf_counter()
+    result = FastKlvDecoder().decode_file(klv_path)
+    elapsed = time.perf_counter() - t0
+    return _decode_metrics(klv_path, result["total_packets"], elapsed)
+
+
+def bench_fast_fallback(klv_path, jars):
+    """FastKlvDecoder as the steps run it with fast=True: jMISB for the rest."""
+    from decode import JmisbDecoder
+    from fast_decode import FastKlvDecoder
+
+    decoder = FastKlvDecoder(fallback=JmisbDecoder(jars))
+    decoder.fallback.start_jvm()
+    t0 = time.perf_counter()
+    result = decoder.decode_file(klv_path)
+    elapsed = time.perf_counter() - t0
+    return _decode_metrics(klv_path, result["total_packets"], elapsed)
+
+
+def bench_demux(ts_path, jars=None):
+    from ts_demux import TsDemuxer
+
+    t0 = time.perf_counter()
+    with TsDemuxer(ts_path) as demux:
+        count = sum(1 for _ in demux.iter_klv())
+    elapsed = time.perf_counter() - t0
+    return _decode_metrics(ts_path, count, elapsed)
+
+
+def bench_tracker(ts_path, jars=None, backend="eager"):
+    from global_tracking import ObjectTracker
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tracker = ObjectTracker(ts_path, str(Path(tmp) / "out.mp4"), headless=True, backend=backend)
+        tracker.load_model()
+        tracker.setup_stream()
+        tracker.setup_tracking()
+        t0 = time.perf_counter()
+        tracker.run()
+        elapsed = time.perf_counter() - t0
+
+    stats = tracker.stats()
+    return {
+        "frames_per_s": stats["frames_processed"] / elapsed,
+        "latency_p50_ms": stats["latency_p50_ms"],
+        "latency_p95_ms": stats["latency_p95_ms"],
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _decode_metrics(path, packets, elapsed):
+    size = Path(path).stat().st_size
+    return {
+        "packets_per_s": packets / elapsed,
+        "mb_per_s": size / elapsed / 1e6,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _run_isolated(fn, *args):
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(fn, *args).result()
+
+
+# ---------------- Inputs ----------------
+def prepare_inputs(data_dir, packets, frames):
+    """Generate (or reuse) the synthetic inputs. Returns {name: path}."""
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    inputs = {}
+
+    for name, options in KLV_CASES.items():
+        path = data_dir / f"{name}_{packets}.klv"
+        if not path.exists():
+            write_klv(path, packets, **options)
+        inputs[name] = path
+
+    ts_path = data_dir / f"klv_only_{packets}.ts"
+    if not ts_path.exists():
+        write_ts(ts_path, packets, kind=UAS_VMTI)
+    inputs["ts"] = ts_path
+
+    if shutil.which("ffmpeg"):
+        video_path = data_dir / f"video_{frames}.ts"
+        if not video_path.exists():
+            write_ts(video_path, frames, video=True, width=640, height=360, kind=UAS_VMTI)
+        inputs["video"] = video_path
+
+    return inputs
+
+
+def run_suite(jars=None, packets=20000, frames=150, data_dir=DEFAULT_DATA_DIR,
+              only=None, backend="eager"):
+    inputs = prepare_inputs(data_dir, packets, frames)
+
+    cases = []
+    for name in KLV_CASES:
+        cases.append((f"fast_decode/{name}", bench_fast, inputs[name]))
+        if jars:
+            cases.append((f"jmisb_decode/{name}", bench_jmisb, inputs[name]))
+            cases.append((f"fast_fallback_decode/{name}", bench_fast_fallback, inputs[name]))
+    cases.append(("ts_demux/uas_embedded_vmti", bench_demux, inputs["ts"]))
+    if "video" in inputs:
+        cases.append((f"tracker/{backend}", bench_tracker, inputs["video"]))
+
+    results = {}
+    for name, fn, path in cases:
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        args = (str(path), jars) + ((backend,) if fn is bench_tracker else ())
+        results[name] = _run_isolated(fn, *args)
+        print(f"📊 {name}: " + ", ".join(f"{k}={v:.2f}" for k, v in results[name].items() if v is not None))
+
+    for name in KLV_CASES:
+        jmisb = results.get(f"jmisb_decode/{name}")
+        fast = results.get(f"fast_fallback_decode/{name}")
+        if jmisb and fast:
+            speedup = fast["packets_per_s"] / jmisb["packets_per_s"]
+            print(f"🚀 {name}: fast + jMISB fallback is {speedup:.1f}x jMISB")
+    return results
+
+
+# ---------------- Baseline ----------------
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return a list of regression messages (empty when within tolerance)."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(name, {}).get(metric)
+            if base is None or value is None or not base:
+                continue
+            if metric in LOWER_IS_BETTER:
+                change = (value - base) / base
+            else:
+                change = (base - value) / base
+            if change > tolerance:
+                regressions.append(f"{name} {metric}: {value:.2f} vs baseline {base:.2f} ({change:+.0%} worse)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="KLV decode / tracking benchmarks")
+    parser.add_argument("--jars", nargs="*", default=None)
+    parser.add_argument("--packets", type=int, default=20000)
+    parser.add_argument("--frames", type=int, default=150)
+    parser.add_argument("--only", nargs="*", default=None, help="benchmark name prefixes")
+    parser.add_argument("--backend", default="eager")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = run_suite(args.jars, args.packets, args.frames, args.data_dir, args.only, args.backend)
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"✔ Baseline saved to {baseline_path}")
+    elif baseline_path.exists():
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print("🎉 No regressions")
+    else:
+        print(f"⚠️ No baseline at {baseline_path}; run with --save-baseline")
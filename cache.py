@@ -0,0 +1,152 @@
+# cache.py
+# Content-addressed on-disk cache for extract / decode step outputs.
+# Entries are keyed on the input file hash, the jar digests and the step
+# options, and evicted least-recently-used once the cache exceeds max_bytes.
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = os.environ.get("KLV_CACHE_DIR") or str(
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "klv_metadata"
+)
+DEFAULT_MAX_BYTES = int(os.environ.get("KLV_CACHE_MAX_BYTES", 20 * 1024 ** 3))
+
+HASH_CHUNK_SIZE = 1 << 20
+ENTRY_MARKER = ".complete"
+DIGESTS_FILE = "digests.json"
+DIGESTS_LOCK = "digests.lock"
+
+
+def _link_or_copy(src, dst):
+    """Hard-link src to dst (replacing dst); copy across filesystems."""
+    dst = Path(dst)
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.entries = self.root / "entries"
+        self.max_bytes = max_bytes
+        self.entries.mkdir(parents=True, exist_ok=True)
+
+    # ---------------- Keys ----------------
+    def file_digest(self, path):
+        """
+        SHA-256 of a file's content, memoised on (path, size, mtime) so
+        unchanged multi-GB inputs are only hashed once.
+        """
+        path = Path(path).resolve()
+        st = path.stat()
+        stamp = f"{st.st_size}:{st.st_mtime_ns}"
+
+        digests_path = self.root / DIGESTS_FILE
+        known = self._read_digests(digests_path).get(str(path))
+        if known and known["stamp"] == stamp:
+            return known["sha256"]
+
+        digest = sha256_file(path)
+
+        # Parallel batch workers share this file: re-read under the lock so
+        # their entries are merged, and replace it atomically
+        with open(self.root / DIGESTS_LOCK, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            digests = self._read_digests(digests_path)
+            digests[str(path)] = {"stamp": stamp, "sha256": digest}
+            tmp = digests_path.with_name(f"{DIGESTS_FILE}.tmp-{os.getpid()}")
+            tmp.write_text(json.dumps(digests))
+            tmp.replace(digests_path)
+        return digest
+
+    @staticmethod
+    def _read_digests(digests_path):
+        try:
+            return json.loads(digests_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def key(self, kind, input_path, jars=(), options=None):
+        payload = {
+            "kind": kind,
+            "input": self.file_digest(input_path),
+            # Missing jars (e.g. native-only decodes) are keyed by name
+            "jars": sorted(
+                self.file_digest(j) if Path(j).exists() else str(j) for j in jars
+            ),
+            "options": options or {},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    # ---------------- Entries ----------------
+    def get(self, key, output_dir):
+        """
+        Materialise a cached entry into output_dir as hard links (copies
+        across filesystems). Returns {name: path} or None on a miss.
+        """
+        entry = self.entries / key
+        marker = entry / ENTRY_MARKER
+        if not marker.exists():
+            return None
+
+        # Touch for LRU
+        os.utime(marker)
+
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        files = {}
+        for src in entry.iterdir():
+            if src.name == ENTRY_MARKER:
+                continue
+            dst = output_dir / src.name
+            _link_or_copy(src, dst)
+            files[src.name] = str(dst)
+        return files
+
+    def put(self, key, paths):
+        """Store the given output files under key and evict old entries."""
+        entry = self.entries / key
+        tmp = self.entries / f"{key}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir()
+
+        for path in paths:
+            path = Path(path)
+            _link_or_copy(path, tmp / path.name)
+        (tmp / ENTRY_MARKER).touch()
+
+        shutil.rmtree(entry, ignore_errors=True)
+        tmp.rename(entry)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in self.entries.iterdir():
+            marker = entry / ENTRY_MARKER
+            if not marker.exists():
+                continue
+            size = sum(p.stat().st_size for p in entry.iterdir())
+            entries.append((marker.stat().st_mtime, size, entry))
+            total += size
+
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
@@ -0,0 +1,116 @@
+# capture.py
+# Background frame capture. Keeps cv2.VideoCapture draining on its own
+# thread so RTSP frames do not pile up in FFmpeg's buffer while inference
+# runs; the consumer always gets the freshest frames.
+import threading
+import time
+from collections import deque
+
+DROP_OLDEST = "oldest"
+KEEP_LATEST = "latest"
+BLOCK = "block"
+
+
+class FrameGrabber:
+    """
+    Reads frames from `cap` into a bounded queue on a daemon thread.
+
+    The grabber owns `cap` once started: the capture thread releases it on
+    exit, so it is never released under a cap.read() still in progress.
+
+    drop_policy:
+      "oldest" - when full, discard the oldest queued frame
+      "latest" - keep only the newest frame (queue size 1)
+      "block"  - wait for the consumer (lossless, for offline files)
+    """
+
+    def __init__(self, cap, queue_size=4, drop_policy=DROP_OLDEST):
+        if drop_policy not in (DROP_OLDEST, KEEP_LATEST, BLOCK):
+            raise ValueError(f"❌ Unknown drop policy: {drop_policy}")
+
+        self.cap = cap
+        self.drop_policy = drop_policy
+        self.queue_size = 1 if drop_policy == KEEP_LATEST else queue_size
+
+        self._frames = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._ended = False
+        self._thread = threading.Thread(target=self._capture, daemon=True)
+
+        self.captured = 0
+        self.dropped = 0
+
+    # ---------------- Lifecycle ----------------
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        """Stop capturing; returns False if the thread is still in cap.read()."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread.ident is None:  # never started
+            self.cap.release()
+            return True
+
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            print("⚠️ Capture thread is still reading; it releases the capture once the read returns")
+            return False
+        return True
+
+    # ---------------- Capture thread ----------------
+    def _capture(self):
+        try:
+            self._read_frames()
+        finally:
+            self.cap.release()
+
+    def _read_frames(self):
+        index = 0
+        while not self._stopped:
+            ret, frame = self.cap.read()
+            captured_at = time.perf_counter()
+
+            with self._cond:
+                if not ret:
+                    self._ended = True
+                    self._cond.notify_all()
+                    return
+
+                if self.drop_policy == BLOCK:
+                    while len(self._frames) >= self.queue_size and not self._stopped:
+                        self._cond.wait()
+                elif len(self._frames) >= self.queue_size:
+                    self._frames.popleft()
+                    self.dropped += 1
+
+                self._frames.append((frame, index, captured_at))
+                self.captured += 1
+                index += 1
+                self._cond.notify_all()
+
+    @property
+    def ended(self):
+        with self._cond:
+            return (self._ended or self._stopped) and not self._frames
+
+    # ---------------- Consumer ----------------
+    def read(self, timeout=None):
+        """
+        Return (ok, frame, frame_index, captured_at). ok is False once the
+        stream has ended and the queue is drained, or on timeout.
+        """
+        with self._cond:
+            ready = self._cond.wait_for(
+                lambda: self._frames or self._ended or self._stopped,
+                timeout=timeout,
+            )
+            if not ready or not self._frames:
+                return False, None, None, None
+
+            frame, index, captured_at = self._frames.popleft()
+            self._cond.notify_all()
+            return True, frame, index, captured_at
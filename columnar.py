@@ -0,0 +1,167 @@
+# columnar.py
+# Typed columnar (Parquet / Arrow IPC) output for decoded KLV metadata.
+# One numeric column per ST 0601 tag in engineering units, plus a separate
+# exploded VTarget table keyed by packet_index and target_id. Demuxed
+# from a .ts, packets also keep their PES PTS.
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from fast_decode import (
+    ST0601_NUMERIC,
+    ST0601_STRING,
+    ST0903_FOV,
+    ST0903_STRING,
+    VMTI_COLUMNS,
+    VTARGET_UINT,
+    FastKlvDecoder,
+)
+from klv import MappedKlvFile
+from output import unlink_output
+from ts_demux import TsDemuxer
+
+DEFAULT_ROW_GROUP_SIZE = 65536
+
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+
+
+# ---------------- Schemas ----------------
+def _st0601_type(dtype):
+    return TIMESTAMP if np.dtype(dtype).itemsize == 8 else pa.float64()
+
+
+def _vmti_type(name):
+    if name == "PrecisionTimeStamp":
+        return TIMESTAMP
+    if name in ST0903_FOV.values():
+        return pa.float64()
+    if name in ST0903_STRING.values():
+        return pa.string()
+    return pa.uint64()
+
+
+PACKET_SCHEMA = pa.schema(
+    [
+        ("packet_index", pa.int64()),
+        ("pts", pa.int64()),
+        ("type", pa.string()),
+        *((name, _st0601_type(dtype)) for name, dtype, *_ in ST0601_NUMERIC.values()),
+        *((name, pa.string()) for name in ST0601_STRING.values()),
+        *(("vmti_" + name, _vmti_type(name)) for name in VMTI_COLUMNS),
+    ]
+)
+
+VTARGET_SCHEMA = pa.schema(
+    [
+        ("packet_index", pa.int64()),
+        ("target_id", pa.uint64()),
+        *((name, pa.uint64()) for name in VTARGET_UINT.values()),
+    ]
+)
+
+
+def _to_table(columns, schema):
+    arrays = []
+    for field in schema:
+        values = columns[field.name]
+        if isinstance(values, np.ma.MaskedArray):
+            arrays.append(pa.array(values.data, mask=np.ma.getmaskarray(values)).cast(field.type))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+# ---------------- Writers ----------------
+class _TableWriter:
+    def __init__(self, path, schema, fmt):
+        self.fmt = fmt
+        unlink_output(path)
+        if fmt == "arrow":
+            self._sink = pa.OSFile(str(path), "wb")
+            self._writer = pa.ipc.new_file(self._sink, schema)
+        else:
+            self._sink = None
+            self._writer = pq.ParquetWriter(str(path), schema, compression="zstd")
+
+    def write(self, table):
+        if table.num_rows:
+            self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+
+def _batches(path, size):
+    """(frames, pts list or None) batches from a .klv, or the KLV streams of a .ts."""
+    if Path(path).suffix == ".ts":
+        with TsDemuxer(path) as demuxer:
+            packets = demuxer.iter_klv()
+            try:
+                batch, stamps = [], []
+                for pts, frame in packets:
+                    batch.append(frame)
+                    stamps.append(pts)
+                    if len(batch) == size:
+                        yield batch, stamps
+                        batch, stamps = [], []
+                if batch:
+                    yield batch, stamps
+            finally:
+                # Release the NumPy views before the mmap is closed
+                packets.close()
+        return
+
+    with MappedKlvFile(path) as klv:
+        batch = []
+        for frame in klv.frames():
+            batch.append(frame)
+            if len(batch) == size:
+                yield batch, None
+                klv.release(batch)
+                batch = []
+        if batch:
+            yield batch, None
+            klv.release(batch)
+
+
+def write_columnar(
+    klv_path,
+    output_dir,
+    fmt="parquet",
+    row_group_size=DEFAULT_ROW_GROUP_SIZE,
+):
+    """
+    Decode klv_path natively into packets.<ext> and vtargets.<ext>.
+
+    fmt is "parquet" or "arrow" (IPC file). Each batch of row_group_size
+    packets becomes one row group / record batch. klv_path may also be
+    the .ts itself: its KLV streams are demuxed in-process and the "pts"
+    column (null from a .klv) holds each packet's PES PTS. Returns the
+    two paths.
+    """
+    output_dir = Path(output_dir)
+    ext = "arrow" if fmt == "arrow" else "parquet"
+    packets_path = output_dir / f"packets.{ext}"
+    vtargets_path = output_dir / f"vtargets.{ext}"
+
+    decoder = FastKlvDecoder()
+    packets_writer = _TableWriter(packets_path, PACKET_SCHEMA, fmt)
+    vtargets_writer = _TableWriter(vtargets_path, VTARGET_SCHEMA, fmt)
+
+    try:
+        index = 0
+        for batch, pts in _batches(klv_path, row_group_size):
+            packets, targets = decoder.decode_columns(batch, index)
+            packets["pts"] = pts or [None] * len(batch)
+            packets_writer.write(_to_table(packets, PACKET_SCHEMA))
+            vtargets_writer.write(_to_table(targets, VTARGET_SCHEMA))
+            index += len(batch)
+    finally:
+        packets_writer.close()
+        vtargets_writer.close()
+
+    return str(packets_path), str(vtargets_path)
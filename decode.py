@@ -1,18 +1,25 @@
 # decode.py
+import time
+
 import jpype
 import jpype.imports
 from jpype.types import JByte
 
+from klv import DEFAULT_CHUNK_SIZE, MappedKlvFile
+from output import write_ndjson
+from timing import timings
+
 
 class JmisbDecoder:
-    def __init__(self, jars):
+    def __init__(self, jars, jvm_args=()):
         self.jars = jars
+        self.jvm_args = list(jvm_args)
         self._java_loaded = False
 
     # ---------------- JVM ----------------
     def start_jvm(self):
         if not jpype.isJVMStarted():
-            jpype.startJVM(classpath=self.jars)
+            jpype.startJVM(*self.jvm_args, classpath=self.jars)
 
         # Import Java classes ONLY after JVM starts
         if not self._java_loaded:
@@ -134,31 +141,76 @@ class JmisbDecoder:
 
         return out
 
-    # ---------------- Main API ----------------
-    def decode_file(self, klv_path):
-        data = open(klv_path, "rb").read()
-        byte_array = jpype.JArray(JByte)(data)
-        packets = self.KlvParser.parseBytes(byte_array)
-
-        result = {
-            "total_packets": packets.size(),
-            "packets": []
-        }
+    def decode_packet(self, pkt, index):
+        t0 = time.perf_counter()
+        pkt_out = {"packet_index": index}
+
+        if isinstance(pkt, self.VmtiLocalSet):
+            pkt_out.update(self.decode_vmti_packet(pkt))
 
-        for i in range(packets.size()):
-            pkt = packets.get(i)
-            pkt_out = {"packet_index": i}
+        elif isinstance(pkt, self.UasDatalinkMessage):
+            pkt_out.update(self.decode_uas_packet(pkt))
 
-            if isinstance(pkt, self.VmtiLocalSet):
-                pkt_out.update(self.decode_vmti_packet(pkt))
+        else:
+            pkt_out["type"] = "UNKNOWN"
+            pkt_out["raw"] = str(pkt)
 
-            elif isinstance(pkt, self.UasDatalinkMessage):
-                pkt_out.update(self.decode_uas_packet(pkt))
+        timings.record("packet_decode", time.perf_counter() - t0)
+        return pkt_out
 
-            else:
-                pkt_out["type"] = "UNKNOWN"
-                pkt_out["raw"] = str(pkt)
+    def parse(self, data):
+        """
+        JArray conversion + KlvParser.parseBytes, each timed.
 
-            result["packets"].append(pkt_out)
+        data can be bytes or a memoryview (e.g. a MappedKlvFile slice).
+        JArray(JByte) only takes bytes reliably, so a memoryview is copied
+        once into bytes (one chunk) before the Java byte[] jMISB requires.
+        """
+        with timings.stage("jarray_convert", len(data)):
+            byte_array = jpype.JArray(JByte)(bytes(data))
+        with timings.stage("parse_bytes", len(data)):
+            return self.KlvParser.parseBytes(byte_array)
+
+    def decode_bytes(self, data, start_index=0):
+        packets = self.parse(data)
+        return [
+            self.decode_packet(packets.get(i), start_index + i)
+            for i in range(packets.size())
+        ]
+
+    # ---------------- Main API ----------------
+    def decode_file(self, klv_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        packets = list(self.iter_packets(klv_path, chunk_size))
+        return {
+            "total_packets": len(packets),
+            "packets": packets
+        }
 
-        return result
+    # ---------------- Streaming API ----------------
+    def iter_packets(self, klv_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Decode klv_path in batches of whole packets of about chunk_size bytes.
+
+        The file is memory-mapped and each batch is handed to jMISB as a
+        slice of the map, so at most one chunk_size batch is copied (to
+        bytes and the Java array) and memory stays flat regardless of
+        file length.
+        """
+        index = 0
+        with MappedKlvFile(klv_path) as klv:
+            for batch in klv.batches(chunk_size):
+                try:
+                    packets = self.decode_bytes(batch, index)
+                finally:
+                    batch.release()
+                for pkt_out in packets:
+                    yield pkt_out
+                    index += 1
+
+    def decode_stream(self, klv_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Decode klv_path to newline-delimited JSON, one packet per line.
+
+        Returns the number of packets written.
+        """
+        return write_ndjson(self.iter_packets(klv_path, chunk_size), output_path)
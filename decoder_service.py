@@ -0,0 +1,285 @@
+# decoder_service.py
+# Long-lived jMISB decoder worker. JPype cannot restart a JVM inside one
+# process, so the JVM and jMISB classes are loaded once here and decode
+# requests are served over a local multiprocessing.connection socket.
+#
+# multiprocessing.connection exchanges pickles, so the service only listens
+# on a Unix socket inside a 0700 per-user directory, and clients must also
+# present a random key the service writes there (mode 0600) at startup.
+import argparse
+import os
+import secrets
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+from decode import JmisbDecoder
+from fast_decode import FastKlvDecoder
+from output import write_decoded
+
+DEFAULT_IDLE_TIMEOUT_S = 900.0
+SOCKET_NAME = "decoder.sock"
+KEY_NAME = "decoder.key"
+
+
+def runtime_dir():
+    """Per-user directory holding the service socket and key (mode 0700)."""
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    path = Path(base) / f"klv-decoder-{os.getuid()}"
+    path.mkdir(mode=0o700, exist_ok=True)
+
+    st = path.stat()
+    if st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+        raise PermissionError(f"❌ {path} must be owned by you with mode 0700")
+    return path
+
+
+def _write_key(path):
+    key = secrets.token_bytes(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+class DecoderService:
+    """
+    Serve decode requests on a Unix socket, one thread per client.
+
+    Exits on a "shutdown" request, or once no client has been connected
+    for idle_timeout_s (None keeps it running).
+    """
+
+    def __init__(self, jars, directory=None, idle_timeout_s=DEFAULT_IDLE_TIMEOUT_S):
+        self.jars = jars
+        self.directory = Path(directory) if directory else runtime_dir()
+        self.address = str(self.directory / SOCKET_NAME)
+        self.idle_timeout_s = idle_timeout_s
+
+        self.decoder = JmisbDecoder(jars)
+        self.fast_decoder = FastKlvDecoder(fallback=self.decoder)
+
+        self.cold_start_s = None
+        self.requests = 0
+        self.warm_latencies = []
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._active = 0
+        self._last_active = time.monotonic()
+        self._authkey = None
+
+    # ---------------- Lifecycle ----------------
+    def warm_up(self):
+        t0 = time.perf_counter()
+        self.decoder.start_jvm()
+        self.cold_start_s = time.perf_counter() - t0
+        print(f"JVM + jMISB classes loaded in {self.cold_start_s:.3f}s")
+
+    def _running(self):
+        with socket.socket(socket.AF_UNIX) as sock:
+            try:
+                sock.connect(self.address)
+                return True
+            except OSError:
+                return False
+
+    def serve_forever(self):
+        if self._running():
+            print(f"Decoder service already listening on {self.address}")
+            return
+        self.warm_up()
+        key_path = self.directory / KEY_NAME
+        self._authkey = _write_key(key_path)
+        if os.path.exists(self.address):
+            # Left behind by a service that did not exit cleanly
+            os.unlink(self.address)
+
+        listener = Listener(self.address, family="AF_UNIX", authkey=self._authkey)
+        os.chmod(self.address, 0o600)
+        print(f"Decoder service listening on {self.address}")
+        if self.idle_timeout_s:
+            threading.Thread(target=self._watch_idle, daemon=True).start()
+
+        try:
+            while not self._stop.is_set():
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError):
+                    # Failed handshake (wrong key) or a dropped client
+                    continue
+                if self._stop.is_set():
+                    conn.close()
+                    break
+                threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            key_path.unlink(missing_ok=True)
+            self.decoder.shutdown_jvm()
+
+    def stop(self):
+        """Stop accepting clients; wakes the blocked accept() with a dummy connection."""
+        self._stop.set()
+        try:
+            Client(self.address, family="AF_UNIX", authkey=self._authkey).close()
+        except OSError:
+            pass
+
+    def _watch_idle(self):
+        while not self._stop.wait(min(self.idle_timeout_s, 5.0)):
+            with self._lock:
+                idle = self._active == 0 and time.monotonic() - self._last_active > self.idle_timeout_s
+            if idle:
+                print(f"Decoder service idle for {self.idle_timeout_s:.0f}s, shutting down")
+                self.stop()
+
+    # ---------------- Requests ----------------
+    def _serve_client(self, conn):
+        with self._lock:
+            self._active += 1
+        try:
+            with conn:
+                self._handle(conn)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._last_active = time.monotonic()
+
+    def _handle(self, conn):
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+
+            op = request.get("op")
+            if op == "shutdown":
+                conn.send({"ok": True})
+                self.stop()
+                return
+            if op == "stats":
+                conn.send({"ok": True, **self.stats()})
+                continue
+
+            try:
+                conn.send({"ok": True, **self._decode(request)})
+            except Exception as exc:
+                conn.send({"ok": False, "error": repr(exc)})
+
+    def _decode(self, request):
+        decoder = self.fast_decoder if request.get("fast") else self.decoder
+
+        t0 = time.perf_counter()
+        output_path = write_decoded(
+            decoder,
+            request["klv_path"],
+            request["output_dir"],
+            streaming=request.get("streaming", False),
+        )
+        latency = time.perf_counter() - t0
+
+        with self._lock:
+            self.requests += 1
+            self.warm_latencies.append(latency)
+        return {"output_path": output_path, "latency_s": latency}
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.warm_latencies)
+            requests = self.requests
+        return {
+            "cold_start_s": self.cold_start_s,
+            "requests": requests,
+            "warm_latency_mean_s": sum(latencies) / len(latencies) if latencies else None,
+            "warm_latency_p50_s": latencies[len(latencies) // 2] if latencies else None,
+        }
+
+
+class DecoderClient:
+    def __init__(self, directory=None):
+        directory = Path(directory) if directory else runtime_dir()
+        authkey = (directory / KEY_NAME).read_bytes()
+        self.conn = Client(str(directory / SOCKET_NAME), family="AF_UNIX", authkey=authkey)
+
+    def _call(self, request):
+        self.conn.send(request)
+        response = self.conn.recv()
+        if not response.pop("ok"):
+            raise RuntimeError(f"Decoder service error: {response['error']}")
+        return response
+
+    def decode(self, klv_path, output_dir, streaming=False, fast=False):
+        return self._call({
+            "op": "decode",
+            # The service may run from a different working directory
+            "klv_path": str(Path(klv_path).resolve()),
+            "output_dir": str(Path(output_dir).resolve()),
+            "streaming": streaming,
+            "fast": fast,
+        })
+
+    def stats(self):
+        return self._call({"op": "stats"})
+
+    def shutdown(self):
+        self._call({"op": "shutdown"})
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def connect(jars, directory=None, idle_timeout_s=DEFAULT_IDLE_TIMEOUT_S, timeout=60.0):
+    """
+    Connect to a running decoder service, starting a detached one if needed.
+
+    The spawned service outlives the caller so later runs reuse its warm
+    JVM, and exits after idle_timeout_s without clients.
+    """
+    directory = Path(directory) if directory else runtime_dir()
+    try:
+        return DecoderClient(directory)
+    except (FileNotFoundError, ConnectionRefusedError):
+        pass
+
+    cmd = [sys.executable, __file__, "--dir", str(directory), "--jars", *jars]
+    if idle_timeout_s:
+        cmd += ["--idle-timeout", str(idle_timeout_s)]
+    subprocess.Popen(cmd, start_new_session=True)
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return DecoderClient(directory)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline:
+                raise RuntimeError("❌ Decoder service did not start")
+            time.sleep(0.2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Persistent jMISB decoder service")
+    parser.add_argument("--jars", nargs="+", required=True)
+    parser.add_argument("--dir", default=None, help="socket/key directory (default: per-user runtime dir)")
+    parser.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT_S,
+                        help="exit after this many seconds without clients (0 = never)")
+    args = parser.parse_args()
+
+    DecoderService(
+        args.jars,
+        directory=args.dir,
+        idle_timeout_s=args.idle_timeout or None,
+    ).serve_forever()
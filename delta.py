@@ -0,0 +1,102 @@
+# delta.py
+# Delta / keyframe NDJSON output for decoded packets. Every
+# keyframe_interval packets of a type a full snapshot of "fields" is
+# written; in between only the fields that changed (and the names of
+# removed ones). Other keys (embedded_vmti, vtarget_series, ...) are kept
+# as-is since they change every packet.
+import json
+import time
+
+from output import unlink_output
+from timing import timings
+
+DEFAULT_KEYFRAME_INTERVAL = 300
+
+
+class DeltaEncoder:
+    def __init__(self, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        # type -> (fields of the previous packet, packets since keyframe)
+        self._state = {}
+
+    def encode(self, pkt_out):
+        fields = pkt_out.get("fields")
+        if fields is None:
+            return pkt_out
+
+        ptype = pkt_out.get("type")
+        prev, since = self._state.get(ptype, (None, self.keyframe_interval))
+
+        out = {k: v for k, v in pkt_out.items() if k != "fields"}
+        if prev is None or since + 1 >= self.keyframe_interval:
+            out["keyframe"] = True
+            out["fields"] = fields
+            self._state[ptype] = (fields, 0)
+            return out
+
+        out["delta"] = {k: v for k, v in fields.items() if prev.get(k) != v}
+        removed = [k for k in prev if k not in fields]
+        if removed:
+            out["removed"] = removed
+        self._state[ptype] = (fields, since + 1)
+        return out
+
+
+class DeltaDecoder:
+    """Rebuild full packets from DeltaEncoder records."""
+
+    def __init__(self):
+        self._fields = {}
+
+    def decode(self, record):
+        ptype = record.get("type")
+
+        if record.get("keyframe"):
+            fields = record["fields"]
+        elif "delta" in record:
+            if ptype not in self._fields:
+                raise ValueError(
+                    f"❌ Delta record {record.get('packet_index')} before any keyframe"
+                )
+            fields = dict(self._fields[ptype])
+            for k in record.get("removed", ()):
+                fields.pop(k, None)
+            fields.update(record["delta"])
+        else:
+            return record
+
+        self._fields[ptype] = fields
+
+        pkt_out = {}
+        for k, v in record.items():
+            if k in ("keyframe", "delta", "removed", "fields"):
+                continue
+            pkt_out[k] = v
+            if k == "type":
+                pkt_out["fields"] = fields
+        return pkt_out
+
+
+def write_delta_ndjson(packets, output_path, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+    """Write decoded packets as delta-encoded NDJSON. Returns the count."""
+    encoder = DeltaEncoder(keyframe_interval)
+    count = 0
+    unlink_output(output_path)
+    with open(output_path, "w") as out:
+        for pkt_out in packets:
+            t0 = time.perf_counter()
+            out.write(json.dumps(encoder.encode(pkt_out)))
+            out.write("\n")
+            timings.record("json_serialize", time.perf_counter() - t0)
+            timings.maybe_log()
+            count += 1
+    return count
+
+
+def read_delta_ndjson(path):
+    """Yield fully reconstructed packets from a delta-encoded NDJSON file."""
+    decoder = DeltaDecoder()
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield decoder.decode(json.loads(line))
@@ -0,0 +1,366 @@
+# evaluate.py
+# Agreement between our RF-DETR + ByteTrack tracks and the onboard ST 0903
+# VMTI targets, per recording and across an archive. Both sides are loaded
+# into columnar NumPy arrays, IoU is computed for every candidate pair of a
+# recording in one pass and matched per frame (vectorised greedy, or
+# Hungarian). Recordings are evaluated in parallel worker processes.
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from geolocate import frame_origin
+from roi import VmtiIndex
+from track_output import VIDEO_FIELDS
+
+GREEDY = "greedy"
+HUNGARIAN = "hungarian"
+DEFAULT_IOU = 0.5
+
+COUNTS = ("eval_frames", "predictions", "targets", "true_positives", "id_switches")
+
+
+# ---------------- Loading ----------------
+def load_tracks(path):
+    """
+    Track records (track_output.py) as columns sorted by frame: frame,
+    tracker_id (-1 when absent), boxes (N x 4), the fps implied by the
+    frame_index / timestamp pairs, and the video frame_size (w, h) and
+    video_start_pts the tracker recorded (None when absent).
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        names = pq.read_schema(path).names
+        table = pq.read_table(path, columns=[
+            "frame_index", "timestamp", "tracker_id", "x1", "y1", "x2", "y2",
+            *(name for name in VIDEO_FIELDS if name in names),
+        ])
+        cols = {name: table[name].to_numpy(zero_copy_only=False) for name in table.column_names}
+        boxes = np.stack([cols[k].astype(float) for k in ("x1", "y1", "x2", "y2")], axis=1)
+        tracker_id = cols["tracker_id"]
+        video = table.slice(0, 1).select(
+            [name for name in VIDEO_FIELDS if name in table.column_names]
+        ).to_pylist()
+    else:
+        with open(path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        cols = {
+            "frame_index": np.array([r["frame_index"] for r in records], dtype=np.int64),
+            "timestamp": np.array([r["timestamp"] for r in records], dtype=float),
+        }
+        boxes = np.array([r["xyxy"] for r in records], dtype=float).reshape(-1, 4)
+        tracker_id = np.array([r["tracker_id"] for r in records], dtype=object)
+        video = records[:1]
+
+    tracker_id = np.array([-1 if v is None or v != v else int(v) for v in tracker_id], dtype=np.int64)
+    frame = cols["frame_index"].astype(np.int64)
+    order = np.argsort(frame, kind="stable")
+
+    stamp = cols["timestamp"].astype(float)
+    moving = (frame > 0) & (stamp > 0)
+    fps = float(np.median(frame[moving] / stamp[moving])) if moving.any() else None
+
+    first = video[0] if video else {}
+    width, height = first.get("frame_width"), first.get("frame_height")
+    return {
+        "frame": frame[order],
+        "tracker_id": tracker_id[order],
+        "boxes": boxes[order],
+        "fps": fps,
+        "frame_size": (int(width), int(height)) if width and height else None,
+        "video_start_pts": first.get("video_start_pts"),
+    }
+
+
+def load_vmti(path, frame_size=None):
+    """VmtiIndex from decoded_metadata.json / .ndjson or a columnar output directory."""
+    return VmtiIndex.load(path, frame_size=frame_size)
+
+
+# ---------------- Matching ----------------
+def pair_iou(a, b):
+    """Element-wise IoU of two (P, 4) xyxy arrays."""
+    iw = np.clip(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    ih = np.clip(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    inter = iw * ih
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a + area_b - inter
+    return np.where(union > 0, inter / np.where(union > 0, union, 1), 0.0)
+
+
+def _best_per(keys, iou):
+    """Index of the highest-IoU pair for each distinct key."""
+    order = np.lexsort((-iou, keys))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = keys[order][1:] != keys[order][:-1]
+    return order[first]
+
+
+def match_greedy(pred, gt, iou):
+    """
+    Greedy highest-IoU-first one-to-one matching of candidate pairs.
+
+    pred / gt are global row ids, so pairs of every frame are matched in
+    the same vectorised rounds: each round keeps the pairs that are both
+    their prediction's and their target's best, which (for distinct IoUs)
+    is what the sequential greedy would pick. Returns indices of the
+    matched pairs.
+    """
+    alive = np.arange(len(pred))
+    matched = []
+    while len(alive):
+        p, g, s = pred[alive], gt[alive], iou[alive]
+        mutual = np.intersect1d(_best_per(p, s), _best_per(g, s))
+        if not len(mutual):
+            # Ties can leave no mutual best; the global best is always safe
+            mutual = np.array([np.argmax(s)])
+        matched.append(alive[mutual])
+        taken = np.isin(p, p[mutual]) | np.isin(g, g[mutual])
+        alive = alive[~taken]
+    return np.concatenate(matched) if matched else np.zeros(0, dtype=np.int64)
+
+
+def match_hungarian(frame, pred, gt, iou):
+    """Maximum-total-IoU assignment, one frame at a time."""
+    # Optional dependency: only --method hungarian needs scipy
+    from scipy.optimize import linear_sum_assignment
+
+    matched = []
+    order = np.argsort(frame, kind="stable")
+    bounds = np.flatnonzero(np.diff(frame[order])) + 1
+    for pairs in np.split(order, bounds):
+        if not len(pairs):
+            continue
+        rows, p = np.unique(pred[pairs], return_inverse=True)
+        cols, g = np.unique(gt[pairs], return_inverse=True)
+        cost = np.zeros((len(rows), len(cols)))
+        cost[p, g] = -iou[pairs]
+        lookup = np.full((len(rows), len(cols)), -1, dtype=np.int64)
+        lookup[p, g] = pairs
+        r, c = linear_sum_assignment(cost)
+        chosen = lookup[r, c]
+        matched.append(chosen[chosen >= 0])
+    return np.concatenate(matched) if matched else np.zeros(0, dtype=np.int64)
+
+
+# ---------------- One recording ----------------
+def evaluate_recording(tracks_path, vmti_path, iou_threshold=DEFAULT_IOU, method=GREEDY,
+                       frame_size=None, time_offset_s=0.0, fps=None, video_start_s=None):
+    """
+    Precision / recall / ID switches of tracks_path against the VMTI
+    targets in vmti_path. Every VMTI packet inside the tracked span is
+    one evaluation frame (the video frame nearest its time); VMTI is the
+    reference.
+
+    Targets are scaled to the video frame size the predictions are in:
+    frame_size, else the size recorded in the tracks. Frames are placed
+    on the VMTI clock as in tracking (geolocate.frame_origin): from
+    video_start_s, else the recorded video_start_pts, else the first
+    VMTI packet, plus time_offset_s. fps defaults to the tracks' own.
+    """
+    t0 = time.perf_counter()
+    tracks = load_tracks(tracks_path)
+    vmti = load_vmti(vmti_path, frame_size or tracks["frame_size"])
+    fps = fps or tracks["fps"]
+    frame_size = frame_size or tracks["frame_size"]
+    if frame_size is None and not len(tracks["frame"]):
+        # No predictions to match, so any size gives the same counts
+        frame_size = vmti.frame_size
+    if not fps or not frame_size:
+        raise ValueError(
+            f"❌ Cannot align {tracks_path}: unknown fps or video frame size (pass fps / frame_size)"
+        )
+
+    # VMTI packet -> nearest video frame inside the tracked span
+    origin = frame_origin(vmti, video_start_s, tracks["video_start_pts"], time_offset_s, "VMTI")
+    frames = np.rint((vmti.t - origin) * fps).astype(np.int64)
+    last = tracks["frame"][-1] if len(tracks["frame"]) else -1
+    inside = (frames >= 0) & (frames <= last)
+    frames, first = np.unique(frames[inside], return_index=True)
+    packets = np.flatnonzero(inside)[first]
+
+    p_start = np.searchsorted(tracks["frame"], frames, side="left")
+    n_pred = np.searchsorted(tracks["frame"], frames, side="right") - p_start
+    g_start = vmti.offsets[packets]
+    n_gt = vmti.offsets[packets + 1] - g_start
+
+    # Every (prediction, target) pair of every evaluation frame at once
+    counts = n_pred * n_gt
+    k = np.repeat(np.arange(len(frames)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pred = p_start[k] + local // np.maximum(n_gt[k], 1)
+    gt = g_start[k] + local % np.maximum(n_gt[k], 1)
+
+    width, height = frame_size
+    gt_boxes = vmti.boxes * (width, height, width, height)
+    iou = pair_iou(tracks["boxes"][pred], gt_boxes[gt])
+    keep = iou >= iou_threshold
+    pred, gt, iou, k = pred[keep], gt[keep], iou[keep], k[keep]
+
+    if method == HUNGARIAN:
+        m = match_hungarian(k, pred, gt, iou)
+    else:
+        m = match_greedy(pred, gt, iou)
+
+    # ID switch: a VMTI target matched to a different track than last time
+    target_id = vmti.ids[gt[m]]
+    track_id = tracks["tracker_id"][pred[m]]
+    order = np.lexsort((frames[k[m]], target_id))
+    target_id, track_id = target_id[order], track_id[order]
+    switches = int(np.sum((target_id[1:] == target_id[:-1]) & (track_id[1:] != track_id[:-1])))
+
+    result = {
+        "tracks": str(tracks_path),
+        "vmti": str(vmti_path),
+        "eval_frames": int(len(frames)),
+        "predictions": int(n_pred.sum()),
+        "targets": int(n_gt.sum()),
+        "true_positives": int(len(m)),
+        "id_switches": switches,
+        "mean_iou": float(iou[m].mean()) if len(m) else None,
+        "wall_s": time.perf_counter() - t0,
+    }
+    result.update(_rates(result))
+    return result
+
+
+def _rates(counts):
+    tp, p, g = counts["true_positives"], counts["predictions"], counts["targets"]
+    precision = tp / p if p else None
+    recall = tp / g if g else None
+    f1 = 2 * tp / (p + g) if p + g else None
+    mota = 1 - ((p - tp) + (g - tp) + counts["id_switches"]) / g if g else None
+    return {"precision": precision, "recall": recall, "f1": f1, "mota": mota}
+
+
+# ---------------- Archive ----------------
+def discover_pairs(tracks_dir, metadata_root):
+    """
+    Pair each <name>.ndjson / .parquet track file with its metadata:
+    <metadata_root>/<name>/ or a batch.py output dir <name>-<sha256[:12]>/,
+    holding packets.parquet + vtargets.parquet or decoded_metadata.(nd)json.
+    """
+    metadata_root = Path(metadata_root)
+    pairs = []
+    for tracks in sorted(Path(tracks_dir).iterdir()):
+        if tracks.suffix not in (".ndjson", ".parquet"):
+            continue
+        dirs = [metadata_root / tracks.stem, *sorted(metadata_root.glob(f"{tracks.stem}-*"))]
+        for d in dirs:
+            if (d / "vtargets.parquet").exists():
+                pairs.append((str(tracks), str(d)))
+                break
+            found = next((d / n for n in ("decoded_metadata.ndjson", "decoded_metadata.json")
+                          if (d / n).exists()), None)
+            if found:
+                pairs.append((str(tracks), str(found)))
+                break
+        else:
+            print(f"⚠️ No metadata for {tracks.name}")
+    return pairs
+
+
+def summarize(results):
+    """Archive totals: summed counts and rates over all recordings."""
+    done = [r for r in results if "error" not in r]
+    totals = {name: sum(r[name] for r in done) for name in COUNTS}
+    totals.update(_rates(totals))
+    totals["recordings"] = len(done)
+    totals["failed"] = len(results) - len(done)
+    return totals
+
+
+def evaluate_archive(pairs, output_path=None, workers=None, iou_threshold=DEFAULT_IOU,
+                     method=GREEDY, frame_size=None, time_offset_s=0.0, fps=None,
+                     video_start_s=None):
+    """
+    Evaluate (tracks, metadata) pairs across a process pool. Per-recording
+    results stream to output_path (NDJSON) as they finish. frame_size,
+    time_offset_s, fps and video_start_s go to every evaluate_recording.
+    Returns (results, totals).
+    """
+    workers = workers or os.cpu_count()
+    ctx = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    results = []
+    out = open(output_path, "w") if output_path else None
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            futures = {
+                pool.submit(
+                    evaluate_recording, tracks, vmti, iou_threshold, method,
+                    frame_size, time_offset_s, fps, video_start_s,
+                ): (tracks, vmti)
+                for tracks, vmti in pairs
+            }
+            for future in as_completed(futures):
+                tracks, vmti = futures[future]
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    result = {"tracks": tracks, "vmti": vmti, "error": repr(exc)}
+                    print(f"❌ {Path(tracks).name}: {exc!r}")
+                else:
+                    print(
+                        f"✔ {Path(tracks).name}: P={_fmt(result['precision'])} "
+                        f"R={_fmt(result['recall'])} IDSW={result['id_switches']} "
+                        f"({result['eval_frames']} frames)"
+                    )
+                results.append(result)
+                if out:
+                    out.write(json.dumps(result))
+                    out.write("\n")
+    finally:
+        if out:
+            out.close()
+
+    totals = summarize(results)
+    totals["wall_s"] = time.perf_counter() - started
+    print(
+        f"🎉 {totals['recordings']} recordings, {totals['eval_frames']} frames in "
+        f"{totals['wall_s']:.1f}s: P={_fmt(totals['precision'])} R={_fmt(totals['recall'])} "
+        f"F1={_fmt(totals['f1'])} IDSW={totals['id_switches']}"
+    )
+    return results, totals
+
+
+def _fmt(value):
+    return "n/a" if value is None else f"{value:.3f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate tracks against onboard VMTI targets")
+    parser.add_argument("--tracks", required=True, help="track file or directory of track files")
+    parser.add_argument("--metadata", required=True,
+                        help="decoded metadata / columnar dir, or the root holding them")
+    parser.add_argument("--output", default="evaluation.ndjson")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--iou", type=float, default=DEFAULT_IOU)
+    parser.add_argument("--method", default=GREEDY, choices=(GREEDY, HUNGARIAN))
+    parser.add_argument("--frame-size", default=None,
+                        help="video WxH the tracks are in (default: recorded in the tracks)")
+    parser.add_argument("--fps", type=float, default=None,
+                        help="video frame rate (default: implied by the tracks)")
+    parser.add_argument("--time-offset", type=float, default=0.0,
+                        help="seconds added to the video start on the VMTI clock")
+    parser.add_argument("--video-start", type=float, default=None,
+                        help="video start in seconds on the VMTI clock (default: recorded PTS)")
+    args = parser.parse_args()
+
+    frame_size = tuple(int(v) for v in args.frame_size.lower().split("x")) if args.frame_size else None
+    if Path(args.tracks).is_dir():
+        pairs = discover_pairs(args.tracks, args.metadata)
+    else:
+        pairs = [(args.tracks, args.metadata)]
+    evaluate_archive(
+        pairs, args.output, args.workers, args.iou, args.method,
+        frame_size, args.time_offset, args.fps, args.video_start,
+    )
@@ -0,0 +1,149 @@
+# extract_decode.py
+# Overlapped KLV extraction + decoding. A producer thread pulls KLV packets
+# out of the .ts (ffmpeg writing to a pipe, or the built-in demuxer) into a
+# bounded queue while the caller's thread decodes them, so neither side
+# waits for the other and no metadata.klv is written.
+import queue
+import subprocess
+import threading
+
+from klv import iter_klv_frames
+from output import unlink_output, write_ndjson
+from timing import timings
+from ts_demux import TsDemuxer
+
+DEFAULT_QUEUE_SIZE = 256
+PIPE_CHUNK_SIZE = 1 << 16
+
+_DONE = object()
+
+
+# ---------------- Producers ----------------
+def _ffmpeg_packets(ts_path):
+    cmd = [
+        "ffmpeg",
+        "-loglevel", "error",
+        "-i", ts_path,
+        "-map", "0:d",
+        "-c", "copy",
+        "-f", "data",
+        "pipe:1",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    completed = False
+    try:
+        for frame in iter_klv_frames(proc.stdout, PIPE_CHUNK_SIZE):
+            yield None, frame
+        completed = True
+    finally:
+        if not completed:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def _builtin_packets(ts_path):
+    with TsDemuxer(ts_path) as demuxer:
+        packets = demuxer.iter_klv()
+        try:
+            yield from packets
+        finally:
+            packets.close()
+
+
+def extract_klv(ts_path, klv_path, demuxer="ffmpeg"):
+    """Write the KLV data stream of ts_path to klv_path."""
+    unlink_output(klv_path)
+    if demuxer == "builtin":
+        with timings.stage("ts_demux"), TsDemuxer(ts_path) as demux:
+            demux.extract_klv(klv_path)
+        return
+
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-i", str(ts_path),
+        "-map", "0:d",
+        "-c", "copy",
+        "-f", "data",
+        str(klv_path),
+    ]
+    with timings.stage("ffmpeg_extract"):
+        subprocess.run(cmd, check=True)
+
+
+class KlvPipe:
+    """
+    Bounded producer/consumer pipe of (pts, klv_bytes) packets.
+
+    When the queue is full the producer blocks, which in turn stops ffmpeg
+    on its full stdout pipe, so memory stays bounded by queue_size packets.
+    """
+
+    def __init__(self, ts_path, demuxer="ffmpeg", queue_size=DEFAULT_QUEUE_SIZE):
+        self.ts_path = ts_path
+        self.demuxer = demuxer
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+
+    def _produce(self):
+        source = _builtin_packets if self.demuxer == "builtin" else _ffmpeg_packets
+        packets = source(self.ts_path)
+        try:
+            for item in packets:
+                if self._stop.is_set():
+                    break
+                self.queue.put(item)
+            packets.close()
+            self.queue.put(_DONE)
+        except Exception as exc:
+            self.queue.put(exc)
+
+    def __iter__(self):
+        self._thread.start()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self._stop.set()
+            # Unblock a producer waiting on a full queue
+            while self._thread.is_alive():
+                try:
+                    self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+
+def iter_extract_decode(decoder, ts_path, demuxer="ffmpeg", queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Decode KLV packets from ts_path as soon as they are extracted.
+
+    With the built-in demuxer packets carry their PES "pts" (90 kHz), which
+    geolocation and evaluation use to align metadata with video frames. It
+    runs on the producer thread like ffmpeg; its NumPy PID scan and the
+    jMISB parse both release the GIL, so demuxing and decoding overlap.
+    """
+    index = 0
+    for pts, frame in KlvPipe(ts_path, demuxer, queue_size):
+        for pkt_out in decoder.decode_bytes(frame, index):
+            if pts is not None:
+                pkt_out["pts"] = pts
+            index += 1
+            yield pkt_out
+
+
+def extract_decode(decoder, ts_path, output_path, demuxer="ffmpeg", queue_size=DEFAULT_QUEUE_SIZE):
+    """Extract and decode ts_path into NDJSON. Returns the packet count."""
+    return write_ndjson(
+        iter_extract_decode(decoder, ts_path, demuxer, queue_size),
+        output_path,
+    )
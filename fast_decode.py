@@ -0,0 +1,604 @@
+# fast_decode.py
+# Native Python/NumPy decoder for the common ST 0601 / ST 0903 tags.
+# Output matches JmisbDecoder.decode_packet; items not implemented here
+# are repacked into small packets for an optional JmisbDecoder fallback.
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from klv import (
+    DEFAULT_CHUNK_SIZE,
+    UL_KEY_LENGTH,
+    MappedKlvFile,
+    ber_length,
+    crc16_ccitt,
+    read_ber_length,
+    scan_klv_frames,
+    st0601_checksum,
+)
+from output import write_ndjson
+
+ST0601_KEY = bytes.fromhex("060e2b34020b01010e01030101000000")
+ST0903_KEY = bytes.fromhex("060e2b34020b01010e01030306000000")
+
+INT16_RANGE = 2 ** 16 - 2
+INT32_RANGE = 2 ** 32 - 2
+UINT16_RANGE = 2 ** 16 - 1
+UINT32_RANGE = 2 ** 32 - 1
+
+
+# ---------------- Formatting ----------------
+def _deg(v):
+    return f"{v:.4f}°"
+
+
+def _metres(v):
+    return f"{v:.1f}m"
+
+
+def _speed(v):
+    return f"{int(v)}m/s"
+
+
+def _int(v):
+    return str(int(v))
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _timestamp(us):
+    # Integer microseconds; a float seconds round trip loses the last digits
+    dt = _EPOCH + timedelta(microseconds=int(us))
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+# ---------------- Tag tables ----------------
+# ST 0601 fixed-width tags: tag -> (name, dtype, scale, offset, formatter).
+# value = raw * scale + offset; signed types reserve their minimum as an
+# out-of-range marker, which is dropped like an empty jMISB field.
+_ALT = (19900 / UINT16_RANGE, -900.0)
+
+ST0601_NUMERIC = {
+    1: ("Checksum", ">u2", 1, 0, _int),
+    2: ("PrecisionTimeStamp", ">u8", 1, 0, _timestamp),
+    5: ("PlatformHeadingAngle", ">u2", 360 / UINT16_RANGE, 0, _deg),
+    6: ("PlatformPitchAngle", ">i2", 40 / INT16_RANGE, 0, _deg),
+    7: ("PlatformRollAngle", ">i2", 100 / INT16_RANGE, 0, _deg),
+    8: ("PlatformTrueAirspeed", "u1", 1, 0, _speed),
+    9: ("PlatformIndicatedAirspeed", "u1", 1, 0, _speed),
+    13: ("SensorLatitude", ">i4", 180 / INT32_RANGE, 0, _deg),
+    14: ("SensorLongitude", ">i4", 360 / INT32_RANGE, 0, _deg),
+    15: ("SensorTrueAltitude", ">u2", *_ALT, _metres),
+    16: ("SensorHorizontalFov", ">u2", 180 / UINT16_RANGE, 0, _deg),
+    17: ("SensorVerticalFov", ">u2", 180 / UINT16_RANGE, 0, _deg),
+    18: ("SensorRelativeAzimuthAngle", ">u4", 360 / UINT32_RANGE, 0, _deg),
+    19: ("SensorRelativeElevationAngle", ">i4", 360 / INT32_RANGE, 0, _deg),
+    20: ("SensorRelativeRollAngle", ">u4", 360 / UINT32_RANGE, 0, _deg),
+    21: ("SlantRange", ">u4", 5e6 / UINT32_RANGE, 0, _metres),
+    22: ("TargetWidth", ">u2", 10000 / UINT16_RANGE, 0, _metres),
+    23: ("FrameCenterLatitude", ">i4", 180 / INT32_RANGE, 0, _deg),
+    24: ("FrameCenterLongitude", ">i4", 360 / INT32_RANGE, 0, _deg),
+    25: ("FrameCenterElevation", ">u2", *_ALT, _metres),
+    26: ("OffsetCornerLatitudePoint1", ">i2", 0.15 / INT16_RANGE, 0, _deg),
+    27: ("OffsetCornerLongitudePoint1", ">i2", 0.15 / INT16_RANGE, 0, _deg),
+    28: ("OffsetCornerLatitudePoint2", ">i2", 0.15 / INT16_RANGE, 0, _deg),
+    29: ("OffsetCornerLongitudePoint2", ">i2", 0.15 / INT16_RANGE, 0, _deg),
+    30: ("OffsetCornerLatitudePoint3", ">i2", 0.15 / INT16_RANGE, 0, _deg),
+    31: ("OffsetCornerLongitudePoint3", ">i2", 0.15 / INT16_RANGE, 0, _deg),
+    32: ("OffsetCornerLatitudePoint4", ">i2", 0.15 / INT16_RANGE, 0, _deg),
+    33: ("OffsetCornerLongitudePoint4", ">i2", 0.15 / INT16_RANGE, 0, _deg),
+    40: ("TargetLocationLatitude", ">i4", 180 / INT32_RANGE, 0, _deg),
+    41: ("TargetLocationLongitude", ">i4", 360 / INT32_RANGE, 0, _deg),
+    42: ("TargetLocationElevation", ">u2", *_ALT, _metres),
+    56: ("PlatformGroundSpeed", "u1", 1, 0, _speed),
+    57: ("GroundRange", ">u4", 5e6 / UINT32_RANGE, 0, _metres),
+    65: ("UasLdsVersionNumber", "u1", 1, 0, _int),
+    72: ("EventStartTimeUtc", ">u8", 1, 0, _timestamp),
+    75: ("SensorEllipsoidHeight", ">u2", *_ALT, _metres),
+    78: ("FrameCenterHae", ">u2", *_ALT, _metres),
+    90: ("PlatformPitchAngleFull", ">i4", 180 / INT32_RANGE, 0, _deg),
+    91: ("PlatformRollAngleFull", ">i4", 180 / INT32_RANGE, 0, _deg),
+}
+
+ST0601_STRING = {
+    3: "MissionId",
+    4: "PlatformTailNumber",
+    10: "PlatformDesignation",
+    11: "ImageSourceSensor",
+    12: "ImageCoordinateSystem",
+    59: "PlatformCallSign",
+    63: "SensorFovName",
+}
+
+ST0601_VMTI_TAG = 74
+ST0601_VERSION_TAG = 65
+
+# ST 0903 uses variable-length unsigned ints, so these are decoded per field.
+ST0903_UINT = {
+    1: "Checksum",
+    4: "VersionNumber",
+    5: "TotalTargetsDetected",
+    6: "NumTargetsReported",
+    7: "FrameNumber",
+    8: "FrameWidth",
+    9: "FrameHeight",
+}
+
+ST0903_STRING = {
+    3: "SystemName",
+    10: "SourceSensor",
+}
+
+ST0903_FOV = {
+    11: "HorizontalFieldOfView",
+    12: "VerticalFieldOfView",
+}
+
+ST0903_TIMESTAMP_TAG = 2
+ST0903_VERSION_TAG = 4
+ST0903_VTARGET_SERIES_TAG = 101
+
+ST0903_SERIES = {
+    102: "algorithm_series",
+    103: "ontology_series",
+}
+
+VTARGET_UINT = {
+    1: "TargetCentroid",
+    2: "BoundaryTopLeft",
+    3: "BoundaryBottomRight",
+    4: "TargetPriority",
+    5: "TargetConfidenceLevel",
+    6: "TargetHistory",
+    7: "PercentageOfTargetPixels",
+    9: "TargetIntensity",
+    19: "CentroidPixRow",
+    20: "CentroidPixColumn",
+    22: "AlgorithmId",
+}
+
+VMTI_COLUMNS = (
+    "PrecisionTimeStamp",
+    *ST0903_UINT.values(),
+    *ST0903_STRING.values(),
+    *ST0903_FOV.values(),
+)
+
+VTARGET_VMASK_TAG = 101
+VMASK_POLYGON_TAG = 1
+
+
+# ---------------- Low-level parsing ----------------
+def read_ber_oid(buf, offset):
+    """Read a BER-OID encoded integer. Returns (value, size)."""
+    value = 0
+    pos = offset
+    while True:
+        b = buf[pos]
+        value = (value << 7) | (b & 0x7F)
+        pos += 1
+        if b < 0x80:
+            return value, pos - offset
+
+
+def iter_local_set(buf, start, end):
+    """Yield (tag, value_start, value_end) for each item of a local set."""
+    pos = start
+    while pos < end:
+        tag, n = read_ber_oid(buf, pos)
+        pos += n
+        ber = read_ber_length(buf, pos)
+        if ber is None:
+            return
+        length, n = ber
+        pos += n
+        yield tag, pos, pos + length
+        pos += length
+
+
+def _uint(buf, start, end):
+    return int.from_bytes(buf[start:end], "big")
+
+
+def _string(buf, start, end):
+    return bytes(buf[start:end]).decode("latin-1")
+
+
+def _repack(key, items):
+    """
+    A packet of key holding only items (raw tag-length-value bytes) and a
+    valid checksum, so jMISB decodes just those.
+    """
+    body = b"".join(bytes(item) for item in items) + b"\x01\x02"
+    packet = key + ber_length(len(body) + 2) + body
+    checksum = st0601_checksum(packet) if key == ST0601_KEY else crc16_ccitt(packet)
+    return packet + checksum.to_bytes(2, "big")
+
+
+class FastKlvDecoder:
+    """
+    JVM-free decoder for ST 0601 / ST 0903 packets.
+
+    Fixed-width ST 0601 fields are gathered per tag across a batch of packets
+    and scaled with a single NumPy operation. Tags that are not implemented
+    here are decoded by the optional `fallback` JmisbDecoder (started lazily),
+    which only sees those items repacked into a small packet (plus the
+    version tag); without a fallback the sections holding them are listed
+    under "undecoded_sections".
+    """
+
+    def __init__(self, fallback=None, batch_size=256):
+        self.fallback = fallback
+        self.batch_size = batch_size
+
+    # ---------------- ST 0903 ----------------
+    def decode_vmask(self, buf, start, end):
+        for tag, vs, ve in iter_local_set(buf, start, end):
+            if tag == VMASK_POLYGON_TAG:
+                points = []
+                pos = vs
+                while pos < ve:
+                    length, n = read_ber_length(buf, pos)
+                    pos += n
+                    points.append(str(_uint(buf, pos, pos + length)))
+                    pos += length
+                return "[" + ", ".join(points) + "]"
+        return None
+
+    def decode_vtargets(self, buf, start, end, missing):
+        targets = []
+        pos = start
+        while pos < end:
+            length, n = read_ber_length(buf, pos)
+            pos += n
+            tgt_end = pos + length
+
+            target_id, n = read_ber_oid(buf, pos)
+            tdata = {"target_id": target_id, "fields": {}}
+
+            for tag, vs, ve in iter_local_set(buf, pos + n, tgt_end):
+                if tag in VTARGET_UINT:
+                    tdata["fields"][VTARGET_UINT[tag]] = str(_uint(buf, vs, ve))
+                elif tag == VTARGET_VMASK_TAG:
+                    mask = self.decode_vmask(buf, vs, ve)
+                    if mask:
+                        tdata["fields"]["VMask"] = mask
+                else:
+                    missing.add("vtarget_series")
+
+            targets.append(tdata)
+            pos = tgt_end
+        return targets
+
+    def decode_vmti_set(self, buf, start, end, missing, raw):
+        """
+        Decode one ST 0903 set. Sections left to jMISB go to missing and
+        their raw items to raw (the version item first).
+        """
+        out = {"fields": {}}
+        fields = out["fields"]
+
+        item = start
+        for tag, vs, ve in iter_local_set(buf, start, end):
+            if tag in ST0903_UINT:
+                fields[ST0903_UINT[tag]] = str(_uint(buf, vs, ve))
+                if tag == ST0903_VERSION_TAG:
+                    raw.insert(0, buf[item:ve])
+            elif tag in ST0903_STRING:
+                fields[ST0903_STRING[tag]] = _string(buf, vs, ve)
+            elif tag in ST0903_FOV:
+                # IMAPB(0, 180, 2)
+                fields[ST0903_FOV[tag]] = _deg(_uint(buf, vs, ve) / 2 ** 7)
+            elif tag == ST0903_TIMESTAMP_TAG:
+                fields["PrecisionTimeStamp"] = _timestamp(_uint(buf, vs, ve))
+            elif tag == ST0903_VTARGET_SERIES_TAG:
+                out["vtarget_series"] = self.decode_vtargets(buf, vs, ve, missing)
+                if "vtarget_series" in missing:
+                    raw.append(buf[item:ve])
+            else:
+                # Algorithm / ontology series and the rarer tags
+                missing.add(ST0903_SERIES.get(tag, "fields"))
+                raw.append(buf[item:ve])
+            item = ve
+        return out
+
+    # ---------------- Batch API ----------------
+    def decode_frames(self, frames, start_index=0):
+        """
+        Decode a batch of complete KLV packets (key + length + value).
+
+        Returns one dict per packet in the JmisbDecoder.decode_packet schema.
+        """
+        results = []
+        missing_by_packet = []
+        repacked = []
+        numeric = {}
+
+        for i, frame in enumerate(frames):
+            key = bytes(frame[:UL_KEY_LENGTH])
+            length, n = read_ber_length(frame, UL_KEY_LENGTH)
+            vstart = UL_KEY_LENGTH + n
+            vend = vstart + length
+            missing = set()
+            raw = []
+            pkt_out = {"packet_index": start_index + i}
+
+            if key == ST0601_KEY:
+                pkt_out["type"] = "ST0601_UAS"
+                fields = pkt_out["fields"] = {}
+                item = vstart
+                for tag, vs, ve in iter_local_set(frame, vstart, vend):
+                    spec = ST0601_NUMERIC.get(tag)
+                    if spec and ve - vs == np.dtype(spec[1]).itemsize:
+                        # Placeholder keeps jMISB's tag order in "fields"
+                        fields[spec[0]] = None
+                        numeric.setdefault(tag, []).append((i, frame[vs:ve]))
+                        if tag == ST0601_VERSION_TAG:
+                            raw.insert(0, frame[item:ve])
+                    elif tag in ST0601_STRING:
+                        fields[ST0601_STRING[tag]] = _string(frame, vs, ve)
+                    elif tag == ST0601_VMTI_TAG:
+                        nested, nested_raw = set(), []
+                        pkt_out["embedded_vmti"] = self.decode_vmti_set(
+                            frame, vs, ve, nested, nested_raw
+                        )
+                        if nested:
+                            missing.update(("embedded_vmti", m) for m in nested)
+                            # Only the nested items jMISB must decode
+                            value = b"".join(bytes(r) for r in nested_raw)
+                            raw.append(bytes([tag]) + ber_length(len(value)) + value)
+                    else:
+                        missing.add(("fields",))
+                        raw.append(frame[item:ve])
+                    item = ve
+
+            elif key == ST0903_KEY:
+                nested = set()
+                vmti = self.decode_vmti_set(frame, vstart, vend, nested, raw)
+                pkt_out["type"] = "ST0903_VMTI"
+                pkt_out.update(vmti)
+                missing.update((m,) for m in nested)
+
+            else:
+                pkt_out["type"] = "UNKNOWN"
+                missing.add(("packet",))
+
+            results.append(pkt_out)
+            missing_by_packet.append(missing)
+            if ("packet",) in missing:
+                repacked.append(frame)
+            else:
+                repacked.append(_repack(key, raw) if missing else None)
+
+        self._apply_numeric(numeric, results)
+        self._resolve_missing(frames, repacked, results, missing_by_packet)
+        return results
+
+    def decode_bytes(self, data, start_index=0):
+        frames = [data[o:o + n] for o, n in scan_klv_frames(data)]
+        return self.decode_frames(frames, start_index)
+
+    @staticmethod
+    def _scale(tag, items):
+        """Map the raw bytes of one ST 0601 tag to (values, valid) arrays."""
+        _, dtype, scale, offset, _ = ST0601_NUMERIC[tag]
+        raw = np.frombuffer(b"".join(v for _, v in items), dtype=dtype)
+
+        if raw.dtype.itemsize == 8:
+            # Timestamps stay integral; float64 would lose microseconds
+            values = raw.astype(np.int64)
+        else:
+            values = raw.astype(np.float64) * scale + offset
+
+        valid = np.ones(len(raw), dtype=bool)
+        if np.issubdtype(raw.dtype, np.signedinteger):
+            valid = raw != np.iinfo(raw.dtype).min
+        return values, valid
+
+    def _apply_numeric(self, numeric, results):
+        for tag, items in numeric.items():
+            name, _, _, _, fmt = ST0601_NUMERIC[tag]
+            values, valid = self._scale(tag, items)
+
+            for (i, _), v, ok in zip(items, values.tolist(), valid.tolist()):
+                if ok:
+                    results[i]["fields"][name] = fmt(v)
+                else:
+                    del results[i]["fields"][name]
+
+    def _resolve_missing(self, frames, repacked, results, missing_by_packet):
+        """
+        Fill the sections not implemented here from the fallback. The
+        repacked packets (only the items jMISB must decode) of the whole
+        batch go to jMISB in a single decode_bytes call; natively decoded
+        fields are kept.
+        """
+        pending = [i for i, missing in enumerate(missing_by_packet) if missing]
+        if not pending:
+            return
+
+        if self.fallback is None:
+            for i in pending:
+                missing = missing_by_packet[i]
+                if ("packet",) in missing:
+                    results[i]["raw"] = bytes(frames[i]).hex()
+                else:
+                    results[i]["undecoded_sections"] = sorted("/".join(m) for m in missing)
+            return
+
+        self.fallback.start_jvm()
+        decoded = self.fallback.decode_bytes(b"".join(repacked[i] for i in pending))
+        if len(decoded) != len(pending):
+            # jMISB dropped or split a packet; realign one packet at a time
+            decoded = [
+                next(iter(self.fallback.decode_bytes(bytes(repacked[i]))), None)
+                for i in pending
+            ]
+
+        for i, jm in zip(pending, decoded):
+            if jm is not None:
+                self._merge_fallback(results[i], jm, missing_by_packet[i])
+
+    @staticmethod
+    def _merge_fallback(pkt_out, jm, missing):
+        if ("packet",) in missing:
+            index = pkt_out["packet_index"]
+            pkt_out.clear()
+            pkt_out.update(jm)
+            pkt_out["packet_index"] = index
+            return
+
+        for path in missing:
+            src, dst = jm, pkt_out
+            for part in path[:-1]:
+                src = src.get(part, {})
+                dst = dst.setdefault(part, {})
+            leaf = path[-1]
+            if leaf not in src:
+                continue
+            if leaf == "fields":
+                merged = dict(src[leaf])
+                merged.update(dst.get(leaf, {}))
+                dst[leaf] = merged
+            else:
+                dst[leaf] = src[leaf]
+
+    # ---------------- Typed columns ----------------
+    def _vmti_columns(self, buf, start, end, i, cols, targets, packet_index):
+        for tag, vs, ve in iter_local_set(buf, start, end):
+            if tag in ST0903_UINT:
+                cols["vmti_" + ST0903_UINT[tag]][i] = _uint(buf, vs, ve)
+            elif tag in ST0903_STRING:
+                cols["vmti_" + ST0903_STRING[tag]][i] = _string(buf, vs, ve)
+            elif tag in ST0903_FOV:
+                cols["vmti_" + ST0903_FOV[tag]][i] = _uint(buf, vs, ve) / 2 ** 7
+            elif tag == ST0903_TIMESTAMP_TAG:
+                cols["vmti_PrecisionTimeStamp"][i] = _uint(buf, vs, ve)
+            elif tag == ST0903_VTARGET_SERIES_TAG:
+                self._vtarget_rows(buf, vs, ve, targets, packet_index)
+
+    @staticmethod
+    def _vtarget_rows(buf, start, end, targets, packet_index):
+        pos = start
+        while pos < end:
+            length, n = read_ber_length(buf, pos)
+            pos += n
+            tgt_end = pos + length
+
+            target_id, n = read_ber_oid(buf, pos)
+            row = dict.fromkeys(VTARGET_UINT.values())
+            for tag, vs, ve in iter_local_set(buf, pos + n, tgt_end):
+                if tag in VTARGET_UINT:
+                    row[VTARGET_UINT[tag]] = _uint(buf, vs, ve)
+
+            targets["packet_index"].append(packet_index)
+            targets["target_id"].append(target_id)
+            for name, value in row.items():
+                targets[name].append(value)
+            pos = tgt_end
+
+    def decode_columns(self, frames, start_index=0):
+        """
+        Decode a batch of KLV packets into typed columns.
+
+        Returns (packets, targets): dicts of column name -> values. ST 0601
+        numeric tags become masked NumPy arrays (one per tag, scaled to
+        engineering units), strings and ST 0903 set fields are lists with
+        None for absent values. VTargets are exploded to one row per target.
+        Tags not implemented natively are not included.
+        """
+        n = len(frames)
+        packets = {
+            "packet_index": np.arange(start_index, start_index + n, dtype=np.int64),
+            "type": [None] * n,
+        }
+        for name in ST0601_STRING.values():
+            packets[name] = [None] * n
+        for name in VMTI_COLUMNS:
+            packets["vmti_" + name] = [None] * n
+
+        targets = {name: [] for name in ("packet_index", "target_id", *VTARGET_UINT.values())}
+        numeric = {}
+
+        for i, frame in enumerate(frames):
+            key = bytes(frame[:UL_KEY_LENGTH])
+            length, hdr = read_ber_length(frame, UL_KEY_LENGTH)
+            vstart = UL_KEY_LENGTH + hdr
+            vend = vstart + length
+            packet_index = start_index + i
+
+            if key == ST0601_KEY:
+                packets["type"][i] = "ST0601_UAS"
+                for tag, vs, ve in iter_local_set(frame, vstart, vend):
+                    spec = ST0601_NUMERIC.get(tag)
+                    if spec and ve - vs == np.dtype(spec[1]).itemsize:
+                        numeric.setdefault(tag, []).append((i, frame[vs:ve]))
+                    elif tag in ST0601_STRING:
+                        packets[ST0601_STRING[tag]][i] = _string(frame, vs, ve)
+                    elif tag == ST0601_VMTI_TAG:
+                        self._vmti_columns(frame, vs, ve, i, packets, targets, packet_index)
+
+            elif key == ST0903_KEY:
+                packets["type"][i] = "ST0903_VMTI"
+                self._vmti_columns(frame, vstart, vend, i, packets, targets, packet_index)
+
+            else:
+                packets["type"][i] = "UNKNOWN"
+
+        for tag, (name, dtype, _, _, _) in ST0601_NUMERIC.items():
+            col_dtype = np.int64 if np.dtype(dtype).itemsize == 8 else np.float64
+            col = np.ma.masked_all(n, dtype=col_dtype)
+            items = numeric.get(tag)
+            if items:
+                values, valid = self._scale(tag, items)
+                rows = np.fromiter((i for i, _ in items), dtype=np.int64, count=len(items))
+                col[rows[valid]] = values[valid]
+            packets[name] = col
+
+        return packets, targets
+
+    # ---------------- JVM ----------------
+    def start_jvm(self):
+        # The fallback starts its JVM on first use only
+        pass
+
+    def shutdown_jvm(self):
+        if self.fallback is not None:
+            self.fallback.shutdown_jvm()
+
+    # ---------------- File API ----------------
+    def iter_packets(self, klv_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Decode klv_path from a memory map, batch_size packets at a time.
+
+        Packets are memoryview slices of the map; decoded values are
+        copied out, so nothing references the file once a batch is done.
+        chunk_size is accepted for API parity with JmisbDecoder.
+        """
+        index = 0
+        with MappedKlvFile(klv_path) as klv:
+            batch = []
+            for frame in klv.frames():
+                batch.append(frame)
+                if len(batch) == self.batch_size:
+                    packets = self.decode_frames(batch, index)
+                    index += len(batch)
+                    klv.release(batch)
+                    batch = []
+                    yield from packets
+            if batch:
+                packets = self.decode_frames(batch, index)
+                klv.release(batch)
+                yield from packets
+
+    def decode_file(self, klv_path):
+        packets = list(self.iter_packets(klv_path))
+        return {
+            "total_packets": len(packets),
+            "packets": packets
+        }
+
+    def decode_stream(self, klv_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        return write_ndjson(self.iter_packets(klv_path, chunk_size), output_path)
+
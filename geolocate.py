@@ -0,0 +1,359 @@
+# geolocate.py
+# Time-aligned ST 0601 metadata for tracked frames. Decoded packets are
+# indexed once into sorted NumPy arrays; each frame then costs one
+# searchsorted + linear interpolation, and all box centres in the frame
+# are projected to latitude / longitude in a single vectorised pass.
+import json
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ts_demux import PTS_WRAP
+
+PTS_HZ = 90000
+EARTH_RADIUS_M = 6378137.0
+DEFAULT_MAX_GAP_S = 1.0
+
+# Clocks an index can be keyed on
+PTS = "pts"     # unwrapped PES PTS, seconds
+UTC = "utc"     # Precision Time Stamp, seconds since the epoch
+
+CORNERS = tuple(
+    (f"OffsetCornerLatitudePoint{i}", f"OffsetCornerLongitudePoint{i}") for i in range(1, 5)
+)
+
+# ST 0601 fields kept in the index
+COLUMNS = (
+    "SensorLatitude",
+    "SensorLongitude",
+    "SensorTrueAltitude",
+    "PlatformHeadingAngle",
+    "SensorRelativeAzimuthAngle",
+    "SensorRelativeElevationAngle",
+    "SensorHorizontalFov",
+    "SensorVerticalFov",
+    "SlantRange",
+    "FrameCenterLatitude",
+    "FrameCenterLongitude",
+    "FrameCenterElevation",
+    *(name for pair in CORNERS for name in pair),
+)
+
+# Interpolated the short way round: (name, period start)
+WRAPPED = {
+    "SensorLongitude": -180.0,
+    "FrameCenterLongitude": -180.0,
+    "PlatformHeadingAngle": 0.0,
+    "SensorRelativeAzimuthAngle": 0.0,
+}
+
+_NUMBER = re.compile(r"[-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?")
+
+
+# ---------------- Field parsing ----------------
+def _number(value):
+    """Decoded fields are display strings ("12.3456°", "250.0m")."""
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = _NUMBER.match(str(value).strip())
+    return float(m.group()) if m else np.nan
+
+
+def _timestamp_s(value):
+    if value is None:
+        return np.nan
+    try:
+        dt = datetime.fromisoformat(str(value).rstrip("Z"))
+    except ValueError:
+        return np.nan
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _ffill(values):
+    """Carry the last valid value forward over NaNs (omitted fields)."""
+    valid = ~np.isnan(values)
+    if valid.all() or not valid.any():
+        return values
+    idx = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    out = values[idx]
+    # Leading NaNs have no earlier value to carry
+    out[:np.argmax(valid)] = np.nan
+    return out
+
+
+def load_packets(path):
+    """Decoded packets from decoded_metadata.json or .ndjson."""
+    path = Path(path)
+    with open(path) as f:
+        if path.suffix == ".ndjson":
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)["packets"]
+
+
+# ---------------- Time base ----------------
+def unwrap_pts(ticks):
+    """
+    Undo the 33-bit PTS wrap (every ~26.5 h) in packet order: a jump of
+    more than half the range counts as a wrap. Sort only afterwards.
+    """
+    ticks = np.asarray(ticks, dtype=np.int64)
+    if len(ticks) < 2:
+        return ticks
+    step = np.diff(ticks)
+    wraps = np.cumsum((step < -PTS_WRAP // 2).astype(np.int64) - (step > PTS_WRAP // 2))
+    return ticks + np.concatenate([[0], wraps]) * PTS_WRAP
+
+
+def nearest_wrap(seconds, reference):
+    """PTS seconds moved by whole wrap periods to lie closest to reference."""
+    period = PTS_WRAP / PTS_HZ
+    return seconds + np.round((reference - seconds) / period) * period
+
+
+def packet_times(packets):
+    """
+    (seconds, clock) for packets in packet order. The clock is PTS when
+    every packet has a PES "pts" (unwrapped), else UTC from the Precision
+    Time Stamp (NaN when absent). Times are absolute, so indexes of
+    different streams of a recording share one time base.
+    """
+    if packets and all(p.get("pts") is not None for p in packets):
+        return unwrap_pts([p["pts"] for p in packets]) / PTS_HZ, PTS
+    stamps = [_timestamp_s(p.get("fields", {}).get("PrecisionTimeStamp")) for p in packets]
+    return np.array(stamps, dtype=float), UTC
+
+
+def frame_origin(index, video_start_s=None, video_pts=None, offset_s=0.0, name="metadata"):
+    """
+    Time of video frame 0 on the clock of a metadata index (MetadataIndex
+    or roi.VmtiIndex), plus offset_s; frame i is at origin + i / fps.
+    The video start is video_start_s (seconds on that clock) or, for a
+    PTS-keyed index, video_pts (90 kHz ticks, e.g. the first video PTS of
+    the .ts). Without either, frame 0 is assumed to be the first sample.
+    """
+    if video_start_s is not None:
+        start = video_start_s
+        if index.clock == PTS:
+            start = nearest_wrap(start, index.t[0])
+    elif index.clock == PTS and video_pts is not None:
+        start = nearest_wrap(video_pts / PTS_HZ, index.t[0])
+    else:
+        print(
+            f"⚠️ Video start unknown on the {name} {index.clock} clock: assuming frame 0 "
+            f"is its first sample; pass the video start or an offset to align"
+        )
+        start = index.t[0]
+    return float(start) + offset_s
+
+
+def column_times(pts, stamps):
+    """
+    (seconds, clock) for the rows of a columnar packets table, by the same
+    rule as packet_times. pts is the "pts" column (None when the table has
+    none), stamps a Precision Time Stamp column.
+    """
+    if pts is not None and len(pts) and pts.null_count == 0:
+        return unwrap_pts(pts.to_numpy(zero_copy_only=False)) / PTS_HZ, PTS
+    return stamps.cast("int64").to_numpy(zero_copy_only=False).astype(float) / 1e6, UTC
+
+
+def time_columns(path):
+    """Time columns present in a packets.parquet ("pts" is only there when demuxed from .ts)."""
+    names = pq.read_schema(path).names
+    return [name for name in ("pts", "PrecisionTimeStamp") if name in names]
+
+
+# ---------------- Index ----------------
+class MetadataIndex:
+    """
+    Sorted arrays of the ST 0601 fields needed to geolocate a frame.
+
+    t is absolute seconds on clock: the unwrapped PES "pts" when every
+    packet carries one (PTS), else the Precision Time Stamp (UTC). Fields
+    a packet omits keep their previous value. Frames further than
+    max_gap_s from any sample get no metadata.
+    """
+
+    def __init__(self, t, columns, max_gap_s=DEFAULT_MAX_GAP_S, clock=PTS):
+        if not len(t):
+            raise ValueError("❌ No timestamped ST 0601 packets to index")
+        order = np.argsort(t, kind="stable")
+        self.t = np.asarray(t, dtype=float)[order]
+        self.clock = clock
+        self.columns = {
+            name: _ffill(np.asarray(columns[name], dtype=float)[order]) for name in COLUMNS
+        }
+        self.max_gap_s = max_gap_s
+
+    def __len__(self):
+        return len(self.t)
+
+    # ---------------- Builders ----------------
+    @classmethod
+    def from_packets(cls, packets, max_gap_s=DEFAULT_MAX_GAP_S):
+        """Index decoded packets (JmisbDecoder / FastKlvDecoder schema)."""
+        uas = [p for p in packets if p.get("type") == "ST0601_UAS"]
+        t, clock = packet_times(uas)
+        keep = ~np.isnan(t)
+        columns = {
+            name: np.array([_number(p["fields"].get(name)) for p in uas])[keep]
+            for name in COLUMNS
+        }
+        return cls(t[keep], columns, max_gap_s, clock)
+
+    @classmethod
+    def from_parquet(cls, path, max_gap_s=DEFAULT_MAX_GAP_S):
+        """Index packets.parquet from columnar.write_columnar (already typed)."""
+        table = pq.read_table(path, columns=["packet_index", "type", *time_columns(path), *COLUMNS])
+        table = table.filter(pc.equal(table["type"], "ST0601_UAS")).sort_by("packet_index")
+        pts = table["pts"] if "pts" in table.column_names else None
+        t, clock = column_times(pts, table["PrecisionTimeStamp"])
+        keep = ~np.isnan(t)
+
+        columns = {
+            name: table[name].to_numpy(zero_copy_only=False).astype(float)[keep]
+            for name in COLUMNS
+        }
+        return cls(t[keep], columns, max_gap_s, clock)
+
+    @classmethod
+    def load(cls, path, max_gap_s=DEFAULT_MAX_GAP_S):
+        """From packets.parquet, decoded_metadata.ndjson or decoded_metadata.json."""
+        if Path(path).suffix == ".parquet":
+            return cls.from_parquet(path, max_gap_s)
+        return cls.from_packets(load_packets(path), max_gap_s)
+
+    # ---------------- Lookup ----------------
+    def lookup(self, times):
+        """
+        Interpolate every column at `times` (seconds on the index clock).
+
+        Returns ({name: array}, valid) where valid is False for times more
+        than max_gap_s from the nearest sample. O(log n) per time.
+        """
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        n = len(self.t)
+        if n == 1:
+            lo = hi = np.zeros(len(times), dtype=np.intp)
+            w = np.zeros(len(times))
+        else:
+            hi = np.clip(np.searchsorted(self.t, times, side="right"), 1, n - 1)
+            lo = hi - 1
+            span = self.t[hi] - self.t[lo]
+            w = np.clip((times - self.t[lo]) / np.where(span > 0, span, 1), 0, 1)
+
+        gap = np.minimum(np.abs(times - self.t[lo]), np.abs(self.t[hi] - times))
+        valid = gap <= self.max_gap_s
+
+        values = {}
+        for name, col in self.columns.items():
+            a, b = col[lo], col[hi]
+            d = b - a
+            start = WRAPPED.get(name)
+            if start is not None:
+                d = (d + 180) % 360 - 180
+                values[name] = (a + w * d - start) % 360 + start
+            else:
+                values[name] = a + w * d
+        return values, valid
+
+    def sample(self, t):
+        """Metadata at one time as {name: float}, or None when out of range."""
+        values, valid = self.lookup(t)
+        if not valid[0]:
+            return None
+        return {name: float(v[0]) for name, v in values.items()}
+
+
+# ---------------- Projection ----------------
+def _homography(src, dst):
+    """3x3 H mapping 4 src points onto 4 dst points."""
+    a = np.zeros((8, 8))
+    b = np.zeros(8)
+    for i, ((x, y), (u, v)) in enumerate(zip(src, dst)):
+        a[2 * i] = (x, y, 1, 0, 0, 0, -u * x, -u * y)
+        a[2 * i + 1] = (0, 0, 0, x, y, 1, -v * x, -v * y)
+        b[2 * i], b[2 * i + 1] = u, v
+    return np.append(np.linalg.solve(a, b), 1.0).reshape(3, 3)
+
+
+def _corners(sample):
+    lat0, lon0 = sample["FrameCenterLatitude"], sample["FrameCenterLongitude"]
+    points = [(lon0 + sample[lon], lat0 + sample[lat]) for lat, lon in CORNERS]
+    return None if np.isnan(points).any() else points
+
+
+def _look_geometry(sample):
+    """
+    (slant range m, depression rad, bearing rad) of the line of sight.
+    From the sensor and frame centre positions when both are known, else
+    from the slant range and pointing angle tags.
+    """
+    lat0 = sample["FrameCenterLatitude"]
+    north = np.radians(lat0 - sample["SensorLatitude"]) * EARTH_RADIUS_M
+    east = (
+        np.radians(sample["FrameCenterLongitude"] - sample["SensorLongitude"])
+        * EARTH_RADIUS_M * np.cos(np.radians(lat0))
+    )
+    ground = np.hypot(north, east)
+    height = sample["SensorTrueAltitude"] - sample["FrameCenterElevation"]
+    if np.isfinite([ground, height]).all() and ground > 0:
+        return np.hypot(ground, height), np.arctan2(height, ground), np.arctan2(east, north)
+
+    return (
+        sample["SlantRange"],
+        np.radians(abs(sample["SensorRelativeElevationAngle"])),
+        np.radians(sample["PlatformHeadingAngle"] + sample["SensorRelativeAzimuthAngle"]),
+    )
+
+
+def geolocate(xyxy, frame_size, sample):
+    """
+    Project box centres (N x 4 pixel xyxy) to (lat, lon) arrays in degrees.
+
+    Uses the four ST 0601 corner points when present (corner 1 is top
+    left, clockwise), mapping pixels to ground with a homography.
+    Otherwise a flat-earth footprint around the frame centre is built
+    from the FOVs and the line of sight. NaN where the sample cannot place
+    the frame.
+    """
+    width, height = frame_size
+    xyxy = np.asarray(xyxy, dtype=float).reshape(-1, 4)
+    cx = (xyxy[:, 0] + xyxy[:, 2]) / 2
+    cy = (xyxy[:, 1] + xyxy[:, 3]) / 2
+
+    corners = _corners(sample)
+    if corners is not None:
+        h = _homography(((0, 0), (width, 0), (width, height), (0, height)), corners)
+        p = h @ np.vstack([cx, cy, np.ones_like(cx)])
+        return p[1] / p[2], p[0] / p[2]
+
+    lat0 = sample["FrameCenterLatitude"]
+    lon0 = sample["FrameCenterLongitude"]
+    hfov = np.radians(sample["SensorHorizontalFov"])
+    vfov = np.radians(sample["SensorVerticalFov"])
+    slant, depression, bearing = _look_geometry(sample)
+    if np.isnan([lat0, lon0, slant, hfov, vfov, depression, bearing]).any():
+        nan = np.full(len(cx), np.nan)
+        return nan, nan
+
+    # Ground extent of the frame; oblique views stretch along the look direction
+    ground_w = 2 * slant * np.tan(hfov / 2)
+    ground_h = 2 * slant * np.tan(vfov / 2) / max(np.sin(depression), 0.1)
+    right = (cx / width - 0.5) * ground_w
+    forward = (0.5 - cy / height) * ground_h
+
+    east = right * np.cos(bearing) + forward * np.sin(bearing)
+    north = forward * np.cos(bearing) - right * np.sin(bearing)
+    lat = lat0 + np.degrees(north / EARTH_RADIUS_M)
+    lon = lon0 + np.degrees(east / (EARTH_RADIUS_M * np.cos(np.radians(lat0))))
+    return lat, lon
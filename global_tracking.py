@@ -1,22 +1,112 @@
 ############################################################################
 ################################Using RTSP Stream input ####################
 
+import time
+from collections import deque
+from pathlib import Path
+
 import cv2
+import numpy as np
 import supervision as sv
-from rfdetr import RFDETRBase
 from rfdetr.util.coco_classes import COCO_CLASSES
 import torch
 
+from capture import DROP_OLDEST, FrameGrabber
+from geolocate import MetadataIndex, frame_origin, geolocate
+from inference_backends import EAGER, load_backend
+from propagation import StrideController, TrackPropagator
+from roi import DEFAULT_FULL_INTERVAL, RoiDetector, VmtiIndex
+from timing import timings
+from track_output import TrackRecordWriter
+from ts_demux import TsDemuxer
+
+
+def to_sv_detections(detections):
+    """RF-DETR output -> sv.Detections with COCO class names."""
+    sv_detections = sv.Detections(
+        xyxy=detections.xyxy,
+        confidence=detections.confidence,
+        class_id=detections.class_id
+    )
+
+    sv_detections.data["class_name"] = [
+        COCO_CLASSES[c] for c in detections.class_id
+    ]
+
+    return sv_detections
+
+
+def predict_frames(model, frames, confidence_threshold):
+    """Run RF-DETR on a list of BGR frames in one predict call."""
+    with timings.stage("color_convert", len(frames)):
+        rgb_frames = [cv2.cvtColor(f, cv2.COLOR_BGR2RGB) for f in frames]
+
+    with timings.stage("predict", len(frames)):
+        detections = model.predict(
+            rgb_frames if len(rgb_frames) > 1 else rgb_frames[0],
+            threshold=confidence_threshold
+        )
+
+    return detections if isinstance(detections, list) else [detections]
+
+
 class ObjectTracker:
     def __init__(
         self,
         rtsp_url: str,
         output_path: str,
-        confidence_threshold: float = 0.4
+        confidence_threshold: float = 0.4,
+        threaded_capture: bool = False,
+        queue_size: int = 4,
+        drop_policy: str = DROP_OLDEST,
+        batch_size: int = 1,
+        max_batch_delay_ms: float = 50.0,
+        adaptive_stride: bool = False,
+        max_stride: int = 8,
+        motion_threshold: float = 0.05,
+        headless: bool = False,
+        tracks_path: str = None,
+        backend: str = EAGER,
+        threads: int = None,
+        metadata_path: str = None,
+        metadata_offset_s: float = 0.0,
+        video_start_s: float = None,
+        vmti_path: str = None,
+        roi_full_interval: int = DEFAULT_FULL_INTERVAL,
     ):
         self.rtsp_url = rtsp_url
         self.output_path = output_path
         self.confidence_threshold = confidence_threshold
+        self.threaded_capture = threaded_capture
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        self.batch_size = batch_size
+        self.max_batch_delay_ms = max_batch_delay_ms
+        self.adaptive_stride = adaptive_stride
+        self.max_stride = max_stride
+        self.motion_threshold = motion_threshold
+        self.headless = headless
+        self.tracks_path = tracks_path
+        self.backend = backend
+        self.threads = threads
+        self.metadata_path = metadata_path
+        self.metadata_offset_s = metadata_offset_s
+        self.video_start_s = video_start_s
+        self.vmti_path = vmti_path
+        self.roi_full_interval = roi_full_interval
+
+        if adaptive_stride and vmti_path:
+            # Strided frames only run the detector on keyframes, one at a time,
+            # so there are no batches to tile; ROI would be silently ignored
+            raise ValueError("❌ adaptive_stride cannot be combined with vmti_path (ROI detection)")
+        if headless and not tracks_path:
+            # No video, no display and no records: the run would produce nothing
+            raise ValueError("❌ headless=True requires tracks_path")
+
+        if threads:
+            # Keep torch / OpenCV inside their share of the cores
+            torch.set_num_threads(threads)
+            cv2.setNumThreads(threads)
 
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"Using device: {self.device.upper()}")
@@ -27,12 +117,32 @@ class ObjectTracker:
         self.byte_tracker = None
         self.box_annotator = None
         self.label_annotator = None
+        self.grabber = None
+        self.track_writer = None
+        self.metadata = None
+        self._metadata_origin = None
+        self._video_pts = None
+        self.roi = None
+        self._read_count = 0
+        self.propagator = None
+        self.stride_controller = None
+        self._frame_index = 0
+        self._last_keyframe = None
+
+        self.frames_processed = 0
+        self.latencies = deque(maxlen=1000)
 
     # ------------------------------------------------------
     # Model Initialization
     # ------------------------------------------------------
     def load_model(self):
-        self.model = RFDETRBase()
+        # Static int8 calibrates on the first frames of the stream itself
+        self.model = load_backend(
+            self.backend,
+            calibration_source=self.rtsp_url,
+            batch_size=self.batch_size,
+            threads=self.threads,
+        )
 
     # ------------------------------------------------------
     # Stream Setup
@@ -48,6 +158,42 @@ class ObjectTracker:
         self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
+        if self.threaded_capture:
+            self.grabber = FrameGrabber(
+                self.cap,
+                queue_size=self.queue_size,
+                drop_policy=self.drop_policy,
+            ).start()
+
+        if self.metadata_path or self.vmti_path or self.tracks_path:
+            self._video_pts = self._probe_video_pts()
+
+        if self.metadata_path:
+            self.metadata = MetadataIndex.load(self.metadata_path)
+            self._metadata_origin = self._time_origin(self.metadata, "ST 0601")
+            print(f"✔ Indexed {len(self.metadata)} ST 0601 packets for geolocation")
+
+        if self.vmti_path:
+            vmti = VmtiIndex.load(self.vmti_path, frame_size=(self.width, self.height))
+            self.roi = RoiDetector(
+                vmti,
+                full_interval=self.roi_full_interval,
+                time_origin_s=self._time_origin(vmti, "VMTI"),
+            )
+            print(f"✔ Indexed {len(vmti)} VMTI packets for ROI detection")
+
+        if self.tracks_path:
+            self.track_writer = TrackRecordWriter(
+                self.tracks_path,
+                geolocated=self.metadata is not None,
+                frame_size=(self.width, self.height),
+                video_start_pts=self._video_pts,
+            )
+
+        # Headless runs only produce track records: no encode, no display
+        if self.headless:
+            return
+
         fourcc = cv2.VideoWriter_fourcc(*"mp4v")
         self.writer = cv2.VideoWriter(
             self.output_path,
@@ -56,12 +202,37 @@ class ObjectTracker:
             (self.width, self.height)
         )
 
+    def _probe_video_pts(self):
+        """First video PTS of a local MPEG-TS input, else None."""
+        if not Path(self.rtsp_url).is_file():
+            return None
+        try:
+            with TsDemuxer(self.rtsp_url) as demuxer:
+                return demuxer.first_video_pts()
+        except ValueError:
+            # Not MPEG-TS
+            return None
+
+    def _time_origin(self, index, name):
+        """Time of frame 0 on the clock of a metadata index (geolocate.frame_origin)."""
+        return frame_origin(
+            index, self.video_start_s, self._video_pts, self.metadata_offset_s, name
+        )
+
     # ------------------------------------------------------
     # Tracking + Annotation Setup
     # ------------------------------------------------------
     def setup_tracking(self):
         self.byte_tracker = sv.ByteTrack()
 
+        if self.adaptive_stride:
+            self.propagator = TrackPropagator()
+            self.stride_controller = StrideController(
+                self.fps,
+                max_stride=self.max_stride,
+                motion_threshold=self.motion_threshold,
+            )
+
         self.box_annotator = sv.BoxAnnotator(
             color=sv.ColorPalette.ROBOFLOW,
             thickness=2
@@ -71,26 +242,14 @@ class ObjectTracker:
     # ------------------------------------------------------
     # Frame Processing
     # ------------------------------------------------------
-    def process_frame(self, frame):
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        detections = self.model.predict(
-            rgb_frame,
-            threshold=self.confidence_threshold
-        )
-
-        sv_detections = sv.Detections(
-            xyxy=detections.xyxy,
-            confidence=detections.confidence,
-            class_id=detections.class_id
-        )
-
-        sv_detections.data["class_name"] = [
-            COCO_CLASSES[c] for c in detections.class_id
-        ]
+    def predict_batch(self, frames):
+        return predict_frames(self.model, frames, self.confidence_threshold)
 
-        tracked = self.byte_tracker.update_with_detections(sv_detections)
+    def track(self, detections):
+        with timings.stage("track"):
+            return self.byte_tracker.update_with_detections(to_sv_detections(detections))
 
+    def annotate(self, frame, tracked):
         labels = [
             f"ID {track_id} | {name} {conf:.2f}"
             for track_id, name, conf in zip(
@@ -100,44 +259,202 @@ class ObjectTracker:
             )
         ]
 
-        annotated = self.box_annotator.annotate(frame.copy(), tracked)
-        annotated = self.label_annotator.annotate(
-            annotated, tracked, labels
-        )
+        with timings.stage("annotate"):
+            annotated = self.box_annotator.annotate(frame.copy(), tracked)
+            annotated = self.label_annotator.annotate(
+                annotated, tracked, labels
+            )
 
         return annotated
 
+    def process_frame(self, frame):
+        return self.annotate(frame, self.track_batch([frame])[0])
+
+    def process_batch(self, frames):
+        return [
+            self.annotate(frame, tracked)
+            for frame, tracked in zip(frames, self.track_batch(frames))
+        ]
+
+    def track_batch(self, frames, indices=None):
+        """
+        Detect and track a list of frames. Returns tracked detections.
+        In ROI mode (vmti_path set) indices place each frame in time so
+        the detector can run on tiles around the VMTI targets instead.
+        """
+        if self.adaptive_stride:
+            if indices is None:
+                return [self.track_strided(frame) for frame in frames]
+            return [self.track_strided(frame, index) for frame, index in zip(frames, indices)]
+
+        if self.roi is not None and indices is not None:
+            detections = self.roi.detect(frames, indices, self.fps, self.predict_batch)
+        else:
+            detections = self.predict_batch(frames)
+
+        # ByteTrack is updated strictly in frame order
+        return [self.track(d) for d in detections]
+
+    def track_strided(self, frame, index=None):
+        """
+        Run the detector every K frames and carry tracks forward with the
+        constant-velocity propagator in between; K adapts to inference time
+        and scene motion. index is the capture index of the frame (gaps
+        are frames the grabber dropped); without it frames are counted here.
+        """
+        if index is None:
+            index = self._frame_index
+        self._frame_index = index + 1
+
+        stride = self.stride_controller.stride
+        if self._last_keyframe is None or index - self._last_keyframe >= stride:
+            t0 = time.perf_counter()
+            tracked = self.track(self.predict_batch([frame])[0])
+            self.propagator.update(tracked, index)
+            self.stride_controller.update(
+                time.perf_counter() - t0, self.propagator.motion()
+            )
+            self._last_keyframe = index
+        else:
+            tracked = self.propagator.predict(index)
+
+        return tracked
+
+    # ------------------------------------------------------
+    # Frame Input + Stats
+    # ------------------------------------------------------
+    def read_frame(self, timeout=None):
+        """
+        Return (ok, frame, frame_index, captured_at) from the grabber or
+        the capture. frame_index counts frames read from the source,
+        including any the grabber dropped.
+        """
+        if self.grabber:
+            return self.grabber.read(timeout=timeout)
+
+        with timings.stage("capture"):
+            ret, frame = self.cap.read()
+        index = self._read_count
+        self._read_count += 1
+        return ret, frame, index, time.perf_counter()
+
+    def collect_batch(self):
+        """
+        Collect up to batch_size frames, stopping early once the oldest
+        frame has waited max_batch_delay_ms. Returns (frames, indices,
+        captured_at, ended).
+        """
+        ret, frame, index, captured_at = self.read_frame()
+        if not ret:
+            return [], [], [], True
+
+        frames, indices, stamps = [frame], [index], [captured_at]
+        deadline = captured_at + self.max_batch_delay_ms / 1000
+
+        while len(frames) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            ret, frame, index, captured_at = self.read_frame(timeout=remaining)
+            if not ret:
+                # Timed out on a live stream, or the stream ended
+                ended = self.grabber is None or self.grabber.ended
+                return frames, indices, stamps, ended
+            frames.append(frame)
+            indices.append(index)
+            stamps.append(captured_at)
+
+        return frames, indices, stamps, False
+
+    @property
+    def dropped_frames(self):
+        return self.grabber.dropped if self.grabber else 0
+
+    def stats(self):
+        latencies = np.asarray(self.latencies)
+        stats = {
+            "frames_processed": self.frames_processed,
+            "dropped_frames": self.dropped_frames,
+            "latency_p50_ms": float(np.percentile(latencies, 50) * 1000) if len(latencies) else None,
+            "latency_p95_ms": float(np.percentile(latencies, 95) * 1000) if len(latencies) else None,
+        }
+        if self.roi is not None:
+            stats.update(self.roi.stats())
+        return stats
+
+    def geolocate_batch(self, indices, tracked_batch):
+        """
+        Add per-detection "lat" / "lon" (NaN without metadata) from the
+        ST 0601 sample interpolated at each frame's time on the metadata
+        clock (see _time_origin).
+        """
+        with timings.stage("geolocate", len(indices)):
+            times = self._metadata_origin + np.asarray(indices, dtype=float) / self.fps
+            values, valid = self.metadata.lookup(times)
+            for j, tracked in enumerate(tracked_batch):
+                if valid[j] and len(tracked):
+                    sample = {name: v[j] for name, v in values.items()}
+                    lat, lon = geolocate(tracked.xyxy, (self.width, self.height), sample)
+                else:
+                    lat = lon = np.full(len(tracked), np.nan)
+                tracked.data["lat"] = lat
+                tracked.data["lon"] = lon
+
     # ------------------------------------------------------
     # Main Processing Loop
     # ------------------------------------------------------
     def run(self):
         print("🚀 Starting RTSP stream processing...")
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:
+        stop = False
+        while not stop:
+            frames, indices, stamps, ended = self.collect_batch()
+            tracked_batch = self.track_batch(frames, indices) if frames else []
+            if self.metadata is not None and frames:
+                self.geolocate_batch(indices, tracked_batch)
+
+            for frame, index, captured_at, tracked in zip(frames, indices, stamps, tracked_batch):
+                if self.track_writer:
+                    self.track_writer.write(index, index / self.fps, tracked)
+
+                if not self.headless:
+                    annotated_frame = self.annotate(frame, tracked)
+                    with timings.stage("write"):
+                        self.writer.write(annotated_frame)
+                    with timings.stage("display"):
+                        cv2.imshow("Stream", annotated_frame)
+
+                self.frames_processed += 1
+                self.latencies.append(time.perf_counter() - captured_at)
+
+                if not self.headless and cv2.waitKey(1) & 0xFF == ord("q"):
+                    stop = True
+                    break
+
+            timings.maybe_log()
+            if ended:
                 print("⚠️ RTSP stream ended or frame drop")
                 break
 
-            annotated_frame = self.process_frame(frame)
-
-            self.writer.write(annotated_frame)
-            cv2.imshow("Stream", annotated_frame)
-
-            if cv2.waitKey(1) & 0xFF == ord("q"):
-                break
-
         self.cleanup()
 
     # ------------------------------------------------------
     # Cleanup
     # ------------------------------------------------------
     def cleanup(self):
-        if self.cap:
+        # A started grabber releases the capture from its own thread
+        if self.grabber:
+            self.grabber.stop()
+        elif self.cap:
             self.cap.release()
         if self.writer:
             self.writer.release()
+        if self.track_writer:
+            self.track_writer.close()
 
-        cv2.destroyAllWindows()
+        if not self.headless:
+            cv2.destroyAllWindows()
+        timings.log()
+        print(f"📊 {self.stats()}")
         print("🎉 RTSP stream processing completed")
 
 if __name__ == "__main__":
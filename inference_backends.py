@@ -0,0 +1,332 @@
+# inference_backends.py
+# Selectable RF-DETR inference backends for CPU: eager PyTorch, the
+# TorchScript-traced model, and ONNX Runtime in FP32 or int8. Every backend
+# exposes the RFDETRBase predict(images, threshold) signature so
+# ObjectTracker can use any of them. Exported / quantized ONNX models are
+# cached on disk and reused across runs.
+import argparse
+import importlib.metadata
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import supervision as sv
+from rfdetr import RFDETRBase
+
+EAGER = "eager"
+COMPILED = "compiled"
+ONNX = "onnx"
+ONNX_INT8_DYNAMIC = "onnx-int8-dynamic"
+ONNX_INT8_STATIC = "onnx-int8-static"
+BACKENDS = (EAGER, COMPILED, ONNX, ONNX_INT8_DYNAMIC, ONNX_INT8_STATIC)
+
+DEFAULT_MODEL_DIR = os.environ.get("RFDETR_MODEL_DIR", ".model_cache")
+
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+NUM_SELECT = 300
+
+
+# ---------------- Torch backends ----------------
+class TorchBackend:
+    """
+    RFDETRBase in eager mode, or traced/compiled for inference. The traced
+    graph only accepts batch_size images, so calls with fewer (single
+    frames, the last partial batch of a stream) are padded to batch_size
+    and longer lists are split.
+    """
+
+    def __init__(self, compiled=False, batch_size=1):
+        self.name = COMPILED if compiled else EAGER
+        self.batch_size = batch_size if compiled else 1
+        self.model = RFDETRBase()
+        if compiled:
+            # Renamed to inference() in newer rfdetr releases
+            optimize = getattr(self.model, "optimize_for_inference", None) or self.model.inference
+            optimize(compile=True, batch_size=batch_size)
+
+    def predict(self, images, threshold=0.5):
+        if self.batch_size == 1:
+            return self.model.predict(images, threshold=threshold)
+
+        single = not isinstance(images, list)
+        images = [images] if single else images
+        detections = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            padded = chunk + [chunk[-1]] * (self.batch_size - len(chunk))
+            detections.extend(self.model.predict(padded, threshold=threshold)[:len(chunk)])
+        return detections[0] if single else detections
+
+
+# ---------------- ONNX Runtime backend ----------------
+class OnnxBackend:
+    """
+    Runs an exported RF-DETR graph with ONNX Runtime on CPU. Pre- and
+    post-processing follow RFDETRBase.predict: bilinear resize to the model
+    resolution, ImageNet normalisation, sigmoid scores and top-300
+    query/class pairs. A batch runs in one session call; graphs exported
+    with a fixed batch axis get partial batches padded like TorchBackend.
+    """
+
+    def __init__(self, model_path, name=ONNX, threads=None):
+        # Optional dependency: only the ONNX backends need onnxruntime
+        import onnxruntime as ort
+
+        self.name = name
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        batch, _, self.height, self.width = inp.shape
+        # None when the batch axis is dynamic (a symbolic name)
+        self.batch_size = batch if isinstance(batch, int) else None
+        names = [out.name for out in self.session.get_outputs()]
+        self.boxes_idx = next(i for i, n in enumerate(names) if "dets" in n)
+        self.logits_idx = next(i for i, n in enumerate(names) if "labels" in n)
+
+    def preprocess(self, image):
+        resized = cv2.resize(image, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+        x = (resized.astype(np.float32) / 255.0 - IMAGENET_MEAN) / IMAGENET_STD
+        return x.transpose(2, 0, 1)[None]
+
+    def decode(self, boxes, logits, image_shape, threshold):
+        h, w = image_shape[:2]
+        scores = 1.0 / (1.0 + np.exp(-logits))
+        flat = scores.reshape(-1)
+        k = min(NUM_SELECT, flat.size)
+        top = np.argpartition(flat, -k)[-k:]
+        top = top[flat[top] > threshold]
+
+        num_classes = logits.shape[1]
+        cx, cy, bw, bh = boxes[top // num_classes].T
+        xyxy = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+        return sv.Detections(
+            xyxy=xyxy * np.array([w, h, w, h], dtype=np.float32),
+            confidence=flat[top],
+            class_id=(top % num_classes).astype(int),
+        )
+
+    def preprocess_batch(self, images):
+        """(N, 3, H, W) input, padded with the last image to a fixed batch size."""
+        if self.batch_size:
+            images = images + [images[-1]] * (self.batch_size - len(images))
+        return np.concatenate([self.preprocess(image) for image in images])
+
+    def predict(self, images, threshold=0.5):
+        single = not isinstance(images, list)
+        images = [images] if single else images
+
+        detections = []
+        step = self.batch_size or len(images)
+        for start in range(0, len(images), step):
+            chunk = images[start:start + step]
+            outputs = self.session.run(None, {self.input_name: self.preprocess_batch(chunk)})
+            boxes, logits = outputs[self.boxes_idx], outputs[self.logits_idx]
+            detections.extend(
+                self.decode(boxes[i], logits[i], image.shape, threshold)
+                for i, image in enumerate(chunk)
+            )
+
+        return detections[0] if single else detections
+
+
+def calibration_reader(backend, frames):
+    """CalibrationDataReader feeding preprocessed frames to quantize_static."""
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class FrameCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            step = backend.batch_size or 1
+            self._inputs = iter(
+                {backend.input_name: backend.preprocess_batch(frames[start:start + step])}
+                for start in range(0, len(frames), step)
+            )
+
+        def get_next(self):
+            return next(self._inputs, None)
+
+    return FrameCalibrationReader()
+
+
+# ---------------- Export + cache ----------------
+def model_dir(root=DEFAULT_MODEL_DIR):
+    """Cache directory for exported models of the installed rfdetr version."""
+    path = Path(root) / f"rfdetr-base-{importlib.metadata.version('rfdetr')}"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def export_onnx(root=DEFAULT_MODEL_DIR, batch_size=1):
+    """Export RFDETRBase to FP32 ONNX for batch_size frames once; later calls reuse the file."""
+    path = model_dir(root) / f"fp32-b{batch_size}.onnx"
+    if path.exists():
+        return path
+
+    print(f"⏳ Exporting RF-DETR to ONNX (batch size {batch_size})...")
+    with tempfile.TemporaryDirectory() as tmp:
+        exported = RFDETRBase().export(output_dir=tmp, batch_size=batch_size)
+        # Older releases return None and write inference_model.onnx
+        exported = Path(exported) if exported else next(Path(tmp).glob("*.onnx"))
+        shutil.move(str(exported), path)
+
+    print(f"✔ ONNX model cached at {path}")
+    return path
+
+
+def quantize_onnx(static=False, calibration_frames=None, root=DEFAULT_MODEL_DIR, batch_size=1):
+    """Quantize the cached FP32 model to int8 (dynamic or static)."""
+    fp32 = export_onnx(root, batch_size)
+    kind = "static" if static else "dynamic"
+    path = model_dir(root) / f"int8-{kind}-b{batch_size}.onnx"
+    if path.exists():
+        return path
+
+    # Optional dependency (onnxruntime + onnx), only needed to build the int8 models
+    from onnxruntime.quantization import QuantType, quantize_dynamic, quantize_static
+
+    if static:
+        if not calibration_frames:
+            raise ValueError("❌ Static int8 quantization needs calibration frames")
+        reader = calibration_reader(OnnxBackend(fp32), calibration_frames)
+        quantize_static(
+            str(fp32), str(path), reader,
+            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+        )
+    else:
+        quantize_dynamic(str(fp32), str(path), weight_type=QuantType.QInt8)
+
+    print(f"✔ int8 model cached at {path}")
+    return path
+
+
+def read_frames(source, count=32):
+    """First `count` RGB frames of a video file or stream (for calibration)."""
+    cap = cv2.VideoCapture(source)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    cap.release()
+    return frames
+
+
+def load_backend(name=EAGER, root=DEFAULT_MODEL_DIR, calibration_source=None,
+                 batch_size=1, threads=None, warmup=3):
+    """Build the named backend and run `warmup` dummy inferences."""
+    if name not in BACKENDS:
+        raise ValueError(f"❌ Unknown inference backend: {name} (choose from {', '.join(BACKENDS)})")
+
+    if name in (EAGER, COMPILED):
+        backend = TorchBackend(compiled=name == COMPILED, batch_size=batch_size)
+    elif name == ONNX:
+        backend = OnnxBackend(export_onnx(root, batch_size), name, threads)
+    else:
+        static = name == ONNX_INT8_STATIC
+        frames = read_frames(calibration_source) if static and calibration_source else None
+        backend = OnnxBackend(quantize_onnx(static, frames, root, batch_size), name, threads)
+
+    warm_up(backend, warmup)
+    return backend
+
+
+def warm_up(backend, iterations=3, shape=(480, 640, 3)):
+    """Run dummy frames so first-call allocation/JIT is not in the stream."""
+    if iterations <= 0:
+        return 0.0
+    dummy = np.zeros(shape, dtype=np.uint8)
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        backend.predict(dummy, threshold=0.5)
+    elapsed = time.perf_counter() - t0
+    print(f"🔥 Warmed up {backend.name} in {elapsed:.2f}s")
+    return elapsed
+
+
+# ---------------- Comparison ----------------
+def box_iou(a, b):
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def agreement(reference, candidate, iou_threshold=0.5):
+    """F1 of candidate detections against the reference (same class, IoU)."""
+    if not len(reference) and not len(candidate):
+        return 1.0
+    if not len(reference) or not len(candidate):
+        return 0.0
+
+    iou = box_iou(reference.xyxy, candidate.xyxy)
+    iou[reference.class_id[:, None] != candidate.class_id[None, :]] = 0.0
+
+    matched = 0
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < iou_threshold:
+            break
+        matched += 1
+        iou[i, :] = 0.0
+        iou[:, j] = 0.0
+
+    return 2 * matched / (len(reference) + len(candidate))
+
+
+def compare_backends(frames, names=BACKENDS, threshold=0.4, root=DEFAULT_MODEL_DIR,
+                     calibration_source=None):
+    """Frames/s of each backend and mean detection agreement with eager."""
+    results = {}
+    reference = None
+
+    for name in [EAGER] + [n for n in names if n != EAGER]:
+        backend = load_backend(name, root, calibration_source)
+
+        t0 = time.perf_counter()
+        detections = [backend.predict(frame, threshold=threshold) for frame in frames]
+        elapsed = time.perf_counter() - t0
+
+        if reference is None:
+            reference = detections
+        results[name] = {
+            "fps": len(frames) / elapsed,
+            "agreement": float(np.mean([agreement(r, d) for r, d in zip(reference, detections)])),
+        }
+        print(f"📊 {name}: {results[name]['fps']:.2f} fps, agreement {results[name]['agreement']:.3f}")
+        del backend
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare RF-DETR CPU inference backends")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--threshold", type=float, default=0.4)
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    args = parser.parse_args()
+
+    compare_backends(
+        read_frames(args.video, args.frames),
+        args.backends,
+        threshold=args.threshold,
+        root=args.model_dir,
+        calibration_source=args.video,
+    )
@@ -0,0 +1,127 @@
+# isr_concurrent.py
+# Runs the metadata branch (extract + jMISB decode) and the video branch
+# (RF-DETR + ByteTrack) of the ISR pipeline at the same time. The decode
+# branch runs in its own process, pinned to its share of the cores with
+# the JVM told how many it has; torch / OpenCV get the rest, so wall time
+# approaches the longer branch instead of the sum.
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from decode import JmisbDecoder
+from extract_decode import extract_klv
+from fast_decode import FastKlvDecoder
+from output import write_decoded
+
+
+def split_cores(decode_cores=None, total=None):
+    """
+    Return (decode_cpus, detect_cpus) as lists of CPU ids. By default the
+    decoder gets a quarter of the cores (at least one); jMISB parsing is
+    mostly single-threaded while inference scales with threads.
+    """
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") \
+        else list(range(os.cpu_count()))
+    if total:
+        cpus = cpus[:total]
+    if len(cpus) == 1:
+        return cpus, cpus
+
+    n = decode_cores or max(1, len(cpus) // 4)
+    n = min(n, len(cpus) - 1)
+    return cpus[:n], cpus[n:]
+
+
+def _pin(cpus):
+    """Pin this process to cpus; returns the previous set (None if unsupported)."""
+    # CPU affinity is Linux-only; elsewhere only thread counts are limited
+    if not hasattr(os, "sched_setaffinity"):
+        return None
+    previous = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, cpus)
+    return previous
+
+
+# ---------------- Metadata branch (child process) ----------------
+def _metadata_branch(ts_path, jars, output_dir, cpus, demuxer, fast, streaming):
+    _pin(cpus)
+    t0 = time.perf_counter()
+
+    decoder = JmisbDecoder(jars, jvm_args=[f"-XX:ActiveProcessorCount={len(cpus)}"])
+    if fast:
+        decoder = FastKlvDecoder(fallback=decoder)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    klv_path = output_dir / "metadata.klv"
+    extract_klv(ts_path, klv_path, demuxer)
+
+    decoder.start_jvm()
+    output = write_decoded(decoder, klv_path, output_dir, streaming=streaming)
+    decoder.shutdown_jvm()
+
+    return {"klv_path": str(klv_path), "decoded_path": output, "wall_s": time.perf_counter() - t0}
+
+
+# ---------------- Both branches ----------------
+def run_concurrent(
+    ts_path,
+    jars,
+    output_dir,
+    rtsp_url,
+    output_path,
+    confidence_threshold=0.4,
+    decode_cores=None,
+    demuxer="ffmpeg",
+    fast=False,
+    streaming=False,
+    tracker_options=None,
+):
+    """
+    Decode ts_path and track rtsp_url concurrently. The tracker runs in
+    this process (OpenCV windows need the main thread). Returns a dict of
+    output paths and per-branch / total wall times.
+    """
+    # Imported here so the spawned decode process never loads torch
+    from global_tracking import ObjectTracker
+
+    decode_cpus, detect_cpus = split_cores(decode_cores)
+    print(f"⚙️ Decoder on {len(decode_cpus)} cores, detector on {len(detect_cpus)} cores")
+
+    started = time.perf_counter()
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        metadata = pool.submit(
+            _metadata_branch, ts_path, jars, str(output_dir), decode_cpus, demuxer, fast, streaming
+        )
+
+        previous = _pin(detect_cpus)
+        try:
+            tracker = ObjectTracker(
+                rtsp_url=rtsp_url,
+                output_path=output_path,
+                confidence_threshold=confidence_threshold,
+                threads=len(detect_cpus),
+                **(tracker_options or {}),
+            )
+            tracker.load_model()
+            tracker.setup_stream()
+            tracker.setup_tracking()
+            tracker.run()
+        finally:
+            if previous:
+                _pin(previous)
+        detect_s = time.perf_counter() - started
+
+        result = metadata.result()
+
+    result["detect_wall_s"] = detect_s
+    result["decode_wall_s"] = result.pop("wall_s")
+    result["total_wall_s"] = time.perf_counter() - started
+    print(
+        f"🎉 Decode {result['decode_wall_s']:.1f}s, detect {detect_s:.1f}s, "
+        f"total {result['total_wall_s']:.1f}s"
+    )
+    return result
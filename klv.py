@@ -0,0 +1,251 @@
+# klv.py
+# Pure-Python KLV framing helpers (SMPTE 336M Universal Label keys + BER lengths).
+# These only locate packet boundaries; decoding is left to JmisbDecoder.
+import mmap
+
+UL_KEY_LENGTH = 16
+UL_PREFIX = b"\x06\x0e\x2b\x34"
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+# ---------------- BER ----------------
+def read_ber_length(buf, offset):
+    """
+    Read a BER length starting at offset.
+
+    Returns (length, header_size) or None if buf does not hold the full
+    length field yet.
+    """
+    if offset >= len(buf):
+        return None
+
+    first = buf[offset]
+    if first < 0x80:
+        return first, 1
+
+    n = first & 0x7F
+    if offset + 1 + n > len(buf):
+        return None
+
+    return int.from_bytes(buf[offset + 1:offset + 1 + n], "big"), 1 + n
+
+
+def ber_length(n):
+    """Encode n as a BER length (short form below 128)."""
+    if n < 0x80:
+        return bytes([n])
+    size = (n.bit_length() + 7) // 8
+    return bytes([0x80 | size]) + n.to_bytes(size, "big")
+
+
+def frame_at(buf, offset):
+    """
+    Return (value_offset, total_size) of the packet starting at offset,
+    or None if the packet is not complete in buf.
+    """
+    ber = read_ber_length(buf, offset + UL_KEY_LENGTH)
+    if ber is None:
+        return None
+
+    length, header = ber
+    value_offset = offset + UL_KEY_LENGTH + header
+    total = UL_KEY_LENGTH + header + length
+    if offset + total > len(buf):
+        return None
+    return value_offset, total
+
+
+# ---------------- Checksums ----------------
+def st0601_checksum(data):
+    """ST 0601 running 16-bit sum over key..checksum length."""
+    bcc = 0
+    for i, b in enumerate(data):
+        bcc += b << (8 * ((i + 1) % 2))
+    return bcc & 0xFFFF
+
+
+def _crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        table.append(crc & 0xFFFF)
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+
+
+def crc16_ccitt(data):
+    """ST 0903 checksum (CRC-16-CCITT, init 0xFFFF)."""
+    crc = 0xFFFF
+    for b in data:
+        crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABLE[(crc >> 8) ^ b]
+    return crc
+
+
+# ---------------- Framing ----------------
+def scan_klv_frames(buf, start=0, end=None):
+    """
+    Yield (offset, size) for every complete KLV packet in buf[start:end].
+
+    buf can be bytes, bytearray or mmap. Bytes that do not start with a
+    Universal Label are skipped until the next UL prefix.
+    """
+    end = len(buf) if end is None else end
+    pos = start
+
+    while pos + UL_KEY_LENGTH < end:
+        if buf[pos:pos + 4] != UL_PREFIX:
+            pos = buf.find(UL_PREFIX, pos + 1, end)
+            if pos < 0:
+                break
+            continue
+
+        frame = frame_at(buf, pos)
+        if frame is None or pos + frame[1] > end:
+            break
+
+        yield pos, frame[1]
+        pos += frame[1]
+
+
+def iter_klv_frames(fileobj, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Read fileobj in bounded chunks and yield one complete KLV packet
+    (key + length + value) at a time as bytes.
+
+    Memory stays bounded by chunk_size plus the largest single packet.
+    """
+    buf = bytearray()
+    eof = False
+
+    while True:
+        pos = 0
+        for offset, size in scan_klv_frames(buf):
+            yield bytes(buf[offset:offset + size])
+            pos = offset + size
+
+        if pos:
+            del buf[:pos]
+        elif len(buf) > UL_KEY_LENGTH:
+            # No complete packet: drop leading garbage up to the next UL
+            nxt = buf.find(UL_PREFIX)
+            if nxt > 0:
+                del buf[:nxt]
+            elif nxt < 0:
+                del buf[:len(buf) - len(UL_PREFIX) + 1]
+
+        if eof:
+            break
+
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            eof = True
+            continue
+        buf += chunk
+
+
+# ---------------- Memory-mapped input ----------------
+class MappedKlvFile:
+    """
+    Read-only memory map of a .klv file, framed in place.
+
+    frames() and batches() yield memoryview slices of the map, so no part
+    of the file is copied into Python bytes. Pages behind each slice are
+    dropped from the process once the caller moves past it, keeping the
+    resident set at roughly one batch. Slices must not be kept beyond the
+    iteration; the map and file are closed on exit.
+    """
+
+    def __init__(self, klv_path):
+        self.klv_path = klv_path
+        self._file = None
+        self._mm = None
+        self._view = None
+        self._released = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        self._file = open(self.klv_path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._view = memoryview(b"")
+            return
+        if hasattr(self._mm, "madvise"):
+            self._mm.madvise(mmap.MADV_SEQUENTIAL)
+        self._view = memoryview(self._mm)
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # A slice escaped (e.g. an exception mid-batch); the map
+                # is unmapped when that slice is collected
+                pass
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return len(self._view)
+
+    def _release(self, upto):
+        """Drop mapped pages wholly before offset upto from the resident set."""
+        if self._mm is None or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        end = upto - upto % mmap.PAGESIZE
+        if end > self._released:
+            self._mm.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+            self._released = end
+
+    # ---------------- Framing ----------------
+    def frames(self):
+        """Yield one memoryview per complete KLV packet."""
+        for offset, size in self._scan():
+            yield self._view[offset:offset + size]
+            self._release(offset)
+
+    def batches(self, max_bytes=DEFAULT_CHUNK_SIZE):
+        """
+        Yield memoryviews of consecutive whole packets, each at most
+        max_bytes unless a single packet is larger. Bytes between packets
+        that are not KLV are left out.
+        """
+        start = end = None
+        for offset, size in self._scan():
+            if start is not None and (offset != end or offset + size - start > max_bytes):
+                yield self._view[start:end]
+                self._release(end)
+                start = None
+            if start is None:
+                start = offset
+            end = offset + size
+        if start is not None:
+            yield self._view[start:end]
+
+    @staticmethod
+    def release(frames):
+        """Release slices handed out by frames() once they are decoded."""
+        for frame in frames:
+            frame.release()
+
+    def _scan(self):
+        if self._mm is None:
+            return iter(())
+        return scan_klv_frames(self._mm)
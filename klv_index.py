@@ -0,0 +1,181 @@
+# klv_index.py
+# Binary sidecar index (<file>.klv.idx) for random-access metadata queries.
+# One record per packet: byte offset, length, packet type and Precision
+# Time Stamp, so a time window can be decoded without touching the rest.
+import mmap
+import os
+from pathlib import Path
+
+import numpy as np
+
+from fast_decode import ST0601_KEY, ST0903_KEY, iter_local_set
+from klv import UL_KEY_LENGTH, read_ber_length, scan_klv_frames
+
+INDEX_MAGIC = b"KLVIDX01"
+INDEX_SUFFIX = ".idx"
+
+TYPE_UNKNOWN = 0
+TYPE_ST0601 = 1
+TYPE_ST0903 = 2
+
+PRECISION_TIME_STAMP_TAG = 2
+NO_TIMESTAMP = 0
+
+INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("type", "u1"),
+    ("timestamp", "<u8"),
+])
+
+# magic, source size, source mtime_ns, record count
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("size", "<u8"),
+    ("mtime_ns", "<u8"),
+    ("count", "<u8"),
+])
+
+_TYPES = {
+    ST0601_KEY: TYPE_ST0601,
+    ST0903_KEY: TYPE_ST0903,
+}
+
+
+def _packet_timestamp(buf, offset, size):
+    _, header = read_ber_length(buf, offset + UL_KEY_LENGTH)
+    start = offset + UL_KEY_LENGTH + header
+    for tag, vs, ve in iter_local_set(buf, start, offset + size):
+        if tag == PRECISION_TIME_STAMP_TAG:
+            return int.from_bytes(buf[vs:ve], "big")
+    return NO_TIMESTAMP
+
+
+class KlvIndex:
+    """
+    Packet index of a .klv file.
+
+    Time queries use binary search over the timestamps (microseconds since
+    the epoch, as in the ST 0601 / ST 0903 Precision Time Stamp); packets
+    without a timestamp are only reachable by index range.
+    """
+
+    def __init__(self, klv_path, records):
+        self.klv_path = str(klv_path)
+        self.records = records
+
+        timestamps = records["timestamp"]
+        timed = np.flatnonzero(timestamps != NO_TIMESTAMP)
+        order = np.argsort(timestamps[timed], kind="stable")
+        self._by_time = timed[order]
+        self._sorted_ts = timestamps[self._by_time]
+
+    def __len__(self):
+        return len(self.records)
+
+    # ---------------- Build / persist ----------------
+    @classmethod
+    def build(cls, klv_path):
+        with open(klv_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls(klv_path, np.zeros(0, dtype=INDEX_DTYPE))
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                rows = []
+                for offset, size in scan_klv_frames(mm):
+                    key = mm[offset:offset + UL_KEY_LENGTH]
+                    ptype = _TYPES.get(key, TYPE_UNKNOWN)
+                    ts = NO_TIMESTAMP
+                    if ptype != TYPE_UNKNOWN:
+                        ts = _packet_timestamp(mm, offset, size)
+                    rows.append((offset, size, ptype, ts))
+
+        return cls(klv_path, np.array(rows, dtype=INDEX_DTYPE))
+
+    @staticmethod
+    def sidecar_path(klv_path):
+        return Path(str(klv_path) + INDEX_SUFFIX)
+
+    def save(self, path=None):
+        path = path or self.sidecar_path(self.klv_path)
+        st = os.stat(self.klv_path)
+        header = np.array(
+            [(INDEX_MAGIC, st.st_size, st.st_mtime_ns, len(self.records))],
+            dtype=HEADER_DTYPE,
+        )
+        with open(path, "wb") as f:
+            f.write(header.tobytes())
+            f.write(self.records.tobytes())
+        return str(path)
+
+    @classmethod
+    def load(cls, klv_path, rebuild=True):
+        """
+        Load the sidecar index of klv_path. A missing, stale or truncated
+        sidecar is rebuilt and saved when rebuild is True.
+        """
+        path = cls.sidecar_path(klv_path)
+        records = cls._read_sidecar(path, klv_path) if path.exists() else None
+        if records is not None:
+            return cls(klv_path, records)
+
+        if not rebuild:
+            raise FileNotFoundError(f"❌ No up-to-date index for {klv_path}")
+
+        index = cls.build(klv_path)
+        index.save()
+        return index
+
+    @staticmethod
+    def _read_sidecar(path, klv_path):
+        """Records of an up-to-date, complete sidecar, else None."""
+        raw = path.read_bytes()
+        if len(raw) < HEADER_DTYPE.itemsize:
+            return None
+        header = np.frombuffer(raw, dtype=HEADER_DTYPE, count=1)[0]
+        st = os.stat(klv_path)
+        if (
+            header["magic"] != INDEX_MAGIC
+            or header["size"] != st.st_size
+            or header["mtime_ns"] != st.st_mtime_ns
+        ):
+            return None
+        count = int(header["count"])
+        # A truncated or padded sidecar (e.g. an interrupted save) is stale.
+        if len(raw) != HEADER_DTYPE.itemsize + count * INDEX_DTYPE.itemsize:
+            return None
+        return np.frombuffer(raw, dtype=INDEX_DTYPE, count=count,
+                             offset=HEADER_DTYPE.itemsize)
+
+    # ---------------- Queries ----------------
+    def time_window(self, start_us, end_us):
+        """Packet indices with start_us <= timestamp < end_us, in file order."""
+        lo = np.searchsorted(self._sorted_ts, start_us, side="left")
+        hi = np.searchsorted(self._sorted_ts, end_us, side="left")
+        return np.sort(self._by_time[lo:hi])
+
+    def time_bounds(self):
+        if not len(self._sorted_ts):
+            return None
+        return int(self._sorted_ts[0]), int(self._sorted_ts[-1])
+
+    def decode(self, decoder, packet_indices):
+        """
+        Decode only the given packets with a started decoder, keeping their
+        global packet_index.
+        """
+        with open(self.klv_path, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            out = []
+            for i in packet_indices:
+                rec = self.records[int(i)]
+                start = int(rec["offset"])
+                data = mm[start:start + int(rec["length"])]
+                out.extend(decoder.decode_bytes(data, int(i)))
+            return out
+
+    def decode_time_window(self, decoder, start_us, end_us):
+        return self.decode(decoder, self.time_window(start_us, end_us))
+
+    def decode_range(self, decoder, start, stop):
+        return self.decode(decoder, range(start, min(stop, len(self))))
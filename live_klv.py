@@ -0,0 +1,364 @@
+# live_klv.py
+# Live KLV metadata from the same RTSP / UDP source the tracker watches.
+# MPEG-TS arrives in chunks (UDP datagrams read directly, anything else
+# through ffmpeg remuxing only the data stream to a pipe), is demuxed
+# incrementally and every KLV packet is decoded the moment its PES is
+# complete. Decoded packets go to a bounded queue and/or a callback.
+import argparse
+import ipaddress
+import queue
+import socket
+import struct
+import subprocess
+import threading
+import time
+from urllib.parse import urlsplit
+
+from capture import BLOCK, DROP_OLDEST
+from decode import JmisbDecoder
+from fast_decode import FastKlvDecoder
+from output import write_ndjson
+from timing import StageStats, timings
+from ts_demux import TS_PACKET_SIZE, TsStreamDemuxer, packet_pts
+
+DEFAULT_QUEUE_SIZE = 256
+CHUNK_SIZE = 1 << 16
+UDP_RECV_BUFFER = 4 << 20
+TS_PACKETS_PER_DATAGRAM = 7
+PTS_HZ = 90000
+
+_DONE = object()
+
+
+# ---------------- Sources ----------------
+def _is_multicast(host):
+    try:
+        return ipaddress.ip_address(host).is_multicast
+    except ValueError:
+        return False
+
+
+def _udp_socket(url):
+    parts = urlsplit(url)
+    host = parts.hostname or ""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECV_BUFFER)
+
+    if _is_multicast(host):
+        sock.bind(("", parts.port))
+        group = struct.pack("4s4s", socket.inet_aton(host), socket.inet_aton("0.0.0.0"))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, group)
+    else:
+        sock.bind((host, parts.port))
+    return sock
+
+
+def _ffmpeg_command(url, rtsp_transport):
+    cmd = ["ffmpeg", "-loglevel", "error", "-fflags", "nobuffer"]
+    if url.startswith("rtsp") and rtsp_transport:
+        cmd += ["-rtsp_transport", rtsp_transport]
+    return cmd + [
+        "-i", url,
+        "-map", "0:d",
+        "-c", "copy",
+        "-f", "mpegts",
+        "-flush_packets", "1",
+        "pipe:1",
+    ]
+
+
+class LiveKlvReader:
+    """
+    Decode KLV metadata from a live source on a background thread.
+
+    url: udp://group:port (multicast, read directly) or any URL ffmpeg can
+    open (rtsp://, srt://, ...). decoder must already be started.
+    Unicast udp:// is refused unless allow_unicast: the kernel hands each
+    unicast datagram to only one of the sockets bound to the port, so this
+    reader and the tracker's VideoCapture on the same URL would starve
+    each other. Use it only when nothing else reads the port.
+    Packets are put on a bounded queue (drop_policy "oldest" discards the
+    oldest packet when full, "block" applies backpressure) and passed to
+    callback, if given, on the reader thread.
+
+    Latency is measured from the arrival of the chunk that completed a KLV
+    packet to its publication, i.e. demux + decode + queueing in this
+    process; time spent inside ffmpeg or the network is not included.
+    """
+
+    def __init__(
+        self,
+        url,
+        decoder,
+        queue_size=DEFAULT_QUEUE_SIZE,
+        callback=None,
+        drop_policy=DROP_OLDEST,
+        rtsp_transport="tcp",
+        idle_timeout_s=None,
+        allow_unicast=False,
+    ):
+        if drop_policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f"❌ Unknown drop policy: {drop_policy}")
+        parts = urlsplit(url)
+        if parts.scheme == "udp" and not allow_unicast and not _is_multicast(parts.hostname or ""):
+            raise ValueError(
+                f"❌ {url} is unicast UDP: the video capture on the same port would "
+                "miss datagrams. Send the feed to a multicast group, or pass "
+                "allow_unicast=True when nothing else reads this port"
+            )
+
+        self.url = url
+        self.decoder = decoder
+        self.callback = callback
+        self.drop_policy = drop_policy
+        self.rtsp_transport = rtsp_transport
+        self.idle_timeout_s = idle_timeout_s
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.latest = None
+        self.error = None
+        self.packets = 0
+        self.dropped = 0
+        self.latency = StageStats()
+
+        self._stop = threading.Event()
+        self._proc = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    # ---------------- Lifecycle ----------------
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop reading; packets already queued are still delivered."""
+        self._stop.set()
+        if self._proc is not None:
+            self._proc.kill()
+        if self.drop_policy == BLOCK:
+            # Unblock a reader thread waiting on a full queue
+            while self._thread.is_alive():
+                try:
+                    self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        if self._thread.is_alive():
+            self._thread.join()
+
+        # Wake the consumer once it has drained the queue
+        while True:
+            try:
+                self.queue.put_nowait(_DONE)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    # ---------------- Reader thread ----------------
+    def _chunks(self):
+        """Yield (received_at, bytes) until the source ends or stop()."""
+        if urlsplit(self.url).scheme == "udp":
+            yield from self._udp_chunks()
+        else:
+            yield from self._ffmpeg_chunks()
+
+    def _udp_chunks(self):
+        sock = _udp_socket(self.url)
+        sock.settimeout(0.2)
+        last = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    data = sock.recv(CHUNK_SIZE)
+                except socket.timeout:
+                    if self.idle_timeout_s and time.perf_counter() - last > self.idle_timeout_s:
+                        return
+                    continue
+                last = time.perf_counter()
+                yield last, data
+        finally:
+            sock.close()
+
+    def _ffmpeg_chunks(self):
+        cmd = _ffmpeg_command(self.url, self.rtsp_transport)
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        try:
+            while not self._stop.is_set():
+                # read1 returns what the pipe holds instead of waiting for a full chunk
+                data = self._proc.stdout.read1(CHUNK_SIZE)
+                if not data:
+                    break
+                yield time.perf_counter(), data
+        finally:
+            self._proc.kill()
+            self._proc.stdout.close()
+            self._proc.wait()
+
+    def _run(self):
+        demuxer = TsStreamDemuxer()
+        index = 0
+        received_at = None
+        try:
+            for received_at, chunk in self._chunks():
+                for pts, frame in demuxer.feed(chunk):
+                    index = self._decode(pts, frame, index, received_at)
+            if not self._stop.is_set():
+                for pts, frame in demuxer.flush():
+                    index = self._decode(pts, frame, index, received_at)
+        except Exception as exc:
+            if not self._stop.is_set():
+                self.error = exc
+                print(f"❌ Live KLV reader failed: {exc!r}")
+        finally:
+            self._put(_DONE)
+
+    def _decode(self, pts, frame, index, received_at):
+        for pkt_out in self.decoder.decode_bytes(frame, index):
+            if pts is not None:
+                pkt_out["pts"] = pts
+            index += 1
+            self._publish(pkt_out, received_at)
+        return index
+
+    def _publish(self, pkt_out, received_at):
+        self.latest = pkt_out
+        self.packets += 1
+        if self.callback is not None:
+            self.callback(pkt_out)
+        self._put(pkt_out)
+
+        latency = time.perf_counter() - received_at
+        self.latency.record(latency)
+        timings.record("live_klv_latency", latency)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                if self.drop_policy == BLOCK:
+                    self.queue.put(item, timeout=0.1)
+                else:
+                    self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                if self.drop_policy == DROP_OLDEST:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    # ---------------- Consumer ----------------
+    def read(self, timeout=None):
+        """Next decoded packet, or None on timeout or once the source has ended."""
+        try:
+            item = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if item is _DONE:
+            # Leave the marker for any other consumer
+            self.queue.put(_DONE)
+            return None
+        return item
+
+    def __iter__(self):
+        while True:
+            pkt_out = self.read()
+            if pkt_out is None:
+                return
+            yield pkt_out
+
+    def stats(self):
+        p50, p95 = self.latency.percentile(50), self.latency.percentile(95)
+        return {
+            "packets": self.packets,
+            "dropped_packets": self.dropped,
+            "latency_p50_ms": p50 * 1000 if p50 is not None else None,
+            "latency_p95_ms": p95 * 1000 if p95 is not None else None,
+        }
+
+
+# ---------------- Stand-in server ----------------
+def _first_pts(datagram):
+    for pos in range(0, len(datagram) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        pts = packet_pts(datagram[pos:pos + TS_PACKET_SIZE])
+        if pts is not None:
+            return pts
+    return None
+
+
+def serve_udp(ts_path, url, loop=False, realtime=True):
+    """
+    Send ts_path to udp://host:port in 7-packet datagrams, paced by the
+    PES PTS so KLV arrives at its recorded rate. A local stand-in for a
+    live feed when testing LiveKlvReader.
+    """
+    parts = urlsplit(url)
+    address = (parts.hostname, parts.port)
+    size = TS_PACKET_SIZE * TS_PACKETS_PER_DATAGRAM
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    sent = 0
+    try:
+        with open(ts_path, "rb") as f:
+            while True:
+                base = None
+                # One datagram per read, so memory stays flat for any file size
+                for datagram in iter(lambda: f.read(size), b""):
+                    if realtime:
+                        pts = _first_pts(datagram)
+                        if pts is not None:
+                            if base is None:
+                                base = (time.perf_counter(), pts)
+                            delay = base[0] + (pts - base[1]) / PTS_HZ - time.perf_counter()
+                            if delay > 0:
+                                time.sleep(delay)
+                    sock.sendto(datagram, address)
+                    sent += 1
+                if not loop:
+                    break
+                f.seek(0)
+    finally:
+        sock.close()
+    return sent
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live KLV metadata decoding")
+    parser.add_argument("--url", required=True, help="udp://host:port, rtsp://... or any ffmpeg URL")
+    parser.add_argument("--serve", default=None, help="send this .ts to --url instead of reading")
+    parser.add_argument("--loop", action="store_true")
+    parser.add_argument("--jars", nargs="*", default=None)
+    parser.add_argument("--fast", action="store_true")
+    parser.add_argument("--output", default="live_metadata.ndjson")
+    parser.add_argument("--duration", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.serve:
+        count = serve_udp(args.serve, args.url, loop=args.loop)
+        print(f"✔ Sent {count} datagrams to {args.url}")
+    else:
+        if args.jars and not args.fast:
+            decoder = JmisbDecoder(args.jars)
+        else:
+            decoder = FastKlvDecoder(fallback=JmisbDecoder(args.jars) if args.jars else None)
+        decoder.start_jvm()
+
+        # Standalone: nothing else reads the port
+        reader = LiveKlvReader(args.url, decoder, allow_unicast=True).start()
+        if args.duration:
+            threading.Timer(args.duration, reader.stop).start()
+        print(f"🚀 Reading KLV from {args.url}")
+        try:
+            count = write_ndjson(reader, args.output)
+        except KeyboardInterrupt:
+            count = reader.packets
+        finally:
+            reader.stop()
+            decoder.shutdown_jvm()
+        print(f"🎉 {count} packets → {args.output}")
+        print(f"📊 {reader.stats()}")
@@ -0,0 +1,326 @@
+# multi_stream.py
+# Multi-stream tracking: one RF-DETR model shared by many RTSP feeds.
+# Every feed keeps its own capture thread and ByteTrack instance; the
+# scheduler batches frames across feeds round-robin and honours a
+# per-stream frame-rate target.
+import argparse
+import time
+from collections import deque
+from pathlib import Path
+
+import cv2
+import numpy as np
+import supervision as sv
+
+from capture import DROP_OLDEST, FrameGrabber
+from global_tracking import predict_frames, to_sv_detections
+from inference_backends import BACKENDS, EAGER, load_backend
+from track_output import TrackRecordWriter
+
+
+class LoopingCapture:
+    """
+    Local stand-in for an RTSP feed: plays a video file at its own frame
+    rate and rewinds at the end.
+    """
+
+    def __init__(self, path):
+        self.cap = cv2.VideoCapture(path)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.interval = 1.0 / (fps if fps > 0 else 25)
+        self._next = None
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def read(self):
+        now = time.perf_counter()
+        if self._next is not None and now < self._next:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next or now) + self.interval
+
+        ret, frame = self.cap.read()
+        if not ret:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class StreamState:
+    """Capture thread, tracker, frame-rate target and counters for one feed."""
+
+    def __init__(self, name, url, target_fps=None, loop=False, queue_size=2, tracks_path=None):
+        self.name = name
+        self.url = url
+        self.target_fps = target_fps
+        self.loop = loop
+        self.queue_size = queue_size
+        self.tracks_path = tracks_path
+
+        self.cap = None
+        self.grabber = None
+        self.byte_tracker = None
+        self.track_writer = None
+        self.fps = None
+
+        self.processed = 0
+        self.latencies = deque(maxlen=1000)
+        self.started_at = None
+        self._next_due = 0.0
+
+    # ---------------- Lifecycle ----------------
+    def open(self):
+        if self.loop:
+            self.cap = LoopingCapture(self.url)
+        else:
+            self.cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"❌ Could not open stream {self.name}: {self.url}")
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps > 0 else 25
+
+        self.byte_tracker = sv.ByteTrack()
+        if self.tracks_path:
+            self.track_writer = TrackRecordWriter(self.tracks_path)
+
+        self.grabber = FrameGrabber(
+            self.cap, queue_size=self.queue_size, drop_policy=DROP_OLDEST
+        ).start()
+        self.started_at = time.perf_counter()
+
+    def close(self):
+        # A started grabber releases the capture from its own thread
+        if self.grabber:
+            self.grabber.stop()
+        elif self.cap:
+            self.cap.release()
+        if self.track_writer:
+            self.track_writer.close()
+
+    # ---------------- Scheduling ----------------
+    @property
+    def ended(self):
+        return self.grabber.ended
+
+    def take(self, now):
+        """Return (frame, index, captured_at) if a frame is ready and due."""
+        if self.target_fps and now < self._next_due:
+            return None
+
+        ret, frame, index, captured_at = self.grabber.read(timeout=0)
+        if not ret:
+            return None
+
+        if self.target_fps:
+            # No catch-up bursts after a stall
+            self._next_due = max(self._next_due + 1.0 / self.target_fps, now)
+        return frame, index, captured_at
+
+    def update(self, frame_index, captured_at, detections):
+        tracked = self.byte_tracker.update_with_detections(to_sv_detections(detections))
+        if self.track_writer:
+            self.track_writer.write(frame_index, frame_index / self.fps, tracked)
+
+        self.processed += 1
+        self.latencies.append(time.perf_counter() - captured_at)
+        return tracked
+
+    def stats(self):
+        elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+        latencies = np.asarray(self.latencies)
+        return {
+            "frames_processed": self.processed,
+            "fps": self.processed / elapsed,
+            "source_fps": self.grabber.captured / elapsed,
+            "dropped_frames": self.grabber.dropped,
+            "lag_p50_ms": float(np.percentile(latencies, 50) * 1000) if len(latencies) else None,
+            "lag_p95_ms": float(np.percentile(latencies, 95) * 1000) if len(latencies) else None,
+        }
+
+
+class MultiStreamTracker:
+    """
+    Loads RF-DETR once and serves every stream from it.
+
+    Each batch takes at most one frame per stream per pass, starting with
+    the stream after the one served last, so no feed can starve the rest.
+    A batch is sent once it holds batch_size frames or its oldest frame
+    has waited max_batch_delay_ms.
+    """
+
+    def __init__(
+        self,
+        streams,
+        confidence_threshold=0.4,
+        batch_size=8,
+        max_batch_delay_ms=50.0,
+        report_interval_s=10.0,
+        backend=EAGER,
+    ):
+        self.streams = streams
+        self.confidence_threshold = confidence_threshold
+        self.batch_size = batch_size
+        self.max_batch_delay_ms = max_batch_delay_ms
+        self.report_interval_s = report_interval_s
+        self.backend = backend
+
+        self.model = None
+        self._cursor = 0
+
+    # ---------------- Setup ----------------
+    def load_model(self):
+        self.model = load_backend(
+            self.backend,
+            calibration_source=self.streams[0].url,
+            batch_size=self.batch_size,
+        )
+
+    def open(self):
+        for stream in self.streams:
+            stream.open()
+            print(f"✔ Opened {stream.name} ({stream.fps:.1f} fps)")
+
+    # ---------------- Scheduling ----------------
+    def next_batch(self):
+        """Return [(stream, frame, frame_index, captured_at), ...]."""
+        batch = []
+        deadline = None
+        n = len(self.streams)
+
+        while len(batch) < self.batch_size:
+            now = time.perf_counter()
+            start = self._cursor
+            progressed = False
+
+            for k in range(n):
+                if len(batch) >= self.batch_size:
+                    break
+                stream = self.streams[(start + k) % n]
+                item = stream.take(now)
+                if item is None:
+                    continue
+                batch.append((stream, *item))
+                self._cursor = (start + k + 1) % n
+                progressed = True
+
+            if batch and deadline is None:
+                deadline = min(captured_at for _, _, _, captured_at in batch)
+                deadline += self.max_batch_delay_ms / 1000
+
+            # Checked every pass: busy feeds must not hold the batch past its deadline
+            if batch and time.perf_counter() >= deadline:
+                break
+            if progressed:
+                continue
+            if all(stream.ended for stream in self.streams):
+                break
+            time.sleep(0.001)
+
+        return batch
+
+    def predict_batch(self, frames):
+        return predict_frames(self.model, frames, self.confidence_threshold)
+
+    # ---------------- Main loop ----------------
+    def run(self, duration_s=None):
+        print(f"🚀 Tracking {len(self.streams)} streams with one model...")
+        started = time.perf_counter()
+        next_report = started + self.report_interval_s
+
+        try:
+            while True:
+                batch = self.next_batch()
+                if not batch:
+                    print("⚠️ All streams ended")
+                    break
+
+                detections = self.predict_batch([frame for _, frame, _, _ in batch])
+                # Batch order keeps each stream's frames in capture order
+                for (stream, _, index, captured_at), dets in zip(batch, detections):
+                    stream.update(index, captured_at, dets)
+
+                now = time.perf_counter()
+                if now >= next_report:
+                    self.report()
+                    next_report = now + self.report_interval_s
+                if duration_s is not None and now - started >= duration_s:
+                    break
+        finally:
+            stats = self.stats()
+            self.close()
+
+        self.report(stats)
+        print("🎉 Multi-stream processing completed")
+        return stats
+
+    def close(self):
+        for stream in self.streams:
+            stream.close()
+
+    # ---------------- Reporting ----------------
+    def stats(self):
+        return {stream.name: stream.stats() for stream in self.streams}
+
+    def report(self, stats=None):
+        for name, s in (stats or self.stats()).items():
+            lag = f"{s['lag_p95_ms']:.0f}" if s["lag_p95_ms"] is not None else "-"
+            print(
+                f"📊 {name}: {s['fps']:.1f}/{s['source_fps']:.1f} fps, "
+                f"lag p95 {lag} ms, dropped {s['dropped_frames']}"
+            )
+
+
+def parse_source(spec, index):
+    """'url', 'name=url' or 'name=url@fps' -> (name, url, target_fps)."""
+    name, sep, rest = spec.partition("=")
+    if not sep or "://" in name:
+        name, rest = f"stream{index}", spec
+
+    target_fps = None
+    url, sep, fps = rest.rpartition("@")
+    if sep and fps.replace(".", "", 1).isdigit():
+        rest, target_fps = url, float(fps)
+
+    return name, rest, target_fps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Track many RTSP feeds with one model")
+    parser.add_argument("--source", action="append", required=True,
+                        help="url, name=url or name=url@fps (repeatable)")
+    parser.add_argument("--loop", action="store_true",
+                        help="treat sources as local files played in a loop")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-batch-delay-ms", type=float, default=50.0)
+    parser.add_argument("--confidence", type=float, default=0.4)
+    parser.add_argument("--duration", type=float, default=None)
+    parser.add_argument("--tracks-dir", default=None)
+    parser.add_argument("--backend", default=EAGER, choices=BACKENDS)
+    args = parser.parse_args()
+
+    if args.tracks_dir:
+        Path(args.tracks_dir).mkdir(parents=True, exist_ok=True)
+
+    streams = []
+    for i, spec in enumerate(args.source):
+        name, url, target_fps = parse_source(spec, i)
+        tracks_path = f"{args.tracks_dir}/{name}.ndjson" if args.tracks_dir else None
+        streams.append(StreamState(name, url, target_fps, loop=args.loop, tracks_path=tracks_path))
+
+    tracker = MultiStreamTracker(
+        streams,
+        confidence_threshold=args.confidence,
+        batch_size=args.batch_size,
+        max_batch_delay_ms=args.max_batch_delay_ms,
+        backend=args.backend,
+    )
+    tracker.load_model()
+    tracker.open()
+    tracker.run(duration_s=args.duration)
@@ -0,0 +1,52 @@
+# output.py
+# Writing decoded packets to disk. Kept free of jpype so the native
+# decoder and everything built on it import without a JVM.
+import json
+import time
+from pathlib import Path
+
+from timing import timings
+
+
+def unlink_output(path):
+    """
+    Remove an output before it is rewritten, so the writer creates a new
+    file instead of truncating one hard-linked into the result cache.
+    """
+    Path(path).unlink(missing_ok=True)
+
+
+def write_ndjson(packets, output_path):
+    """Write decoded packets one JSON object per line. Returns the count."""
+    count = 0
+    unlink_output(output_path)
+    with open(output_path, "w") as out:
+        for pkt_out in packets:
+            t0 = time.perf_counter()
+            out.write(json.dumps(pkt_out))
+            out.write("\n")
+            timings.record("json_serialize", time.perf_counter() - t0)
+            timings.maybe_log()
+            count += 1
+    return count
+
+
+def write_decoded(decoder, klv_path, output_dir, streaming=False):
+    """
+    Decode klv_path with a started decoder and write it into output_dir.
+
+    Returns the path of decoded_metadata.json, or decoded_metadata.ndjson
+    when streaming.
+    """
+    output_dir = Path(output_dir)
+    if streaming:
+        output_json = output_dir / "decoded_metadata.ndjson"
+        decoder.decode_stream(klv_path, output_json)
+    else:
+        decoded = decoder.decode_file(klv_path)
+        output_json = output_dir / "decoded_metadata.json"
+        unlink_output(output_json)
+        with timings.stage("json_serialize", decoded["total_packets"]):
+            with open(output_json, "w") as f:
+                json.dump(decoded, f, indent=2)
+    return str(output_json)
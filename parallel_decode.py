@@ -0,0 +1,134 @@
+# parallel_decode.py
+# Multi-process KLV decoding. The .klv file is scanned once for packet
+# boundaries, cut into packet-aligned shards and decoded in a process pool
+# with one JVM per worker (or the native decoder, whose jMISB fallback
+# starts a worker's JVM only when needed).
+import itertools
+import mmap
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from decode import JmisbDecoder
+from fast_decode import FastKlvDecoder
+from klv import scan_klv_frames
+from output import write_ndjson
+
+_worker_decoder = None
+
+
+# ---------------- Worker ----------------
+def _init_worker(jars, fast):
+    global _worker_decoder
+    _worker_decoder = JmisbDecoder(jars)
+    if fast:
+        _worker_decoder = FastKlvDecoder(fallback=_worker_decoder)
+    _worker_decoder.start_jvm()
+
+
+def _decode_shard(klv_path, start, end):
+    with open(klv_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return _worker_decoder.decode_bytes(data)
+
+
+# ---------------- Sharding ----------------
+def plan_shards(klv_path, num_shards):
+    """
+    Scan klv_path once and return [(start, end), ...] byte ranges that
+    cover whole packets and hold roughly equal numbers of bytes.
+    """
+    if os.path.getsize(klv_path) == 0:
+        return []
+
+    with open(klv_path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        target = max(1, len(mm) // num_shards)
+
+        shards = []
+        start = None
+        end = 0
+        for offset, size in scan_klv_frames(mm):
+            if start is None:
+                start = offset
+            end = offset + size
+            if end - start >= target:
+                shards.append((start, end))
+                start = None
+
+        if start is not None:
+            shards.append((start, end))
+
+    return shards
+
+
+class ParallelDecoder:
+    """
+    Decode a .klv file across a pool of worker processes.
+
+    Output matches JmisbDecoder.decode_file (FastKlvDecoder.decode_file
+    with fast=True), including the global packet_index order. Only one
+    shard per worker is decoded ahead of the consumer, so memory is
+    bounded by workers shards rather than the whole file.
+    """
+
+    def __init__(self, jars, workers=None, shards_per_worker=4, fast=False):
+        self.jars = jars
+        self.fast = fast
+        self.workers = workers or os.cpu_count()
+        self.shards_per_worker = shards_per_worker
+
+    # Workers own their JVMs; nothing to start in this process
+    def start_jvm(self):
+        pass
+
+    def shutdown_jvm(self):
+        pass
+
+    # ---------------- Main API ----------------
+    def iter_packets(self, klv_path):
+        shards = plan_shards(klv_path, self.workers * self.shards_per_worker)
+        if not shards:
+            return
+
+        # spawn: a forked JPype/JVM state is not safe to reuse
+        ctx = multiprocessing.get_context("spawn")
+        workers = min(self.workers, len(shards))
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self.jars, self.fast),
+        ) as pool:
+            # At most one shard per worker in flight: decoded shards waiting
+            # behind a slower one would otherwise pile up in this process
+            pending = iter(shards)
+            futures = deque(
+                pool.submit(_decode_shard, klv_path, start, end)
+                for start, end in itertools.islice(pending, workers)
+            )
+
+            index = 0
+            while futures:
+                packets = futures.popleft().result()
+                shard = next(pending, None)
+                if shard is not None:
+                    futures.append(pool.submit(_decode_shard, klv_path, *shard))
+                for pkt_out in packets:
+                    pkt_out["packet_index"] = index
+                    index += 1
+                    yield pkt_out
+                # Free this shard before blocking on the next one
+                del packets
+
+    def decode_file(self, klv_path):
+        packets = list(self.iter_packets(klv_path))
+        return {
+            "total_packets": len(packets),
+            "packets": packets
+        }
+
+    def decode_stream(self, klv_path, output_path):
+        return write_ndjson(self.iter_packets(klv_path), output_path)
@@ -1,7 +1,11 @@
 from zenml import pipeline
 from steps import extract_metadata_step
 from steps import decode_metadata_step
+from steps import extract_decode_step
 from steps import object_detection
+from steps import batch_ingest_step
+from steps import isr_concurrent_step
+from steps import evaluate_tracks_step
 
 
 @pipeline(name="ISR", enable_cache=False)
@@ -12,20 +16,92 @@ def isr_pipeline(
     rtsp_url: str,
     output_path: str,
     confidence_threshold: float = 0.4,
+    overlapped: bool = False,
+    concurrent: bool = False,
+    decode_cores: int = None,
+    demuxer: str = "ffmpeg",
 ):
-    klv_path = extract_metadata_step(
-        ts_path=ts_path,
-        output_dir=output_dir,
-    )
+    if concurrent:
+        isr_concurrent_step(
+            ts_path=ts_path,
+            jars=jars,
+            output_dir=output_dir,
+            rtsp_url=rtsp_url,
+            output_path=output_path,
+            confidence_threshold=confidence_threshold,
+            decode_cores=decode_cores,
+            demuxer=demuxer,
+        )
+        return
 
-    decode_metadata_step(
-        klv_path=klv_path,
-        jars=jars,
-        output_dir=output_dir,
-    )
+    if overlapped:
+        extract_decode_step(
+            ts_path=ts_path,
+            jars=jars,
+            output_dir=output_dir,
+            demuxer=demuxer,
+        )
+    else:
+        klv_path = extract_metadata_step(
+            ts_path=ts_path,
+            output_dir=output_dir,
+            demuxer=demuxer,
+        )
+
+        decode_metadata_step(
+            klv_path=klv_path,
+            jars=jars,
+            output_dir=output_dir,
+        )
 
     object_detection(
         rtsp_url=rtsp_url,
         output_path=output_path,
         confidence_threshold=confidence_threshold,
-    )
\ No newline at end of file
+    )
+
+
+@pipeline(name="ISR_BATCH", enable_cache=False)
+def isr_batch_pipeline(
+    source: str,
+    jars: list[str],
+    output_root: str,
+    workers: int = None,
+    fast: bool = False,
+    demuxer: str = "ffmpeg",
+):
+    batch_ingest_step(
+        source=source,
+        jars=jars,
+        output_root=output_root,
+        workers=workers,
+        fast=fast,
+        demuxer=demuxer,
+    )
+
+
+@pipeline(name="ISR_EVALUATION", enable_cache=False)
+def isr_evaluation_pipeline(
+    tracks_dir: str,
+    metadata_root: str,
+    output_path: str = "evaluation.ndjson",
+    workers: int = None,
+    iou_threshold: float = 0.5,
+    method: str = "greedy",
+    frame_size: tuple[int, int] = None,
+    fps: float = None,
+    time_offset_s: float = 0.0,
+    video_start_s: float = None,
+):
+    evaluate_tracks_step(
+        tracks_dir=tracks_dir,
+        metadata_root=metadata_root,
+        output_path=output_path,
+        workers=workers,
+        iou_threshold=iou_threshold,
+        method=method,
+        frame_size=frame_size,
+        fps=fps,
+        time_offset_s=time_offset_s,
+        video_start_s=video_start_s,
+    )
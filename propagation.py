@@ -0,0 +1,87 @@
+# propagation.py
+# Tracker-only propagation between detector keyframes, plus the adaptive
+# stride controller that decides how often the detector has to run.
+import math
+
+import numpy as np
+import supervision as sv
+
+
+class TrackPropagator:
+    """
+    Constant-velocity motion model per tracker_id.
+
+    update() is called with ByteTrack output on detector keyframes;
+    predict() extrapolates those boxes to an in-between frame.
+    """
+
+    def __init__(self):
+        self._tracked = None
+        self._velocity = None
+        self._frame = 0
+
+    def update(self, tracked, frame_index):
+        velocity = np.zeros_like(tracked.xyxy, dtype=np.float32)
+
+        if self._tracked is not None and len(tracked) and len(self._tracked):
+            gap = max(1, frame_index - self._frame)
+            prev = {tid: i for i, tid in enumerate(self._tracked.tracker_id)}
+            for i, tid in enumerate(tracked.tracker_id):
+                j = prev.get(tid)
+                if j is not None:
+                    velocity[i] = (tracked.xyxy[i] - self._tracked.xyxy[j]) / gap
+
+        self._tracked = tracked
+        self._velocity = velocity
+        self._frame = frame_index
+
+    def predict(self, frame_index):
+        if self._tracked is None or not len(self._tracked):
+            empty = sv.Detections.empty()
+            empty.tracker_id = np.array([], dtype=int)
+            return empty
+
+        steps = frame_index - self._frame
+        predicted = self._tracked[np.arange(len(self._tracked))]
+        predicted.xyxy = self._tracked.xyxy + self._velocity * steps
+        return predicted
+
+    def motion(self):
+        """Mean per-frame box displacement relative to box size."""
+        if self._tracked is None or not len(self._tracked):
+            return 0.0
+        xyxy = self._tracked.xyxy
+        size = np.maximum(
+            np.maximum(xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1]), 1.0
+        )
+        shift = np.abs(self._velocity).max(axis=1)
+        return float(np.mean(shift / size))
+
+
+class StrideController:
+    """
+    Picks the detector stride K from the measured inference time (so the
+    tracker keeps up with the stream's frame rate) and halves it while
+    scene motion is above motion_threshold.
+    """
+
+    def __init__(self, fps, max_stride=8, motion_threshold=0.05, smoothing=0.2):
+        self.fps = fps
+        self.max_stride = max_stride
+        self.motion_threshold = motion_threshold
+        self.smoothing = smoothing
+        self.inference_s = None
+        self.stride = 1
+
+    def update(self, inference_s, motion):
+        if self.inference_s is None:
+            self.inference_s = inference_s
+        else:
+            self.inference_s += self.smoothing * (inference_s - self.inference_s)
+
+        stride = math.ceil(self.inference_s * self.fps)
+        if motion > self.motion_threshold:
+            stride //= 2
+
+        self.stride = max(1, min(self.max_stride, stride))
+        return self.stride
@@ -0,0 +1,387 @@
+# roi.py
+# Region-of-interest detection driven by the onboard ST 0903 VMTI targets.
+# The targets reported for a frame become padded tiles; the tiles of every
+# frame in a batch are packed at native scale onto shared canvases, with
+# a blank gutter between them, so one detector input covers several frames. Boxes are mapped back to frame
+# coordinates. Full frames are still run every N frames and whenever VMTI
+# reports nothing, so objects the onboard tracker misses are picked up.
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import supervision as sv
+
+from geolocate import PTS, DEFAULT_MAX_GAP_S, column_times, load_packets, packet_times, time_columns
+
+DEFAULT_FULL_INTERVAL = 30
+DEFAULT_CANVAS_SIZE = 640
+DEFAULT_PAD = 0.5
+DEFAULT_MIN_TILE = 96
+DEFAULT_MAX_COVERAGE = 0.5
+DEFAULT_GUTTER = 16
+CENTROID_BOX_PX = 32
+NMS_IOU = 0.5
+
+
+# ---------------- VMTI targets ----------------
+def _vmti_set(packet):
+    if packet.get("type") == "ST0903_VMTI":
+        return packet
+    return packet.get("embedded_vmti")
+
+
+def _pixel(number, width):
+    """ST 0903 pixel number (row * width + column + 1) -> (x, y)."""
+    n = int(float(number)) - 1
+    return n % width, n // width
+
+
+def _frame_size(vmti, frame_size):
+    fields = vmti.get("fields", {})
+    width = int(float(fields.get("FrameWidth") or 0)) or (frame_size[0] if frame_size else 0)
+    height = int(float(fields.get("FrameHeight") or 0)) or (frame_size[1] if frame_size else 0)
+    return width, height
+
+
+def _target_boxes(vmti, frame_size):
+    """(normalised xyxy boxes, target ids) of one VMTI set."""
+    width, height = _frame_size(vmti, frame_size)
+    if not width or not height:
+        return np.zeros((0, 4)), np.zeros(0, dtype=np.int64)
+
+    boxes, ids = [], []
+    for target in vmti.get("vtarget_series", []):
+        tf = target["fields"]
+        if tf.get("BoundaryTopLeft") and tf.get("BoundaryBottomRight"):
+            x1, y1 = _pixel(tf["BoundaryTopLeft"], width)
+            x2, y2 = _pixel(tf["BoundaryBottomRight"], width)
+        elif tf.get("TargetCentroid"):
+            cx, cy = _pixel(tf["TargetCentroid"], width)
+            half = CENTROID_BOX_PX / 2
+            x1, y1, x2, y2 = cx - half, cy - half, cx + half, cy + half
+        else:
+            continue
+        boxes.append((x1 / width, y1 / height, x2 / width, y2 / height))
+        ids.append(int(target["target_id"]))
+    return np.array(boxes, dtype=float).reshape(-1, 4), np.array(ids, dtype=np.int64)
+
+
+class VmtiIndex:
+    """
+    Onboard VTarget boxes per VMTI packet, sorted by time. t is absolute
+    seconds on clock, chosen as for geolocate.MetadataIndex, so both
+    indexes of one recording share a time base. Boxes are normalised to
+    the VMTI frame size and kept in one (M, 4) array (target ids in a
+    parallel array) with per-packet offsets, so a lookup is a
+    searchsorted and a slice. frame_size is the VMTI frame (w, h), None
+    when no packet gave one.
+    """
+
+    def __init__(self, t, boxes, ids, frame_size=None, max_gap_s=DEFAULT_MAX_GAP_S, clock=PTS):
+        if not len(t):
+            raise ValueError("❌ No timestamped VMTI packets to index")
+        order = np.argsort(t, kind="stable")
+        boxes = [boxes[i] for i in order]
+
+        self.t = np.asarray(t, dtype=float)[order]
+        self.clock = clock
+        self.offsets = np.concatenate([[0], np.cumsum([len(b) for b in boxes])]).astype(np.int64)
+        self.boxes = np.concatenate(boxes) if boxes else np.zeros((0, 4))
+        self.ids = np.concatenate([ids[i] for i in order]) if boxes else np.zeros(0, dtype=np.int64)
+        self.frame_size = frame_size
+        self.max_gap_s = max_gap_s
+
+    def __len__(self):
+        return len(self.t)
+
+    @classmethod
+    def from_packets(cls, packets, frame_size=None, max_gap_s=DEFAULT_MAX_GAP_S):
+        """frame_size (w, h) is used when a VMTI set omits FrameWidth / FrameHeight."""
+        packets = [p for p in packets if _vmti_set(p) is not None]
+        t, clock = packet_times(packets)
+        keep = ~np.isnan(t)
+        sets = [_vmti_set(p) for p, k in zip(packets, keep) if k]
+        targets = [_target_boxes(v, frame_size) for v in sets]
+        sizes = [_frame_size(v, None) for v in sets]
+        vmti_size = next((size for size in sizes if all(size)), None)
+        return cls(
+            t[keep], [b for b, _ in targets], [i for _, i in targets], vmti_size, max_gap_s, clock
+        )
+
+    @classmethod
+    def from_parquet(cls, packets_path, vtargets_path, frame_size=None, max_gap_s=DEFAULT_MAX_GAP_S):
+        """
+        From packets.parquet + vtargets.parquet (columnar.write_columnar),
+        with the pixel numbers converted for all targets in one pass.
+        """
+        packets = pq.read_table(packets_path, columns=[
+            "packet_index", *time_columns(packets_path), "vmti_PrecisionTimeStamp",
+            "vmti_FrameWidth", "vmti_FrameHeight",
+        ])
+        targets = pq.read_table(vtargets_path, columns=[
+            "packet_index", "target_id", "BoundaryTopLeft", "BoundaryBottomRight", "TargetCentroid",
+        ])
+
+        has_vmti = pc.or_(
+            pc.is_valid(packets["vmti_PrecisionTimeStamp"]),
+            pc.is_in(packets["packet_index"], value_set=targets["packet_index"].combine_chunks()),
+        )
+        packets = packets.filter(has_vmti).sort_by("packet_index")
+
+        def column(table, name, fill):
+            return pc.fill_null(table[name].cast("int64"), fill).to_numpy()
+
+        index = column(packets, "packet_index", 0)
+        stamp = pc.coalesce(packets["vmti_PrecisionTimeStamp"], packets["PrecisionTimeStamp"])
+        pts = packets["pts"] if "pts" in packets.column_names else None
+        t, clock = column_times(pts, stamp)
+        width = column(packets, "vmti_FrameWidth", frame_size[0] if frame_size else 0)
+        height = column(packets, "vmti_FrameHeight", frame_size[1] if frame_size else 0)
+
+        row = np.searchsorted(index, column(targets, "packet_index", -1))
+        row = np.clip(row, 0, max(len(index) - 1, 0))
+        w, h = width[row].astype(float), height[row].astype(float)
+        top_left = column(targets, "BoundaryTopLeft", 0) - 1
+        bottom_right = column(targets, "BoundaryBottomRight", 0) - 1
+        centroid = column(targets, "TargetCentroid", 0) - 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            wi = np.maximum(width[row], 1)
+            box = np.stack([top_left % wi, top_left // wi, bottom_right % wi, bottom_right // wi], axis=1)
+            half = CENTROID_BOX_PX / 2
+            cbox = np.stack([centroid % wi - half, centroid // wi - half,
+                             centroid % wi + half, centroid // wi + half], axis=1)
+            has_box = (top_left >= 0) & (bottom_right >= 0)
+            boxes = np.where(has_box[:, None], box, cbox) / np.stack([w, h, w, h], axis=1)
+        valid = (has_box | (centroid >= 0)) & (w > 0) & (h > 0)
+
+        order = np.argsort(row[valid], kind="stable")
+        rows = row[valid][order]
+        split = np.searchsorted(rows, np.arange(1, len(index)))
+        ids = column(targets, "target_id", 0)[valid][order]
+
+        keep = ~np.isnan(t)
+        sizes = np.flatnonzero((width > 0) & (height > 0))
+        vmti_size = (int(width[sizes[0]]), int(height[sizes[0]])) if len(sizes) else None
+        return cls(
+            t[keep],
+            [b for b, k in zip(np.split(boxes[valid][order], split), keep) if k],
+            [i for i, k in zip(np.split(ids, split), keep) if k],
+            vmti_size,
+            max_gap_s,
+            clock,
+        )
+
+    @classmethod
+    def load(cls, path, frame_size=None, max_gap_s=DEFAULT_MAX_GAP_S):
+        """
+        From decoded_metadata.json / .ndjson, or a directory holding
+        packets.parquet + vtargets.parquet.
+        """
+        path = Path(path)
+        if path.is_dir():
+            return cls.from_parquet(
+                path / "packets.parquet", path / "vtargets.parquet", frame_size, max_gap_s
+            )
+        return cls.from_packets(load_packets(path), frame_size, max_gap_s)
+
+    def nearest(self, times):
+        """Index of the packet nearest each time, -1 when further than max_gap_s."""
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        hi = np.clip(np.searchsorted(self.t, times), 0, len(self.t) - 1)
+        lo = np.maximum(hi - 1, 0)
+        best = np.where(np.abs(self.t[lo] - times) <= np.abs(self.t[hi] - times), lo, hi)
+        return np.where(np.abs(self.t[best] - times) <= self.max_gap_s, best, -1)
+
+    def targets_at(self, t):
+        """Normalised xyxy boxes of the packet nearest t, or None when too far."""
+        k = self.nearest(t)[0]
+        if k < 0:
+            return None
+        return self.boxes[self.offsets[k]:self.offsets[k + 1]]
+
+
+# ---------------- Tiles ----------------
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def plan_tiles(boxes, frame_size, pad=DEFAULT_PAD, min_size=DEFAULT_MIN_TILE):
+    """
+    Padded integer tiles (K x 4 xyxy) around normalised boxes, clipped to
+    the frame. Overlapping tiles are merged so no object is split.
+    """
+    width, height = frame_size
+    b = np.asarray(boxes, dtype=float) * (width, height, width, height)
+    cx = (b[:, 0] + b[:, 2]) / 2
+    cy = (b[:, 1] + b[:, 3]) / 2
+    tw = np.minimum(np.maximum((b[:, 2] - b[:, 0]) * (1 + 2 * pad), min_size), width)
+    th = np.minimum(np.maximum((b[:, 3] - b[:, 1]) * (1 + 2 * pad), min_size), height)
+    x1 = np.clip(cx - tw / 2, 0, width - tw)
+    y1 = np.clip(cy - th / 2, 0, height - th)
+    tiles = np.stack([x1, y1, x1 + tw, y1 + th], axis=1).round().astype(int).tolist()
+
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        for tile in tiles:
+            for k, other in enumerate(out):
+                if _overlaps(tile, other):
+                    out[k] = [min(tile[0], other[0]), min(tile[1], other[1]),
+                              max(tile[2], other[2]), max(tile[3], other[3])]
+                    merged = True
+                    break
+            else:
+                out.append(tile)
+        tiles = out
+    return np.array(tiles, dtype=int).reshape(-1, 4)
+
+
+def pack_tiles(sizes, canvas_size, gutter=DEFAULT_GUTTER):
+    """
+    Shelf-pack (w, h) tiles onto square canvases, tallest first, leaving
+    gutter blank pixels between neighbours so the detector cannot join
+    content of unrelated frames into one box. Tiles larger than a canvas
+    are scaled down to fit. Returns ([(canvas, x, y, scale, w, h)],
+    canvas_count) with w, h the placed (scaled) size.
+    """
+    placed = []
+    for w, h in sizes:
+        scale = min(1.0, canvas_size / w, canvas_size / h)
+        placed.append((scale, min(canvas_size, max(1, int(w * scale))),
+                       min(canvas_size, max(1, int(h * scale)))))
+
+    placements = [None] * len(sizes)
+    canvas, x, y, shelf = -1, 0, canvas_size, 0
+    for i in sorted(range(len(sizes)), key=lambda i: -placed[i][2]):
+        scale, w, h = placed[i]
+        if x + w > canvas_size:
+            x, y, shelf = 0, y + shelf + gutter, 0
+        if y + h > canvas_size:
+            canvas, x, y, shelf = canvas + 1, 0, 0, 0
+        placements[i] = (canvas, x, y, scale, w, h)
+        x += w + gutter
+        shelf = max(shelf, h)
+    return placements, canvas + 1
+
+
+# ---------------- Detector ----------------
+class RoiDetector:
+    """
+    Decides per frame between a full-frame pass and VMTI tiles, builds the
+    detector inputs for a batch and maps the detections back.
+
+    A frame is run in full every full_interval frames, when no VMTI packet
+    is within reach, when VMTI reports no targets, or when the tiles would
+    cover more than max_coverage of the frame.
+    """
+
+    def __init__(
+        self,
+        vmti,
+        full_interval=DEFAULT_FULL_INTERVAL,
+        canvas_size=DEFAULT_CANVAS_SIZE,
+        pad=DEFAULT_PAD,
+        min_tile=DEFAULT_MIN_TILE,
+        max_coverage=DEFAULT_MAX_COVERAGE,
+        gutter=DEFAULT_GUTTER,
+        time_origin_s=None,
+    ):
+        self.vmti = vmti
+        self.full_interval = full_interval
+        self.canvas_size = canvas_size
+        self.pad = pad
+        self.min_tile = min_tile
+        self.max_coverage = max_coverage
+        self.gutter = gutter
+        # Frame 0 on the VMTI clock (ObjectTracker._time_origin)
+        self.time_origin_s = vmti.t[0] if time_origin_s is None else time_origin_s
+
+        self._last_full = None
+        self.full_frames = 0
+        self.roi_frames = 0
+        self.tiles = 0
+        self.canvases = 0
+
+    def _tiles_for(self, frame, index, fps):
+        if self._last_full is not None and index - self._last_full < self.full_interval:
+            boxes = self.vmti.targets_at(self.time_origin_s + index / fps)
+            if boxes is not None and len(boxes):
+                height, width = frame.shape[:2]
+                tiles = plan_tiles(boxes, (width, height), self.pad, self.min_tile)
+                area = np.prod(tiles[:, 2:] - tiles[:, :2], axis=1).sum()
+                if area <= self.max_coverage * width * height:
+                    return tiles
+        self._last_full = index
+        return None
+
+    def detect(self, frames, indices, fps, predict):
+        """
+        Detections in frame coordinates for each frame. predict maps a list
+        of BGR images to a list of detections (ObjectTracker.predict_batch).
+        """
+        full, tiled = [], []
+        for j, (frame, index) in enumerate(zip(frames, indices)):
+            tiles = self._tiles_for(frame, index, fps)
+            if tiles is None:
+                full.append(j)
+            else:
+                tiled.extend((j, tile) for tile in tiles)
+
+        sizes = [(x2 - x1, y2 - y1) for _, (x1, y1, x2, y2) in tiled]
+        placements, count = pack_tiles(sizes, self.canvas_size, self.gutter)
+        canvases = [np.zeros((self.canvas_size, self.canvas_size, 3), dtype=np.uint8)
+                    for _ in range(count)]
+        for (j, (x1, y1, x2, y2)), (k, px, py, scale, w, h) in zip(tiled, placements):
+            crop = frames[j][y1:y2, x1:x2]
+            if scale < 1:
+                crop = cv2.resize(crop, (w, h), interpolation=cv2.INTER_AREA)
+            canvases[k][py:py + h, px:px + w] = crop
+
+        images = [frames[j] for j in full] + canvases
+        outputs = predict(images) if images else []
+
+        results = [None] * len(frames)
+        for j, detections in zip(full, outputs):
+            results[j] = detections
+
+        parts = {}
+        canvas_outputs = outputs[len(full):]
+        for (j, tile), placement in zip(tiled, placements):
+            parts.setdefault(j, []).append(_from_canvas(canvas_outputs[placement[0]], tile, placement))
+        for j, found in parts.items():
+            merged = sv.Detections.merge(found)
+            results[j] = merged.with_nms(threshold=NMS_IOU) if len(found) > 1 else merged
+
+        self.full_frames += len(full)
+        self.roi_frames += len(parts)
+        self.tiles += len(tiled)
+        self.canvases += count
+        return results
+
+    def stats(self):
+        frames = self.full_frames + self.roi_frames
+        inputs = self.full_frames + self.canvases
+        return {
+            "roi_full_frames": self.full_frames,
+            "roi_tiled_frames": self.roi_frames,
+            "roi_tiles": self.tiles,
+            "roi_inputs_per_frame": inputs / frames if frames else None,
+        }
+
+
+def _from_canvas(detections, tile, placement):
+    """Detections whose centre lies in a placed tile, in frame coordinates."""
+    _, px, py, scale, w, h = placement
+    x1, y1, x2, y2 = tile
+    xyxy = np.asarray(detections.xyxy, dtype=float).reshape(-1, 4)
+    cx = (xyxy[:, 0] + xyxy[:, 2]) / 2
+    cy = (xyxy[:, 1] + xyxy[:, 3]) / 2
+    inside = (cx >= px) & (cx < px + w) & (cy >= py) & (cy < py + h)
+
+    found = detections[inside]
+    boxes = (xyxy[inside] - (px, py, px, py)) / scale + (x1, y1, x1, y1)
+    found.xyxy = np.clip(boxes, (x1, y1, x1, y1), (x2, y2, x2, y2))
+    return found
@@ -1,38 +1,96 @@
 from zenml import step
-import subprocess
 from pathlib import Path
-import json
+import threading
 from pathlib import Path
+import decoder_service
+from batch import run_batch
+from cache import ResultCache
+from columnar import write_columnar
 from decode import JmisbDecoder
+from delta import DEFAULT_KEYFRAME_INTERVAL, write_delta_ndjson
+from evaluate import discover_pairs, evaluate_archive
+from extract_decode import extract_decode, extract_klv
+from fast_decode import FastKlvDecoder
+from isr_concurrent import run_concurrent
+from live_klv import LiveKlvReader
+from parallel_decode import ParallelDecoder
+from timing import timings
 import mlflow
 from global_tracking import ObjectTracker
+from multi_stream import MultiStreamTracker, StreamState, parse_source
+from output import write_decoded, write_ndjson
+
+DECODE_FORMATS = ("json", "delta", "parquet", "arrow")
+
+
+def _check_decode_options(output_format, use_service, workers, fast=False, streaming=False):
+    """Reject formats and combinations decode_metadata_step would silently ignore."""
+    if output_format not in DECODE_FORMATS:
+        raise ValueError(
+            f"❌ Unknown output format: {output_format} (choose from {', '.join(DECODE_FORMATS)})"
+        )
+    if output_format != "json" and use_service:
+        raise ValueError(f"❌ output_format={output_format!r} is not supported with use_service=True")
+    if use_service and workers > 1:
+        raise ValueError("❌ workers > 1 is not supported with use_service=True")
+    if output_format in ("parquet", "arrow"):
+        # Columnar output is always native and batched: no jMISB, no options
+        for name, value in (("workers > 1", workers > 1), ("fast=True", fast), ("streaming=True", streaming)):
+            if value:
+                raise ValueError(f"❌ output_format={output_format!r} is not supported with {name}")
+
+
+def _restore_cached(cache, key, output_dir, log_cached, artifact_path):
+    """Return cached output paths (main output first) or None on a miss."""
+    if cache is None:
+        return None
+    files = cache.get(key, output_dir)
+    if files is None:
+        return None
+    paths = [files[name] for name in sorted(files)]
+    print(f"✔ Cache hit for {artifact_path}: {', '.join(paths)}")
+    if log_cached:
+        for path in paths:
+            mlflow.log_artifact(path, artifact_path=artifact_path)
+    return paths
+
 
 @step(experiment_tracker="mlflow_experiment_tracker")
 def extract_metadata_step(
     ts_path: str,
     output_dir: str,
+    demuxer: str = "ffmpeg",
+    use_cache: bool = False,
+    log_cached: bool = False,
 ) -> str:
     """
     Extract KLV metadata from TS using FFmpeg.
 
+    With demuxer="builtin" the in-process memory-mapped MPEG-TS demuxer is
+    used instead of an ffmpeg subprocess. A raw .klv has no PES PTS either
+    way; use extract_decode_step(demuxer="builtin") for PTS-stamped packets.
+    With use_cache=True an unchanged input is served from the local result
+    cache; cached artifacts are only re-logged to MLflow with log_cached.
+
     Returns path to extracted .klv file
     """
     mlflow.autolog()
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    
+    cache = ResultCache() if use_cache else None
+    if cache:
+        key = cache.key("extract", ts_path, options={"demuxer": demuxer})
+        cached = _restore_cached(cache, key, output_dir, log_cached, "extracted_klv")
+        if cached:
+            return cached[0]
+
     klv_path = output_dir / "metadata.klv"
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-i", ts_path,
-        "-map", "0:d",
-        "-c", "copy",
-        "-f", "data",
-        str(klv_path),
-    ]
-    subprocess.run(cmd, check=True)
+    extract_klv(ts_path, klv_path, demuxer)
+
+    if cache:
+        cache.put(key, [klv_path])
+    timings.log()
     mlflow.log_artifact(str(klv_path), artifact_path="extracted_klv")
     return str(klv_path)
 
@@ -43,40 +101,362 @@ def decode_metadata_step(
     klv_path: str,
     jars: list[str],
     output_dir: str,
+    streaming: bool = False,
+    fast: bool = False,
+    use_service: bool = False,
+    workers: int = 1,
+    output_format: str = "json",
+    use_cache: bool = False,
+    log_cached: bool = False,
+    keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL,
 ) -> str:
     """
     Decode KLV metadata into JSON using jMISB.
+
+    With streaming=True packets are decoded one at a time and written as
+    newline-delimited JSON (decoded_metadata.ndjson) with flat memory use.
+    With fast=True the native ST 0601 / ST 0903 decoder is used and jMISB
+    is only started for tags it does not implement.
+    With use_service=True the work is sent to the persistent decoder
+    service (started on first use) so the warm JVM is reused across runs.
+    With workers > 1 the file is split at packet boundaries and decoded by
+    a pool of worker processes (jMISB, one JVM each, or the native decoder
+    when fast=True).
+    With output_format="parquet" or "arrow" typed columns are written
+    instead (packets + exploded vtargets tables); returns the packets path.
+    They are always decoded natively in batches, so only the tags the
+    native decoder implements have columns: jars are not used and the
+    tags only jMISB decodes are not written.
+    With output_format="delta" decoded_metadata.delta.ndjson holds a full
+    snapshot every keyframe_interval packets and only changed fields in
+    between (read back with delta.read_delta_ndjson).
+    The service only writes plain JSON / NDJSON with a single decoder, and
+    the columnar formats take none of streaming, fast or workers; other
+    combinations and unknown formats raise ValueError.
+    With use_cache=True outputs are reused when the .klv, the jars and the
+    output options are unchanged.
+    """
+    _check_decode_options(output_format, use_service, workers, fast=fast, streaming=streaming)
+    mlflow.autolog()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    cache = ResultCache() if use_cache else None
+    if cache:
+        options = {"streaming": streaming, "fast": fast, "output_format": output_format}
+        if output_format == "delta":
+            options["keyframe_interval"] = keyframe_interval
+        key = cache.key("decode", klv_path, jars, options)
+        cached = _restore_cached(cache, key, output_dir, log_cached, "decoded_klv")
+        if cached:
+            # packets.* sorts before vtargets.*
+            return cached[0]
+
+    outputs = []
+    if output_format in ("parquet", "arrow"):
+        outputs.extend(write_columnar(klv_path, output_dir, fmt=output_format))
+    elif use_service:
+        with decoder_service.connect(jars) as client:
+            response = client.decode(klv_path, output_dir, streaming=streaming, fast=fast)
+            stats = client.stats()
+        outputs.append(response["output_path"])
+        mlflow.log_metric("decode_request_s", response["latency_s"])
+        mlflow.log_metric("decoder_cold_start_s", stats["cold_start_s"])
+    else:
+        if workers > 1:
+            decoder = ParallelDecoder(jars, workers=workers, fast=fast)
+        elif fast:
+            decoder = FastKlvDecoder(fallback=JmisbDecoder(jars))
+        else:
+            decoder = JmisbDecoder(jars)
+
+        decoder.start_jvm()
+        if output_format == "delta":
+            output_json = output_dir / "decoded_metadata.delta.ndjson"
+            write_delta_ndjson(decoder.iter_packets(klv_path), output_json, keyframe_interval)
+            outputs.append(str(output_json))
+        else:
+            outputs.append(write_decoded(decoder, klv_path, output_dir, streaming=streaming))
+        decoder.shutdown_jvm()
+
+    if cache:
+        cache.put(key, outputs)
+    timings.log()
+    for path in outputs:
+        mlflow.log_artifact(str(path), artifact_path="decoded_klv")
+
+    return str(outputs[0])
+
+
+@step(experiment_tracker="mlflow_experiment_tracker")
+def extract_decode_step(
+    ts_path: str,
+    jars: list[str],
+    output_dir: str,
+    demuxer: str = "ffmpeg",
+    fast: bool = False,
+) -> str:
+    """
+    Extract and decode KLV metadata in one overlapped pass.
+
+    KLV packets flow from ffmpeg (or the built-in demuxer) through a bounded
+    queue into the decoder as soon as they are complete; no metadata.klv is
+    written. With demuxer="builtin" every packet keeps its PES "pts", the
+    time base geolocation and evaluation align video frames to.
+    Returns path to decoded_metadata.ndjson.
     """
     mlflow.autolog()
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
     decoder = JmisbDecoder(jars)
+    if fast:
+        decoder = FastKlvDecoder(fallback=decoder)
 
+    output_json = output_dir / "decoded_metadata.ndjson"
     decoder.start_jvm()
-    decoded = decoder.decode_file(klv_path)
+    extract_decode(decoder, ts_path, output_json, demuxer=demuxer)
     decoder.shutdown_jvm()
+    timings.log()
 
-    output_json = output_dir / "decoded_metadata.json"
-    with open(output_json, "w") as f:
-        json.dump(decoded, f, indent=2)
     mlflow.log_artifact(str(output_json), artifact_path="decoded_klv")
 
     return str(output_json)
 
 
 @step(enable_cache=False,experiment_tracker="mlflow_experiment_tracker")
-def object_detection(rtsp_url: str, output_path: str, confidence_threshold: float,) -> None:
+def batch_ingest_step(
+    source: str,
+    jars: list[str],
+    output_root: str,
+    workers: int = None,
+    fast: bool = False,
+    demuxer: str = "ffmpeg",
+) -> dict:
+    """
+    Extract and decode every .ts under a directory or glob across a pool
+    of worker processes. Outputs go to <output_root>/<name>-<sha256[:12]>/;
+    files already completed in the manifest are skipped, so an interrupted
+    run resumes. Returns the summary (also logged as MLflow metrics).
+    """
+    summary = run_batch(
+        source, jars, output_root, workers=workers, fast=fast, demuxer=demuxer
+    )
+    mlflow.log_metrics(summary)
+    mlflow.log_artifact(str(Path(output_root) / "manifest.ndjson"), artifact_path="batch")
+    return summary
+
+
+@step(enable_cache=False,experiment_tracker="mlflow_experiment_tracker")
+def evaluate_tracks_step(
+    tracks_dir: str,
+    metadata_root: str,
+    output_path: str = "evaluation.ndjson",
+    workers: int = None,
+    iou_threshold: float = 0.5,
+    method: str = "greedy",
+    frame_size: tuple[int, int] = None,
+    fps: float = None,
+    time_offset_s: float = 0.0,
+    video_start_s: float = None,
+) -> dict:
+    """
+    Score every track file in tracks_dir against the onboard VMTI targets
+    of the matching recording under metadata_root (see
+    evaluate.discover_pairs), in parallel. Logs archive precision / recall
+    / ID switches and the per-recording results; returns the totals.
+    frame_size, fps and the video start default to what each track file
+    recorded; time_offset_s shifts the video start on the VMTI clock.
+    """
+    pairs = discover_pairs(tracks_dir, metadata_root)
+    _, totals = evaluate_archive(
+        pairs,
+        output_path,
+        workers=workers,
+        iou_threshold=iou_threshold,
+        method=method,
+        frame_size=frame_size,
+        time_offset_s=time_offset_s,
+        fps=fps,
+        video_start_s=video_start_s,
+    )
+    mlflow.log_metrics({f"eval_{k}": v for k, v in totals.items() if v is not None})
+    mlflow.log_artifact(output_path, artifact_path="evaluation")
+    return totals
+
+
+@step(enable_cache=False,experiment_tracker="mlflow_experiment_tracker")
+def isr_concurrent_step(
+    ts_path: str,
+    jars: list[str],
+    output_dir: str,
+    rtsp_url: str,
+    output_path: str,
+    confidence_threshold: float = 0.4,
+    decode_cores: int = None,
+    demuxer: str = "ffmpeg",
+    fast: bool = False,
+) -> str:
+    """
+    Run metadata extraction + decoding and object detection at the same
+    time. The decoder gets decode_cores CPUs (default: a quarter) in its
+    own process; the tracker gets the rest. Returns path to decoded output.
+    """
+    result = run_concurrent(
+        ts_path,
+        jars,
+        output_dir,
+        rtsp_url,
+        output_path,
+        confidence_threshold=confidence_threshold,
+        decode_cores=decode_cores,
+        demuxer=demuxer,
+        fast=fast,
+    )
+    timings.log()
+
+    mlflow.log_metrics({k: result[k] for k in ("decode_wall_s", "detect_wall_s", "total_wall_s")})
+    mlflow.log_artifact(result["decoded_path"], artifact_path="decoded_klv")
+
+    return result["decoded_path"]
+
+
+@step(enable_cache=False,experiment_tracker="mlflow_experiment_tracker")
+def object_detection(
+    rtsp_url: str,
+    output_path: str,
+    confidence_threshold: float,
+    threaded_capture: bool = False,
+    drop_policy: str = "oldest",
+    batch_size: int = 1,
+    max_batch_delay_ms: float = 50.0,
+    adaptive_stride: bool = False,
+    headless: bool = False,
+    tracks_path: str = None,
+    backend: str = "eager",
+    metadata_output: str = None,
+    jars: list[str] = None,
+    metadata_path: str = None,
+    metadata_offset_s: float = 0.0,
+    video_start_s: float = None,
+    vmti_path: str = None,
+    roi_full_interval: int = 30,
+) -> None:
     """
     Run the full RTSP tracking job.
     Live resources must stay inside ONE step.
+
+    With threaded_capture=True frames are read on a background thread into
+    a bounded queue (drop_policy "oldest", "latest" or "block").
+    With batch_size > 1 up to batch_size frames (waiting at most
+    max_batch_delay_ms for the batch to fill) go through one predict call.
+    With adaptive_stride=True the detector only runs every K frames (K
+    adapts to inference time and motion) and tracks are propagated between.
+    With tracks_path set, per-frame track records go to NDJSON (or Parquet
+    for a .parquet path); headless=True skips annotation, video encoding
+    and display and requires tracks_path. Render the video later with
+    track_output.py.
+    backend selects the CPU inference path: "eager", "compiled" (traced
+    PyTorch), "onnx" or "onnx-int8-dynamic" / "onnx-int8-static" (ONNX
+    Runtime, exported once and cached in .model_cache/).
+    With metadata_output set, KLV is demuxed and decoded live from the
+    same rtsp_url while tracking (native decoder, jMISB fallback when jars
+    are given) and written to that NDJSON path.
+    With metadata_path set (decoded_metadata.json / .ndjson or
+    packets.parquet of the same recording), every track record also gets
+    the latitude / longitude of its box centre. Frames are placed on the
+    metadata clock from the video start: video_start_s when given, else
+    the first video PTS of a local .ts (PTS-keyed metadata only), else the
+    first metadata sample with a warning. metadata_offset_s is added on top.
+    With vmti_path set (decoded metadata with ST 0903 targets), RF-DETR
+    runs on tiles around the time-aligned VMTI targets, packed several
+    frames to a canvas, with a full frame every roi_full_interval frames
+    or when VMTI reports nothing. It cannot be combined with adaptive_stride.
     """
+    reader = None
+    if metadata_output:
+        decoder = FastKlvDecoder(fallback=JmisbDecoder(jars) if jars else None)
+        decoder.start_jvm()
+        reader = LiveKlvReader(rtsp_url, decoder).start()
+        writer = threading.Thread(target=write_ndjson, args=(reader, metadata_output), daemon=True)
+        writer.start()
+
     tracker = ObjectTracker(
         rtsp_url=rtsp_url,
         output_path=output_path,
         confidence_threshold=confidence_threshold,
+        threaded_capture=threaded_capture,
+        drop_policy=drop_policy,
+        batch_size=batch_size,
+        max_batch_delay_ms=max_batch_delay_ms,
+        adaptive_stride=adaptive_stride,
+        headless=headless,
+        tracks_path=tracks_path,
+        backend=backend,
+        metadata_path=metadata_path,
+        metadata_offset_s=metadata_offset_s,
+        video_start_s=video_start_s,
+        vmti_path=vmti_path,
+        roi_full_interval=roi_full_interval,
+    )
+    try:
+        tracker.load_model()
+        tracker.setup_stream()
+        tracker.setup_tracking()
+        tracker.run()
+    finally:
+        if reader is not None:
+            reader.stop()
+            writer.join()
+            decoder.shutdown_jvm()
+
+    if reader is not None:
+        stats = reader.stats()
+        print(f"📊 Live KLV: {stats}")
+        mlflow.log_metrics({f"live_klv_{k}": v for k, v in stats.items() if v is not None})
+        mlflow.log_artifact(metadata_output, artifact_path="decoded_klv")
+
+
+@step(enable_cache=False,experiment_tracker="mlflow_experiment_tracker")
+def multi_stream_detection(
+    sources: list[str],
+    confidence_threshold: float,
+    batch_size: int = 8,
+    max_batch_delay_ms: float = 50.0,
+    duration_s: float = None,
+    tracks_dir: str = None,
+    loop: bool = False,
+    backend: str = "eager",
+) -> None:
+    """
+    Track several RTSP feeds with one shared RF-DETR model.
+
+    sources are "url", "name=url" or "name=url@fps" (per-stream frame-rate
+    target). With tracks_dir set each stream writes <name>.ndjson track
+    records. With loop=True sources are local files replayed in a loop.
+    Per-stream fps, lag and drops are logged to MLflow.
+    """
+    if tracks_dir:
+        Path(tracks_dir).mkdir(parents=True, exist_ok=True)
+
+    streams = []
+    for i, spec in enumerate(sources):
+        name, url, target_fps = parse_source(spec, i)
+        tracks_path = str(Path(tracks_dir) / f"{name}.ndjson") if tracks_dir else None
+        streams.append(StreamState(name, url, target_fps, loop=loop, tracks_path=tracks_path))
+
+    tracker = MultiStreamTracker(
+        streams,
+        confidence_threshold=confidence_threshold,
+        batch_size=batch_size,
+        max_batch_delay_ms=max_batch_delay_ms,
+        backend=backend,
     )
     tracker.load_model()
-    tracker.setup_stream()
-    tracker.setup_tracking()
-    tracker.run()
\ No newline at end of file
+    tracker.open()
+    stats = tracker.run(duration_s=duration_s)
+
+    for name, s in stats.items():
+        for metric, value in s.items():
+            if value is not None:
+                mlflow.log_metric(f"{name}_{metric}", value)
@@ -0,0 +1,372 @@
+# synthetic.py
+# Deterministic synthetic MISB inputs for benchmarks and local testing:
+# ST 0601 (optionally with embedded ST 0903 VMTI) and standalone ST 0903
+# KLV packets, and MPEG-TS files carrying them, optionally muxed with an
+# ffmpeg test-pattern video.
+import shutil
+import struct
+import subprocess
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from fast_decode import ST0601_KEY, ST0601_NUMERIC, ST0903_KEY
+from klv import ber_length, crc16_ccitt, st0601_checksum
+from ts_demux import (
+    PAT_PID,
+    REGISTRATION_DESCRIPTOR,
+    KLVA,
+    STREAM_TYPE_METADATA_PES,
+    STREAM_TYPE_PRIVATE_DATA,
+    TS_PACKET_SIZE,
+    parse_pat,
+    parse_pts,
+)
+
+UAS = "uas"
+VMTI = "vmti"
+UAS_VMTI = "uas+vmti"
+KINDS = (UAS, VMTI, UAS_VMTI)
+
+BASE_TIMESTAMP_US = 1_700_000_000_000_000
+PTS_CLOCK = 90000
+PMT_PID = 0x1000
+KLV_PID = 0x1F0
+PSI_INTERVAL = 100
+
+
+# ---------------- KLV encoding ----------------
+def ber_oid(n):
+    out = [n & 0x7F]
+    n >>= 7
+    while n:
+        out.append(0x80 | (n & 0x7F))
+        n >>= 7
+    return bytes(reversed(out))
+
+
+def uint_bytes(v):
+    return int(v).to_bytes(max(1, (int(v).bit_length() + 7) // 8), "big")
+
+
+def tlv(tag, value):
+    return ber_oid(tag) + ber_length(len(value)) + value
+
+
+def st0601_value(tag, value):
+    """Encode an engineering value with the ST0601_NUMERIC tag mapping."""
+    _, dtype, scale, offset, _ = ST0601_NUMERIC[tag]
+    return np.array([round((value - offset) / scale)], dtype=dtype).tobytes()
+
+
+def _crc_table(width, poly):
+    top = 1 << (width - 1)
+    mask = (1 << width) - 1
+    table = []
+    for byte in range(256):
+        crc = byte << (width - 8)
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) if crc & top else crc << 1
+        table.append(crc & mask)
+    return table
+
+
+CRC32_TABLE = _crc_table(32, 0x04C11DB7)
+
+
+# ---------------- Packet generators ----------------
+def vtarget_series(rng, targets, width, height):
+    out = b""
+    for target_id in range(1, targets + 1):
+        x1 = int(rng.integers(0, width - 64))
+        y1 = int(rng.integers(0, height - 64))
+        x2 = x1 + int(rng.integers(8, 64))
+        y2 = y1 + int(rng.integers(8, 64))
+        cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+
+        body = ber_oid(target_id)
+        body += tlv(1, uint_bytes(cy * width + cx + 1))
+        body += tlv(2, uint_bytes(y1 * width + x1 + 1))
+        body += tlv(3, uint_bytes(y2 * width + x2 + 1))
+        body += tlv(5, uint_bytes(int(rng.integers(50, 100))))
+        out += ber_length(len(body)) + body
+    return out
+
+
+def algorithm_series():
+    algorithm = tlv(1, uint_bytes(1)) + tlv(2, b"kalman") + tlv(3, b"2.1")
+    algorithm += tlv(4, b"kalmanFilter") + tlv(5, uint_bytes(10))
+    return ber_length(len(algorithm)) + algorithm
+
+
+def ontology_series():
+    ontology = tlv(1, uint_bytes(1)) + tlv(3, b"https://example.org/ontology#Vehicle")
+    ontology += tlv(4, b"Vehicle")
+    return ber_length(len(ontology)) + ontology
+
+
+def vmti_local_set(index, rng, targets, width, height, extra_tags=False):
+    """
+    ST 0903 items (no key / checksum): used standalone and nested. With
+    extra_tags the algorithm and ontology series FastKlvDecoder leaves to
+    jMISB are added.
+    """
+    items = tlv(2, struct.pack(">Q", BASE_TIMESTAMP_US + index * 33_367))
+    items += tlv(4, uint_bytes(5))
+    items += tlv(5, uint_bytes(targets))
+    items += tlv(6, uint_bytes(targets))
+    items += tlv(7, uint_bytes(index + 1))
+    items += tlv(8, uint_bytes(width))
+    items += tlv(9, uint_bytes(height))
+    if targets:
+        items += tlv(101, vtarget_series(rng, targets, width, height))
+    if extra_tags:
+        items += tlv(102, algorithm_series()) + tlv(103, ontology_series())
+    return items
+
+
+def vmti_packet(index, rng, targets, width, height, extra_tags=False):
+    body = vmti_local_set(index, rng, targets, width, height, extra_tags) + b"\x01\x02"
+    packet = ST0903_KEY + ber_length(len(body) + 2) + body
+    return packet + struct.pack(">H", crc16_ccitt(packet))
+
+
+def security_local_set():
+    """ST 0102: unclassified, version 12."""
+    return tlv(1, b"\x01") + tlv(2, b"\x0e") + tlv(3, b"//US") + tlv(22, b"\x00\x0c")
+
+
+def miis_core_id(rng):
+    """ST 1204: version 1, physical sensor + platform UUIDs."""
+    return b"\x01\x50" + rng.bytes(16) + rng.bytes(16)
+
+
+def uas_packet(index, rng, vmti=None, extra_tags=False):
+    """
+    ST 0601 packet on a slow straight flight path. extra_tags adds tags
+    FastKlvDecoder leaves to jMISB (generic flags, security set, event
+    start time, MIIS core identifier).
+    """
+    t = index / 30
+    items = tlv(2, struct.pack(">Q", BASE_TIMESTAMP_US + index * 33_367))
+    items += tlv(65, bytes([17]))
+    items += tlv(5, st0601_value(5, (90 + t) % 360))
+    items += tlv(6, st0601_value(6, float(rng.normal(0, 2))))
+    items += tlv(7, st0601_value(7, float(rng.normal(0, 5))))
+    items += tlv(13, st0601_value(13, 45.0 + t * 1e-4))
+    items += tlv(14, st0601_value(14, -75.0 + t * 1e-4))
+    items += tlv(15, st0601_value(15, 1500 + float(rng.normal(0, 1))))
+    items += tlv(16, st0601_value(16, 10.0))
+    items += tlv(17, st0601_value(17, 5.6))
+    items += tlv(23, st0601_value(23, 45.01 + t * 1e-4))
+    items += tlv(24, st0601_value(24, -74.99 + t * 1e-4))
+    items += tlv(25, st0601_value(25, 120.0))
+    if vmti is not None:
+        items += tlv(74, vmti)
+    if extra_tags:
+        items += tlv(47, b"\x01") + tlv(48, security_local_set())
+        items += tlv(72, struct.pack(">Q", BASE_TIMESTAMP_US))
+        items += tlv(94, miis_core_id(rng))
+
+    body = items + b"\x01\x02"
+    packet = ST0601_KEY + ber_length(len(body) + 2) + body
+    return packet + struct.pack(">H", st0601_checksum(packet))
+
+
+def generate_packets(count, kind=UAS_VMTI, targets=4, width=1280, height=720, seed=0,
+                     extra_tags=False):
+    """
+    Yield `count` KLV packets. kind is "uas" (ST 0601 only), "vmti"
+    (standalone ST 0903) or "uas+vmti" (ST 0601 with embedded VMTI).
+    extra_tags adds tags the native decoder hands to jMISB. The same
+    arguments always give the same bytes.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"❌ Unknown packet kind: {kind} (choose from {', '.join(KINDS)})")
+
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        if kind == VMTI:
+            yield vmti_packet(i, rng, targets, width, height, extra_tags)
+        elif kind == UAS:
+            yield uas_packet(i, rng, extra_tags=extra_tags)
+        else:
+            vmti = vmti_local_set(i, rng, targets, width, height, extra_tags)
+            yield uas_packet(i, rng, vmti, extra_tags)
+
+
+def write_klv(klv_path, count, **kwargs):
+    """Write generate_packets() to a .klv file. Returns the byte size."""
+    size = 0
+    with open(klv_path, "wb") as f:
+        for packet in generate_packets(count, **kwargs):
+            f.write(packet)
+            size += len(packet)
+    return size
+
+
+# ---------------- MPEG-TS muxing ----------------
+def crc32_mpeg(data):
+    crc = 0xFFFFFFFF
+    for b in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ CRC32_TABLE[(crc >> 24) ^ b]
+    return crc
+
+
+class _PidWriter:
+    """Splits payloads into 188-byte TS packets with a running CC."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.cc = 0
+
+    def packets(self, payload):
+        out = []
+        first = True
+        while first or payload:
+            chunk, payload = payload[:184], payload[184:]
+            header = bytes([0x47, (0x40 if first else 0) | (self.pid >> 8), self.pid & 0xFF])
+            if len(chunk) < 184:
+                stuffing = 184 - len(chunk)
+                adaptation = bytes([0]) if stuffing == 1 else bytes([stuffing - 1, 0]) + b"\xff" * (stuffing - 2)
+                out.append(header + bytes([0x30 | self.cc]) + adaptation + chunk)
+            else:
+                out.append(header + bytes([0x10 | self.cc]) + chunk)
+            self.cc = (self.cc + 1) & 0x0F
+            first = False
+        return out
+
+
+def _psi(table_id, body):
+    section = bytes([table_id, 0xB0 | ((len(body) + 4) >> 8), (len(body) + 4) & 0xFF]) + body
+    return b"\x00" + section + struct.pack(">I", crc32_mpeg(section))
+
+
+def _klv_es_info(sync):
+    if sync:
+        return bytes([STREAM_TYPE_METADATA_PES, 0xE0 | (KLV_PID >> 8), KLV_PID & 0xFF, 0xF0, 0])
+    descriptor = bytes([REGISTRATION_DESCRIPTOR, 4]) + KLVA
+    return bytes([
+        STREAM_TYPE_PRIVATE_DATA, 0xE0 | (KLV_PID >> 8), KLV_PID & 0xFF, 0xF0, len(descriptor)
+    ]) + descriptor
+
+
+def _pes(klv, pts, sync):
+    if sync:
+        # One metadata AU cell: service id, sequence, flags, 16-bit length
+        klv = bytes([0, 0, 0xDF]) + struct.pack(">H", len(klv)) + klv
+    stream_id = 0xFC if sync else 0xBD
+    pts_bytes = bytes([
+        0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF,
+        0x01 | ((pts >> 14) & 0xFE), (pts >> 7) & 0xFF,
+        0x01 | ((pts << 1) & 0xFE),
+    ])
+    header = bytes([0x80, 0x80, 5]) + pts_bytes
+    return b"\x00\x00\x01" + bytes([stream_id]) + struct.pack(">H", len(header) + len(klv)) + header + klv
+
+
+def _klv_only_ts(packets, fps, sync):
+    pat = _PidWriter(PAT_PID)
+    pmt = _PidWriter(PMT_PID)
+    klv = _PidWriter(KLV_PID)
+
+    pat_section = _psi(0x00, b"\x00\x01\xc1\x00\x00" + struct.pack(">HH", 1, 0xE000 | PMT_PID))
+    pmt_section = _psi(
+        0x02,
+        b"\x00\x01\xc1\x00\x00" + bytes([0xE0 | (KLV_PID >> 8), KLV_PID & 0xFF, 0xF0, 0])
+        + _klv_es_info(sync),
+    )
+
+    out = []
+    for i, packet in enumerate(packets):
+        if i % PSI_INTERVAL == 0:
+            out += pat.packets(pat_section) + pmt.packets(pmt_section)
+        out += klv.packets(_pes(packet, PTS_CLOCK + i * PTS_CLOCK // fps, sync))
+    return out
+
+
+def _video_ts(path, frames, fps, width, height):
+    cmd = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}",
+        "-frames:v", str(frames),
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", str(fps),
+        "-f", "mpegts", str(path),
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def _mux_klv(video, packets, fps, sync):
+    """Add a KLV stream to an ffmpeg-written TS: rewrite the PMT, interleave PES."""
+    ts = [video[i:i + TS_PACKET_SIZE] for i in range(0, len(video), TS_PACKET_SIZE)]
+
+    pmt_pid = first_pts = None
+    for pkt in ts:
+        pid = ((pkt[1] & 0x1F) << 8) | pkt[2]
+        pusi = bool(pkt[1] & 0x40)
+        if pid == PAT_PID and pmt_pid is None:
+            pmt_pid = parse_pat(pkt[4:], pusi)[0]
+        elif pusi and pid not in (PAT_PID, pmt_pid) and pkt[3] & 0x10 and first_pts is None:
+            start = 4 + (1 + pkt[4] if pkt[3] & 0x20 else 0)
+            pes = pkt[start:]
+            if pes[:3] == b"\x00\x00\x01" and pes[7] & 0x80:
+                first_pts = parse_pts(pes[9:14])
+
+    writer = _PidWriter(KLV_PID)
+    per_frame = {}
+    for i, packet in enumerate(packets):
+        per_frame[i] = writer.packets(_pes(packet, (first_pts or 0) + i * PTS_CLOCK // fps, sync))
+
+    count = len(per_frame)
+    out = []
+    next_klv = 0
+    for n, pkt in enumerate(ts):
+        pid = ((pkt[1] & 0x1F) << 8) | pkt[2]
+        if pid == pmt_pid and pkt[1] & 0x40:
+            pkt = _extend_pmt(pkt, sync)
+        out.append(pkt)
+        # Spread the KLV packets evenly over the video packets
+        while next_klv < count and next_klv * len(ts) <= n * count:
+            out += per_frame.pop(next_klv)
+            next_klv += 1
+    for i in range(next_klv, count):
+        out += per_frame.pop(i)
+    return out
+
+
+def _extend_pmt(pkt, sync):
+    pointer = pkt[4]
+    start = 5 + pointer
+    section_length = ((pkt[start + 1] & 0x0F) << 8) | pkt[start + 2]
+    section = pkt[start:start + 3 + section_length - 4]
+
+    body = section[3:] + _klv_es_info(sync)
+    new = _psi(section[0], body)[1:]
+    payload = bytes([0]) + new
+    return pkt[:4] + payload + b"\xff" * (184 - len(payload))
+
+
+def write_ts(ts_path, count, fps=30, sync=False, video=False, width=1280, height=720, **kwargs):
+    """
+    Write `count` synthetic KLV packets (one per video frame) into an
+    MPEG-TS file. With video=True the KLV is muxed with an ffmpeg
+    test-pattern H.264 stream; otherwise the TS carries only KLV.
+    Returns the byte size.
+    """
+    packets = list(generate_packets(count, width=width, height=height, **kwargs))
+
+    if video:
+        if shutil.which("ffmpeg") is None:
+            raise RuntimeError("❌ ffmpeg is required for video=True")
+        with tempfile.TemporaryDirectory() as tmp:
+            video_path = Path(tmp) / "video.ts"
+            _video_ts(video_path, count, fps, width, height)
+            ts = _mux_klv(video_path.read_bytes(), packets, fps, sync)
+    else:
+        ts = _klv_only_ts(packets, fps, sync)
+
+    data = b"".join(ts)
+    with open(ts_path, "wb") as f:
+        f.write(data)
+    return len(data)
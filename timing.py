@@ -0,0 +1,135 @@
+# timing.py
+# Per-stage latency histograms and throughput counters, cheap enough to
+# leave on in production. Each duration lands in a fixed log-spaced bucket
+# (10 per decade, 1 µs .. 100 s), so recording is O(1), memory never grows
+# with run length, and p50/p95/p99 are exact to within one bucket.
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS_PER_DECADE = 10
+MIN_EXPONENT = -6
+NUM_BUCKETS = 8 * BUCKETS_PER_DECADE
+PERCENTILES = (50, 95, 99)
+
+
+class StageStats:
+    """Bucketed latency histogram plus count / busy time / items for one stage."""
+
+    __slots__ = ("buckets", "count", "total_s", "items")
+
+    def __init__(self):
+        self.buckets = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total_s = 0.0
+        self.items = 0
+
+    def record(self, seconds, items=1):
+        if seconds > 0:
+            b = int((math.log10(seconds) - MIN_EXPONENT) * BUCKETS_PER_DECADE)
+            b = min(max(b, 0), NUM_BUCKETS - 1)
+        else:
+            b = 0
+        self.buckets[b] += 1
+        self.count += 1
+        self.total_s += seconds
+        self.items += items
+
+    def percentile(self, q):
+        """Geometric centre of the bucket holding the q-th percentile, in seconds."""
+        if not self.count:
+            return None
+        target = q / 100 * self.count
+        seen = 0
+        for b, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return 10 ** (MIN_EXPONENT + (b + 0.5) / BUCKETS_PER_DECADE)
+        return None
+
+
+class StageTimings:
+    """
+    Named stages timed with `with timings.stage(name):` or record().
+
+    log() sends <stage>_p50_ms / _p95_ms / _p99_ms / _count / _per_s to the
+    active MLflow run; maybe_log() does so at most every log_interval_s, so
+    long runs report while they are still going.
+    """
+
+    def __init__(self, log_interval_s=30.0, enabled=True):
+        self.log_interval_s = log_interval_s
+        self.enabled = enabled
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._next_log = self._started + log_interval_s
+        self._log_step = 0
+
+    # ---------------- Recording ----------------
+    def record(self, name, seconds, items=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = StageStats()
+            stats.record(seconds, items)
+
+    @contextmanager
+    def stage(self, name, items=1):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0, items)
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._started = time.perf_counter()
+            self._next_log = self._started + self.log_interval_s
+
+    # ---------------- Reporting ----------------
+    def summary(self):
+        elapsed = max(time.perf_counter() - self._started, 1e-9)
+        with self._lock:
+            stages = list(self._stages.items())
+
+        metrics = {}
+        for name, stats in stages:
+            for q in PERCENTILES:
+                metrics[f"{name}_p{q}_ms"] = stats.percentile(q) * 1000
+            metrics[f"{name}_count"] = stats.count
+            metrics[f"{name}_total_s"] = stats.total_s
+            metrics[f"{name}_per_s"] = stats.items / elapsed
+        return metrics
+
+    def log(self):
+        """Log the summary to the active MLflow run (no-op without one)."""
+        # Imported here so decoder worker processes do not pay for mlflow
+        import mlflow
+
+        if not self.enabled or mlflow.active_run() is None:
+            return
+        metrics = self.summary()
+        if metrics:
+            mlflow.log_metrics(metrics, step=self._log_step)
+            self._log_step += 1
+
+    def maybe_log(self):
+        now = time.perf_counter()
+        if now < self._next_log:
+            return
+        self._next_log = now + self.log_interval_s
+        self.log()
+
+
+# Process-wide instance used by the decoders, steps and ObjectTracker.
+# KLV_TIMINGS=0 turns recording off.
+timings = StageTimings(
+    log_interval_s=float(os.environ.get("KLV_TIMINGS_INTERVAL_S", 30)),
+    enabled=os.environ.get("KLV_TIMINGS", "1") != "0",
+)
@@ -0,0 +1,205 @@
+# track_output.py
+# Structured per-frame track records (NDJSON or Parquet) for headless
+# tracking, and an offline tool that renders an annotated video from them.
+import argparse
+import json
+from itertools import groupby
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import supervision as sv
+
+PARQUET_ROW_GROUP = 65536
+
+RECORD_FIELDS = (
+    "frame_index",
+    "timestamp",
+    "tracker_id",
+    "class_id",
+    "class_name",
+    "confidence",
+    "x1", "y1", "x2", "y2",
+)
+GEO_FIELDS = ("lat", "lon")
+# Per-recording constants, repeated on every record so each file stands alone
+VIDEO_FIELDS = ("frame_width", "frame_height", "video_start_pts")
+
+
+_FIELD_TYPES = {
+    "lat": pa.float64(),
+    "lon": pa.float64(),
+    "frame_width": pa.int64(),
+    "frame_height": pa.int64(),
+    "video_start_pts": pa.int64(),
+}
+
+
+class TrackRecordWriter:
+    """
+    Streams one record per tracked detection. The format follows the file
+    extension: .parquet (buffered into row groups) or NDJSON otherwise.
+    With geolocated=True each record also carries the box centre "lat" /
+    "lon" from tracked.data (null where no metadata covered the frame).
+    With frame_size (w, h) set, records carry the video frame size and the
+    video start PTS (90 kHz, null when unknown), which evaluate.py needs
+    to scale and time-align the VMTI reference.
+    """
+
+    def __init__(self, path, geolocated=False, frame_size=None, video_start_pts=None):
+        self.path = Path(path)
+        self.parquet = self.path.suffix == ".parquet"
+        self.fields = (
+            RECORD_FIELDS
+            + (GEO_FIELDS if geolocated else ())
+            + (VIDEO_FIELDS if frame_size else ())
+        )
+        self._video = (
+            dict(zip(VIDEO_FIELDS, (*frame_size, video_start_pts))) if frame_size else {}
+        )
+        self._rows = {name: [] for name in self.fields}
+        self._writer = None
+        self._file = None if self.parquet else open(self.path, "w")
+
+    def write(self, frame_index, timestamp, tracked):
+        n = len(tracked)
+        if not n:
+            return
+
+        class_names = tracked.data.get("class_name", [None] * n)
+        tracker_ids = tracked.tracker_id if tracked.tracker_id is not None else [None] * n
+        xyxy = np.asarray(tracked.xyxy, dtype=float).tolist()
+        confidence = np.asarray(tracked.confidence, dtype=float).tolist()
+        class_id = np.asarray(tracked.class_id).tolist()
+        if GEO_FIELDS[0] in self.fields:
+            lat = np.asarray(tracked.data.get("lat", np.full(n, np.nan)), dtype=float)
+            lon = np.asarray(tracked.data.get("lon", np.full(n, np.nan)), dtype=float)
+            # NaN -> null, so NDJSON stays valid JSON
+            geo = [[None if np.isnan(v) else v for v in col.tolist()] for col in (lat, lon)]
+        else:
+            geo = None
+
+        for i in range(n):
+            tid = tracker_ids[i]
+            record = {
+                "frame_index": int(frame_index),
+                "timestamp": float(timestamp),
+                "tracker_id": None if tid is None else int(tid),
+                "class_id": class_id[i],
+                "class_name": None if class_names[i] is None else str(class_names[i]),
+                "confidence": confidence[i],
+            }
+            if geo is not None:
+                record["lat"], record["lon"] = geo[0][i], geo[1][i]
+            record.update(self._video)
+            x1, y1, x2, y2 = xyxy[i]
+
+            if self.parquet:
+                for name, value in record.items():
+                    self._rows[name].append(value)
+                for name, value in zip(("x1", "y1", "x2", "y2"), (x1, y1, x2, y2)):
+                    self._rows[name].append(value)
+            else:
+                record["xyxy"] = [x1, y1, x2, y2]
+                self._file.write(json.dumps(record))
+                self._file.write("\n")
+
+        if self.parquet and len(self._rows["frame_index"]) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows["frame_index"]:
+            return
+        # Typed explicitly: a row group whose lat / lon (or video start) are
+        # all null must still match the schema of the first one
+        table = pa.table({
+            name: pa.array(values, type=_FIELD_TYPES[name]) if name in _FIELD_TYPES else values
+            for name, values in self._rows.items()
+        })
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(str(self.path), table.schema, compression="zstd")
+        else:
+            table = table.cast(self._writer.schema)
+        self._writer.write_table(table)
+        self._rows = {name: [] for name in self.fields}
+
+    def close(self):
+        if self.parquet:
+            self._flush()
+            if self._writer is not None:
+                self._writer.close()
+        else:
+            self._file.close()
+
+
+def read_track_records(path):
+    """Yield (frame_index, [record, ...]) in frame order."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        records = pq.read_table(path).to_pylist()
+        for r in records:
+            r["xyxy"] = [r.pop("x1"), r.pop("y1"), r.pop("x2"), r.pop("y2")]
+    else:
+        with open(path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+
+    for frame_index, group in groupby(records, key=lambda r: r["frame_index"]):
+        yield frame_index, list(group)
+
+
+def render_tracks(video_path, tracks_path, output_path):
+    """Draw recorded tracks onto the source video after the fact."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"❌ Could not open {video_path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+
+    box_annotator = sv.BoxAnnotator(color=sv.ColorPalette.ROBOFLOW, thickness=2)
+    label_annotator = sv.LabelAnnotator(text_scale=0.6)
+
+    frames = read_track_records(tracks_path)
+    pending = next(frames, None)
+    index = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        if pending is not None and pending[0] == index:
+            records = pending[1]
+            tracked = sv.Detections(
+                xyxy=np.array([r["xyxy"] for r in records], dtype=float),
+                confidence=np.array([r["confidence"] for r in records], dtype=float),
+                class_id=np.array([r["class_id"] for r in records], dtype=int),
+                tracker_id=np.array([-1 if r["tracker_id"] is None else r["tracker_id"] for r in records], dtype=int),
+            )
+            labels = [
+                f"ID {r['tracker_id']} | {r['class_name']} {r['confidence']:.2f}"
+                for r in records
+            ]
+            frame = box_annotator.annotate(frame, tracked)
+            frame = label_annotator.annotate(frame, tracked, labels)
+            pending = next(frames, None)
+
+        writer.write(frame)
+        index += 1
+
+    cap.release()
+    writer.release()
+    print(f"🎉 Rendered {index} frames to {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render recorded tracks onto a video")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--tracks", required=True)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    render_tracks(args.video, args.tracks, args.output)
@@ -0,0 +1,390 @@
+# ts_demux.py
+# In-process MPEG-TS demuxer for KLV metadata streams.
+# Replaces the ffmpeg "-map 0:d -f data" pass and keeps each PES PTS.
+import mmap
+
+import numpy as np
+
+from klv import scan_klv_frames
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+PAT_PID = 0x0000
+
+STREAM_TYPE_PRIVATE_DATA = 0x06     # async KLV (with "KLVA" registration)
+STREAM_TYPE_METADATA_PES = 0x15     # sync KLV (ISO 13818-1 metadata AU cells)
+REGISTRATION_DESCRIPTOR = 0x05
+KLVA = b"KLVA"
+
+# MPEG-1/2, MPEG-4 Part 2, H.264, HEVC, VVC
+VIDEO_STREAM_TYPES = frozenset((0x01, 0x02, 0x10, 0x1B, 0x24, 0x33))
+PTS_WRAP = 1 << 33
+
+METADATA_AU_CELL_HEADER = 5
+BLOCK_PACKETS = 1 << 16
+
+
+# ---------------- PSI ----------------
+def _section(payload, pusi):
+    if pusi:
+        payload = payload[1 + payload[0]:]
+    section_length = ((payload[1] & 0x0F) << 8) | payload[2]
+    return payload[:3 + section_length]
+
+
+def parse_pat(payload, pusi):
+    """Return the PMT PIDs listed in a PAT section."""
+    section = _section(payload, pusi)
+    pids = []
+    # 8 byte header, 4 byte CRC
+    for pos in range(8, len(section) - 4, 4):
+        program = (section[pos] << 8) | section[pos + 1]
+        pid = ((section[pos + 2] & 0x1F) << 8) | section[pos + 3]
+        if program != 0:
+            pids.append(pid)
+    return pids
+
+
+def _pmt_streams(payload, pusi):
+    """Yield (pid, stream_type, descriptors) for each stream of a PMT section."""
+    section = _section(payload, pusi)
+    program_info_length = ((section[10] & 0x0F) << 8) | section[11]
+    pos = 12 + program_info_length
+    end = len(section) - 4
+
+    while pos + 5 <= end:
+        stream_type = section[pos]
+        pid = ((section[pos + 1] & 0x1F) << 8) | section[pos + 2]
+        es_info_length = ((section[pos + 3] & 0x0F) << 8) | section[pos + 4]
+        yield pid, stream_type, section[pos + 5:pos + 5 + es_info_length]
+        pos += 5 + es_info_length
+
+
+def parse_pmt(payload, pusi):
+    """Return {pid: stream_type} for the KLV streams listed in a PMT section."""
+    streams = {}
+    for pid, stream_type, descriptors in _pmt_streams(payload, pusi):
+        if stream_type == STREAM_TYPE_METADATA_PES:
+            streams[pid] = stream_type
+        elif stream_type == STREAM_TYPE_PRIVATE_DATA and _has_klva(descriptors):
+            streams[pid] = stream_type
+    return streams
+
+
+def parse_pmt_video(payload, pusi):
+    """Return {pid: stream_type} for the video streams listed in a PMT section."""
+    return {
+        pid: stream_type
+        for pid, stream_type, _ in _pmt_streams(payload, pusi)
+        if stream_type in VIDEO_STREAM_TYPES
+    }
+
+
+def _has_klva(descriptors):
+    pos = 0
+    while pos + 2 <= len(descriptors):
+        tag, length = descriptors[pos], descriptors[pos + 1]
+        if tag == REGISTRATION_DESCRIPTOR and descriptors[pos + 2:pos + 6] == KLVA:
+            return True
+        pos += 2 + length
+    return False
+
+
+# ---------------- PES ----------------
+def parse_pts(b):
+    return (
+        ((b[0] >> 1) & 0x07) << 30
+        | b[1] << 22
+        | (b[2] >> 1) << 15
+        | b[3] << 7
+        | b[4] >> 1
+    )
+
+
+def parse_pes(pes, stream_type):
+    """Return (pts or None, payload bytes) of a complete PES packet."""
+    if len(pes) < 9 or pes[0:3] != b"\x00\x00\x01":
+        return None, b""
+
+    pts = parse_pts(pes[9:14]) if pes[7] & 0x80 else None
+    payload = bytes(pes[9 + pes[8]:])
+
+    if stream_type == STREAM_TYPE_METADATA_PES:
+        payload = _strip_au_cells(payload)
+    return pts, payload
+
+
+def packet_pts(pkt):
+    """PTS of the PES that starts in TS packet pkt, or None."""
+    if not pkt[1] & 0x40:
+        return None
+    payload = TsDemuxer._payload(pkt)
+    if payload is None or len(payload) < 14 or payload[0:3] != b"\x00\x00\x01":
+        return None
+    return parse_pts(payload[9:14]) if payload[7] & 0x80 else None
+
+
+def _strip_au_cells(payload):
+    out = bytearray()
+    pos = 0
+    while pos + METADATA_AU_CELL_HEADER <= len(payload):
+        length = (payload[pos + 3] << 8) | payload[pos + 4]
+        start = pos + METADATA_AU_CELL_HEADER
+        out += payload[start:start + length]
+        pos = start + length
+    return bytes(out)
+
+
+class TsDemuxer:
+    """
+    Memory-mapped MPEG-TS demuxer that yields (pts, klv_bytes) per KLV packet.
+
+    PIDs are extracted for whole blocks of TS packets with NumPy, so only
+    PSI and KLV packets are touched in Python. PTS is in 90 kHz ticks, or
+    None when the PES carries no timestamp.
+    """
+
+    def __init__(self, ts_path):
+        self.ts_path = ts_path
+        self._file = None
+        self._mm = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        self._file = open(self.ts_path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ---------------- Packets ----------------
+    def _sync_offset(self):
+        mm = self._mm
+        for offset in range(min(TS_PACKET_SIZE, len(mm))):
+            if all(
+                mm[pos] == TS_SYNC_BYTE
+                for pos in range(offset, min(len(mm), offset + 3 * TS_PACKET_SIZE), TS_PACKET_SIZE)
+            ):
+                return offset
+        raise ValueError(f"❌ No MPEG-TS sync found in {self.ts_path}")
+
+    def _iter_blocks(self):
+        offset = self._sync_offset()
+        count = (len(self._mm) - offset) // TS_PACKET_SIZE
+        data = np.frombuffer(self._mm, dtype=np.uint8, count=count * TS_PACKET_SIZE, offset=offset)
+        packets = data.reshape(count, TS_PACKET_SIZE)
+
+        for start in range(0, count, BLOCK_PACKETS):
+            block = packets[start:start + BLOCK_PACKETS]
+            pids = ((block[:, 1].astype(np.uint16) & 0x1F) << 8) | block[:, 2]
+            valid = block[:, 0] == TS_SYNC_BYTE
+            yield block, pids, valid
+
+        del data, packets
+
+    @staticmethod
+    def _payload(pkt):
+        afc = (pkt[3] >> 4) & 0x03
+        if not afc & 0x01:
+            return None
+        start = 4
+        if afc & 0x02:
+            start += 1 + pkt[4]
+        return pkt[start:]
+
+    # ---------------- Main API ----------------
+    def find_klv_streams(self):
+        """Parse PAT/PMT and return {pid: stream_type} of the KLV streams."""
+        return self._find_streams(parse_pmt)
+
+    def find_video_streams(self):
+        """Parse PAT/PMT and return {pid: stream_type} of the video streams."""
+        return self._find_streams(parse_pmt_video)
+
+    def _find_streams(self, parse):
+        pmt_pids = None
+        streams = {}
+        parsed = set()
+
+        for block, pids, valid in self._iter_blocks():
+            if pmt_pids is None:
+                for row in np.flatnonzero(valid & (pids == PAT_PID)):
+                    pkt = block[row].tobytes()
+                    payload = self._payload(pkt)
+                    if payload is not None and pkt[1] & 0x40:
+                        pmt_pids = set(parse_pat(payload, True))
+                        break
+                if pmt_pids is None:
+                    continue
+
+            wanted = np.array(sorted(pmt_pids - parsed), dtype=np.uint16)
+            for row in np.flatnonzero(valid & np.isin(pids, wanted)):
+                pkt = block[row].tobytes()
+                pid = int(pids[row])
+                payload = self._payload(pkt)
+                if pid in parsed or payload is None or not pkt[1] & 0x40:
+                    continue
+                streams.update(parse(payload, True))
+                parsed.add(pid)
+
+            if parsed == pmt_pids:
+                break
+
+        return streams
+
+    def first_video_pts(self, pes_count=16):
+        """
+        Start PTS (90 kHz) of the video: the earliest of its first pes_count
+        PES, as B-frames put later pictures first in file order. This is the
+        start time ffmpeg (and so OpenCV) counts frames from. None without a
+        timestamped video stream.
+        """
+        video = self.find_video_streams()
+        if not video:
+            return None
+
+        wanted = np.array(sorted(video), dtype=np.uint16)
+        found = []
+        for block, pids, valid in self._iter_blocks():
+            for row in np.flatnonzero(valid & np.isin(pids, wanted)):
+                pts = packet_pts(block[row].tobytes())
+                if pts is not None:
+                    found.append(pts)
+            if len(found) >= pes_count:
+                break
+        if not found:
+            return None
+        # Earliest relative to the first PES, across a 33-bit wrap
+        return min(found[:pes_count], key=lambda pts: (pts - found[0] + PTS_WRAP // 2) % PTS_WRAP)
+
+    def iter_klv(self):
+        klv_streams = self.find_klv_streams()
+        if not klv_streams:
+            return
+
+        wanted = np.array(sorted(klv_streams), dtype=np.uint16)
+        buffers = {}
+
+        for block, pids, valid in self._iter_blocks():
+            for row in np.flatnonzero(valid & np.isin(pids, wanted)):
+                pkt = block[row].tobytes()
+                pid = int(pids[row])
+                pusi = pkt[1] & 0x40
+                payload = self._payload(pkt)
+                if payload is None:
+                    continue
+
+                if pusi:
+                    if buffers.get(pid):
+                        yield from self._emit(buffers[pid], klv_streams[pid])
+                    buffers[pid] = bytearray(payload)
+                elif pid in buffers:
+                    # Continuation before the first PES start is dropped
+                    buffers[pid] += payload
+
+        for pid, buf in buffers.items():
+            if buf:
+                yield from self._emit(buf, klv_streams[pid])
+
+    @staticmethod
+    def _emit(pes, stream_type):
+        pts, payload = parse_pes(pes, stream_type)
+        for offset, size in scan_klv_frames(payload):
+            yield pts, payload[offset:offset + size]
+
+    def extract_klv(self, klv_path):
+        """Write every KLV packet to klv_path. Returns the packet count."""
+        count = 0
+        with open(klv_path, "wb") as out:
+            for _, klv_bytes in self.iter_klv():
+                out.write(klv_bytes)
+                count += 1
+        return count
+
+
+class TsStreamDemuxer:
+    """
+    Incremental demuxer for live MPEG-TS (UDP datagrams, an ffmpeg pipe).
+
+    feed() takes chunks of any size and returns the (pts, klv_bytes)
+    packets completed by them. A PES with a PES_packet_length is emitted
+    as soon as its last byte arrives instead of waiting for the next one.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pmt_pids = None
+        self._streams = {}
+        self._pes = {}
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        out = []
+        pos = 0
+        while len(buf) - pos >= TS_PACKET_SIZE:
+            if buf[pos] != TS_SYNC_BYTE:
+                pos = buf.find(TS_SYNC_BYTE, pos + 1)
+                if pos < 0:
+                    pos = len(buf)
+                continue
+            self._packet(bytes(buf[pos:pos + TS_PACKET_SIZE]), out)
+            pos += TS_PACKET_SIZE
+        del buf[:pos]
+        return out
+
+    def flush(self):
+        """Emit the PES still buffered (end of stream)."""
+        out = []
+        for pid, pes in self._pes.items():
+            if pes:
+                out.extend(TsDemuxer._emit(pes, self._streams[pid]))
+        self._pes = {}
+        return out
+
+    def _packet(self, pkt, out):
+        pid = ((pkt[1] & 0x1F) << 8) | pkt[2]
+        pusi = pkt[1] & 0x40
+        payload = TsDemuxer._payload(pkt)
+        if payload is None:
+            return
+
+        if pid == PAT_PID:
+            if pusi:
+                self._pmt_pids = set(parse_pat(payload, True))
+            return
+        if self._pmt_pids and pid in self._pmt_pids:
+            if pusi:
+                self._streams.update(parse_pmt(payload, True))
+            return
+
+        stream_type = self._streams.get(pid)
+        if stream_type is None:
+            return
+
+        if pusi:
+            if self._pes.get(pid):
+                out.extend(TsDemuxer._emit(self._pes[pid], stream_type))
+            self._pes[pid] = pes = bytearray(payload)
+        elif pid in self._pes:
+            pes = self._pes[pid]
+            pes += payload
+        else:
+            return
+
+        if len(pes) >= 6:
+            length = (pes[4] << 8) | pes[5]
+            if length and len(pes) >= 6 + length:
+                out.extend(TsDemuxer._emit(pes[:6 + length], stream_type))
+                del self._pes[pid]